@@ -0,0 +1,57 @@
+from reflex import constants
+from reflex.state import StateUpdate
+
+
+class Broadcaster:
+    """
+    同じキー（部屋やレースのID）に参加しているクライアント全員に、状態の変数を送る。
+    参加者はSocket.IOのルームに入れておき、変更は一度のemitで全員に送る（メッセージの生成も1回で済む）。
+    """
+
+    # Socket.IOのルーム名の接頭辞
+    PREFIX: str = ""
+    # 参加者に送るSocket.IOの名前空間と、変数を持つ状態の名前
+    namespace = None
+    state_name: str = ""
+
+    def attach(self, namespace, state_name: str):
+        """
+        参加者への送信先を設定する
+
+        Args:
+            namespace: ReflexのSocket.IOの名前空間（app.event_namespace）
+            state_name (str): 送る変数を持つ状態の完全な名前
+        """
+        self.namespace = namespace
+        self.state_name = state_name
+
+    def _socket_room(self, key: str) -> str:
+        return f"{self.PREFIX}:{key}"
+
+    async def subscribe(self, sid: str, key: str):
+        """
+        クライアントを送信先に加える（切断すると自動的に外れる）
+
+        Args:
+            sid (str): Socket.IOのセッションID
+            key (str): 参加するキー
+        """
+        if self.namespace is not None:
+            await self.namespace.enter_room(sid, self._socket_room(key))
+
+    async def unsubscribe(self, sid: str, key: str):
+        if self.namespace is not None:
+            await self.namespace.leave_room(sid, self._socket_room(key))
+
+    async def fanout(self, key: str, delta: dict):
+        """
+        このプロセスに接続している参加者全員に、変更した変数のみを送る
+
+        Args:
+            key (str): 送り先のキー
+            delta (dict): 変数名 -> 値
+        """
+        if self.namespace is None:
+            return
+        update = StateUpdate(delta={self.state_name: delta})
+        await self.namespace.emit(str(constants.SocketEvent.EVENT), update, room=self._socket_room(key))
@@ -0,0 +1,132 @@
+import os
+from typing import Optional
+
+import reflex as rx
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# 同期用のURLのスキームに対応する非同期ドライバ
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+POOL_SIZE = int(os.environ.get("WEB_GAMES_DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.environ.get("WEB_GAMES_DB_MAX_OVERFLOW", "10"))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 64 * 1024 * 1024,
+    "busy_timeout": 5000,
+}
+
+_engine: Optional[AsyncEngine] = None
+_sessionmaker: Optional[async_sessionmaker] = None
+
+
+def get_async_db_url() -> str:
+    """
+    非同期接続に使うURLを取得する。rxconfig.pyのasync_db_urlがなければdb_urlから作る。
+
+    Returns:
+        str: 非同期接続に使うURL
+    """
+    config = rx.config.get_config()
+    if config.async_db_url:
+        return config.async_db_url
+    scheme, _, rest = config.db_url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for key, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {key}={value}")
+    cursor.close()
+
+
+def get_engine() -> AsyncEngine:
+    """
+    接続をプールする非同期エンジンを取得する
+
+    Returns:
+        AsyncEngine: 非同期エンジン
+    """
+    global _engine
+    if _engine is None:
+        url = get_async_db_url()
+        kwargs = {"pool_pre_ping": True}
+        if ":memory:" not in url:
+            # aiosqliteは既定でNullPoolになるため、プールを明示する
+            kwargs.update(poolclass=AsyncAdaptedQueuePool, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW)
+        _engine = create_async_engine(url, **kwargs)
+        if url.startswith("sqlite"):
+            event.listen(_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return _engine
+
+
+def asession() -> AsyncSession:
+    """
+    非同期セッションを取得する
+
+    Example:
+        async with asession() as session:
+            records = (await session.exec(MSRecord.select())).all()
+
+    Returns:
+        AsyncSession: 非同期セッション
+    """
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = async_sessionmaker(get_engine(), class_=AsyncSession, expire_on_commit=False)
+    return _sessionmaker()
+
+
+if __name__ == "__main__":
+    # 同期セッションと非同期セッションで、記録の更新を同時に行ったときのイベントループの遅延を比べる
+    import asyncio
+    import time
+
+    from .minesweaper.pages.record import MSRecord
+
+    NUM_CLIENTS = 200
+
+    async def measure_lag(stop: asyncio.Event) -> float:
+        max_lag = 0.0
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.001)
+        return max_lag
+
+    async def sync_client(i: int):
+        with rx.session() as session:
+            session.add(MSRecord(state="bench", time=i))
+            session.commit()
+            session.exec(MSRecord.select().where(MSRecord.state == "bench").order_by(MSRecord.time.asc())).all()
+
+    async def async_client(i: int):
+        async with asession() as session:
+            session.add(MSRecord(state="bench", time=i))
+            await session.commit()
+            await session.exec(MSRecord.select().where(MSRecord.state == "bench").order_by(MSRecord.time.asc()))
+
+    async def run(client) -> None:
+        stop = asyncio.Event()
+        lag = asyncio.create_task(measure_lag(stop))
+        start = time.perf_counter()
+        await asyncio.gather(*[client(i) for i in range(NUM_CLIENTS)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        print(f"{client.__name__}: {NUM_CLIENTS / elapsed:.0f} ops/s, max event loop lag {await lag * 1000:.1f} ms")
+
+    async def main():
+        await run(sync_client)
+        await run(async_client)
+        async with asession() as session:
+            for record in (await session.exec(MSRecord.select().where(MSRecord.state == "bench"))).all():
+                await session.delete(record)
+            await session.commit()
+
+    asyncio.run(main())
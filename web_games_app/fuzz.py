@@ -0,0 +1,834 @@
+"""
+最適化したエンジンを、最適化前と同じ素直な実装（参照実装）と比べて検証する。
+ランダムなシード・盤面の形・操作の列で両方を動かし、状態が1つでも食い違えば失敗とする。
+また、参照実装に対する速度の比を保存した基準と比べ、しきい値を超えて遅くなっていれば失敗とする。
+速度の比はマシンの性能によらないため、基準は別の環境でも使える。
+
+Example:
+    python -m web_games_app.fuzz --iterations 200
+    python -m web_games_app.fuzz --targets minesweaper --seed 1234 --iterations 1
+    python -m web_games_app.fuzz --update-baseline
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .minesweaper.minesweaper import CubeMineSweaper, LazyMineSweaper, MineSweaper
+from .minesweaper.minesweaper.minesweaper import (
+    FAILED_FLAG_NUM,
+    FLAG_BIT,
+    FLAG_NUM,
+    MINE_BIT,
+    MINE_NUM,
+    NOT_SELECTED_MINE_NUM,
+    NOT_SELECTED_NUM,
+    OPENED_BIT,
+)
+from .minesweaper.minesweaper.replay import CHORD_MOVE, FLAG_MOVE, OPEN_MOVE, apply_move
+from .tictactoe.gomoku import Gomoku, GomokuSelector, PatternBoard
+from .tictactoe.lines import EMPTY, Line, LineBoard, make_lines
+from .tictactoe.tictactoe import CubeTicTacToe, SquareTicTacToe
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "fuzz_baseline.json")
+TARGETS = ["minesweaper", "cube", "lazy", "lines", "patterns", "gomoku", "tictactoe"]
+# 1つの盤面で試す操作の数の上限
+MAX_MOVES = 200
+
+
+class Divergence(Exception):
+    """
+    最適化したエンジンと参照実装の状態が食い違った
+    """
+
+
+def expect(name: str, actual, expected):
+    """
+    最適化したエンジンの値が参照実装と一致するか確認する
+
+    Args:
+        name (str): 比べる値の名前
+        actual: 最適化したエンジンの値
+        expected: 参照実装の値
+    """
+    if isinstance(actual, np.ndarray):
+        expected = np.asarray(expected).reshape(actual.shape)
+        if not np.array_equal(actual, expected):
+            diff = np.argwhere(actual != expected)
+            index = tuple(int(i) for i in diff[0])
+            raise Divergence(
+                f"{name}: {len(diff)} cells differ, first at {index}: {actual[index]} != {expected[index]}"
+            )
+    elif actual != expected:
+        raise Divergence(f"{name}: {actual!r} != {expected!r}")
+
+
+# ** マインスイーパー **
+class ReferenceMineSweaper:
+    """
+    参照用のマインスイーパー。最適化前の実装と同じく、キューを使ってセルを1つずつ開ける。
+    任意の次元の盤面を扱い、盤面はリストで持つ。
+    """
+
+    shape: Tuple[int, ...]
+    num_cells: int
+    num_mines: int
+    num_remain_cells: int
+    num_selected_cells: int
+    is_initialized: bool
+    actual: List[int]
+    showing: List[int]
+    # セルごとの周囲のセル（自身も含む）
+    neighbors: List[List[int]]
+
+    def __init__(self, shape: Sequence[int], num_mines: int) -> None:
+        self.shape = tuple(shape)
+        self.num_cells = int(np.prod(shape))
+        self.num_mines = num_mines
+        self.num_remain_cells = self.num_cells - num_mines
+        self.num_selected_cells = 0
+        self.is_initialized = False
+        self.actual = [0] * self.num_cells
+        self.showing = [NOT_SELECTED_NUM] * self.num_cells
+        self.neighbors = [self._surroundings(n) for n in range(self.num_cells)]
+
+    def _surroundings(self, num: int) -> List[int]:
+        index = []
+        for n in reversed(self.shape):
+            num, i = divmod(num, n)
+            index.append(i)
+        index.reverse()
+        nums = []
+        for offset in itertools.product((-1, 0, 1), repeat=len(self.shape)):
+            neighbor = [i + d for i, d in zip(index, offset)]
+            if all(0 <= i < n for i, n in zip(neighbor, self.shape)):
+                num = 0
+                for i, n in zip(neighbor, self.shape):
+                    num = num * n + i
+                nums.append(num)
+        return nums
+
+    def place_mines(self, mines: Sequence[int]):
+        for m in mines:
+            self.actual[m] = MINE_NUM
+        for n in range(self.num_cells):
+            if self.actual[n] != MINE_NUM:
+                self.actual[n] = sum(self.actual[s] == MINE_NUM for s in self.neighbors[n])
+        self.is_initialized = True
+
+    def initialize(self, num: int, rng: random.Random):
+        # 最初に開けたセルの周囲を除いて、エンジンと同じ順序の候補から地雷を選ぶ
+        excluded = set(self.neighbors[num])
+        candidates = [n for n in range(self.num_cells) if n not in excluded]
+        self.place_mines(rng.sample(candidates, self.num_mines))
+
+    def load_shared(self, seed: int):
+        rng = random.Random(seed)
+        start = rng.randrange(self.num_cells)
+        self.initialize(start, rng)
+        self.open_cell(start)
+
+    def is_selected(self, num: int) -> bool:
+        return self.showing[num] != NOT_SELECTED_NUM and self.showing[num] != FLAG_NUM
+
+    def open_cell(self, num: int) -> bool:
+        assert self.is_initialized
+        if self.actual[num] == MINE_NUM:
+            return False
+        q = deque([num])
+        while len(q) > 0:
+            n = q.pop()
+            if self.is_selected(n) or self.actual[n] == MINE_NUM:
+                continue
+            # 旗が置かれたセルも開ける
+            self.showing[n] = self.actual[n]
+            self.num_selected_cells += 1
+            if self.actual[n] == 0:
+                q.extend(s for s in self.neighbors[n] if not self.is_selected(s))
+        return True
+
+    def chord(self, num: int) -> bool:
+        if not self.is_selected(num) or self.showing[num] == 0:
+            return True
+        surroundings = self.neighbors[num]
+        if sum(self.showing[s] == FLAG_NUM for s in surroundings) != self.showing[num]:
+            return True
+        targets = [s for s in surroundings if self.showing[s] == NOT_SELECTED_NUM]
+        if any(self.actual[s] == MINE_NUM for s in targets):
+            return False
+        for s in targets:
+            self.open_cell(s)
+        return True
+
+    def put_or_unput_flag(self, num: int):
+        if self.showing[num] == FLAG_NUM:
+            self.showing[num] = NOT_SELECTED_NUM
+        elif self.showing[num] == NOT_SELECTED_NUM:
+            self.showing[num] = FLAG_NUM
+
+    def apply(self, action: int, num: int) -> bool:
+        if action == FLAG_MOVE:
+            self.put_or_unput_flag(num)
+            return True
+        if action == CHORD_MOVE or self.is_selected(num):
+            return self.chord(num)
+        return self.open_cell(num)
+
+    def is_all_selected(self) -> bool:
+        return self.num_selected_cells == self.num_remain_cells
+
+    def status(self) -> List[int]:
+        # エンジンのセルの状態と同じビットの組み合わせを、表示用の盤面と実際の盤面から求める
+        return [
+            (OPENED_BIT if self.is_selected(n) else 0)
+            | (FLAG_BIT if self.showing[n] == FLAG_NUM else 0)
+            | (MINE_BIT if self.actual[n] == MINE_NUM else 0)
+            for n in range(self.num_cells)
+        ]
+
+    def compute_bbbv(self) -> int:
+        # 周囲に地雷のないセルの連結成分の数と、それに接していない数字のセルの数の和
+        seen = set()
+        bbbv = 0
+        for n in range(self.num_cells):
+            if self.actual[n] != 0 or n in seen:
+                continue
+            bbbv += 1
+            q = deque([n])
+            seen.add(n)
+            while q:
+                for s in self.neighbors[q.pop()]:
+                    if self.actual[s] == 0 and s not in seen:
+                        seen.add(s)
+                        q.append(s)
+        for n in range(self.num_cells):
+            if self.actual[n] > 0 and all(self.actual[s] != 0 for s in self.neighbors[n]):
+                bbbv += 1
+        return bbbv
+
+
+def random_mines(rng: random.Random, num_cells: int, num_safe: int) -> int:
+    # 多くは初級から上級程度の密度とし、ときどき地雷が詰まった盤面も試す
+    max_mines = max(0, num_cells - num_safe)
+    return rng.randint(0, max_mines) if rng.random() < 0.2 else rng.randint(0, max_mines // 4)
+
+
+def random_move(rng: random.Random, ref: ReferenceMineSweaper, chord: bool) -> Tuple[int, int]:
+    """
+    参照実装の盤面を見て、意味のある操作が多くなるように操作を選ぶ
+
+    Args:
+        rng (random.Random): 乱数生成器
+        ref (ReferenceMineSweaper): 参照実装
+        chord (bool): まとめて開ける操作を含めるか
+
+    Returns:
+        Tuple[int, int]: 操作の種類とセル
+    """
+    r = rng.random()
+    if chord and r < 0.15:
+        numbers = [n for n in range(ref.num_cells) if ref.is_selected(n) and ref.showing[n] > 0]
+        if numbers:
+            return CHORD_MOVE, rng.choice(numbers)
+    if r < 0.35:
+        # 旗は地雷に置くことが多いが、誤った旗や開けたセルへの操作も混ぜる
+        mines = [n for n in range(ref.num_cells) if ref.actual[n] == MINE_NUM]
+        if mines and rng.random() < 0.7:
+            return FLAG_MOVE, rng.choice(mines)
+        return FLAG_MOVE, rng.randrange(ref.num_cells)
+    # 地雷を開けるとゲームが終わるため、地雷はときどきのみ選ぶ
+    closed = [n for n in range(ref.num_cells) if not ref.is_selected(n) and ref.actual[n] != MINE_NUM]
+    if closed and rng.random() < 0.97:
+        return OPEN_MOVE, rng.choice(closed)
+    return OPEN_MOVE, rng.randrange(ref.num_cells)
+
+
+def check_board(game: MineSweaper, ref: ReferenceMineSweaper):
+    expect("showing_board", game.showing_board, ref.showing)
+    expect("num_selected_cells", game.num_selected_cells, ref.num_selected_cells)
+    expect("is_all_selected", game.is_all_selected(), ref.is_all_selected())
+    # 数は操作ごとに更新しているため、参照実装の盤面を数え直したものと比べる
+    expect("status", game.status, ref.status())
+    flags = [n for n in range(ref.num_cells) if ref.showing[n] == FLAG_NUM]
+    expect("num_flags", game.num_flags, len(flags))
+    expect("num_correct_flags", game.num_correct_flags, sum(ref.actual[n] == MINE_NUM for n in flags))
+
+
+def play_against(rng: random.Random, game: MineSweaper, ref: ReferenceMineSweaper) -> int:
+    """
+    同じ操作の列を両方に適用し、操作ごとに状態を比べる。地雷を開けるか全て開けたときに終える。
+
+    Args:
+        rng (random.Random): 乱数生成器
+        game (MineSweaper): 最適化したエンジン
+        ref (ReferenceMineSweaper): 参照実装
+
+    Returns:
+        int: 適用した操作の数
+    """
+    for i in range(MAX_MOVES):
+        action, cell = random_move(rng, ref, chord=True)
+        was_initialized = game.is_initialized
+        try:
+            result = apply_move(game, action, cell)
+            if not was_initialized and game.is_initialized:
+                # 最初に開けたセルと、エンジンが地雷の配置に使ったシードから参照実装の盤面を作る
+                ref.initialize(cell, random.Random(game.mine_seed))
+                expect("actual_board", game.actual_board, ref.actual)
+                expect("bbbv", game.bbbv, ref.compute_bbbv())
+            expect("result", result, ref.apply(action, cell))
+            check_board(game, ref)
+        except Divergence as e:
+            raise Divergence(f"move {i} (action={action}, cell={cell}): {e}") from None
+        if not result or (game.is_initialized and game.is_all_selected()):
+            return i + 1
+    return MAX_MOVES
+
+
+def fuzz_minesweaper(rng: random.Random) -> int:
+    height, width = rng.randint(1, 30), rng.randint(1, 30)
+    num_mines = random_mines(rng, height * width, 9)
+    game = MineSweaper(height, width, num_mines)
+    ref = ReferenceMineSweaper((height, width), num_mines)
+    if rng.random() < 0.2:
+        # デイリーチャレンジと同じく、シードから決まる盤面で始める
+        seed = rng.getrandbits(63)
+        game.load_shared(seed)
+        ref.load_shared(seed)
+        expect("shared actual_board", game.actual_board, ref.actual)
+        check_board(game, ref)
+    return play_against(rng, game, ref)
+
+
+def fuzz_cube(rng: random.Random) -> int:
+    depth, height, width = rng.randint(1, 8), rng.randint(1, 8), rng.randint(1, 8)
+    num_mines = random_mines(rng, depth * height * width, 27)
+    game = CubeMineSweaper(depth, height, width, num_mines)
+    ref = ReferenceMineSweaper((depth, height, width), num_mines)
+    return play_against(rng, game, ref)
+
+
+def fuzz_lazy(rng: random.Random) -> int:
+    # チャンクの境界をまたぐように、チャンクより大きな盤面も試す
+    max_size = 2 * LazyMineSweaper.CHUNK_SIZE + 5
+    height, width = rng.randint(1, max_size), rng.randint(1, max_size)
+    num_mines = random_mines(rng, height * width, 9)
+    game = LazyMineSweaper(height, width, num_mines, seed=rng.getrandbits(63))
+    ref = ReferenceMineSweaper((height, width), num_mines)
+    for i in range(MAX_MOVES):
+        action, cell = random_move(rng, ref, chord=False)
+        try:
+            if action == FLAG_MOVE:
+                game.put_or_unput_flag(cell)
+                ref.put_or_unput_flag(cell)
+                result = expected = True
+            else:
+                was_initialized = game.is_initialized
+                result = game.open_cell(cell)
+                if not was_initialized:
+                    # 遅延生成された地雷を全て生成して参照実装に写し、数と最初のセルの周囲を確かめる
+                    mines = [n for n in range(game.num_cells) if game.get_actual(*game.num2index(n)) == MINE_NUM]
+                    expect("num_mines", len(mines), num_mines)
+                    expect("mines around the first cell", sorted(set(mines) & set(ref.neighbors[cell])), [])
+                    ref.place_mines(mines)
+                    expect(
+                        "actual_board",
+                        np.array([game.get_actual(*game.num2index(n)) for n in range(game.num_cells)]),
+                        ref.actual,
+                    )
+                # LazyMineSweaperはまとめて開ける操作を持たないため、開けたセルを選んでも何もしない
+                expected = ref.open_cell(cell)
+            expect("result", result, expected)
+            expect("showing_board", game.get_view(0, 0, height, width), ref.showing)
+            expect("num_selected_cells", game.num_selected_cells, ref.num_selected_cells)
+            expect("num_flags", game.num_flags, ref.showing.count(FLAG_NUM))
+            expect("is_all_selected", game.is_all_selected(), ref.is_all_selected())
+            if not result:
+                # 失敗したときの表示は、開けていない地雷と誤った旗を参照実装の盤面から求めたものと比べる
+                revealed = [
+                    (
+                        NOT_SELECTED_MINE_NUM
+                        if actual == MINE_NUM and showing == NOT_SELECTED_NUM
+                        else FAILED_FLAG_NUM if actual != MINE_NUM and showing == FLAG_NUM else showing
+                    )
+                    for actual, showing in zip(ref.actual, ref.showing)
+                ]
+                top, left = rng.randrange(height), rng.randrange(width)
+                view = game.reveal_view(top, left, rng.randint(1, height), rng.randint(1, width))
+                revealed = np.array(revealed).reshape(height, width)
+                expect("reveal_view", view, revealed[top : top + view.shape[0], left : left + view.shape[1]])
+        except Divergence as e:
+            raise Divergence(f"move {i} (action={action}, cell={cell}): {e}") from None
+        if not result or (game.is_initialized and game.is_all_selected()):
+            return i + 1
+    return MAX_MOVES
+
+
+# ** 三目並べ・五目並べ **
+class ReferenceLines:
+    """
+    参照用の盤面。石を置くたびに盤面をコピーし、全ての列を調べ直す。
+    """
+
+    lines: List[Line]
+    # 置いた順の盤面（最初は空の盤面）
+    boards: List[List[int]]
+    # 各盤面の時点で列を揃えたプレイヤー
+    winners: List[int]
+
+    def __init__(self, num_cells: int, lines: List[Line]) -> None:
+        self.lines = lines
+        self.boards = [[EMPTY] * num_cells]
+        self.winners = [EMPTY]
+
+    @property
+    def board(self) -> List[int]:
+        return self.boards[-1]
+
+    @property
+    def winner(self) -> int:
+        return self.winners[-1]
+
+    @property
+    def rest(self) -> set:
+        return {cell for cell, state in enumerate(self.board) if state == EMPTY}
+
+    def make(self, cell: int, player: int) -> bool:
+        board = self.board.copy()
+        board[cell] = player
+        is_win = any(cell in line and all(board[c] == player for c in line) for line in self.lines)
+        self.boards.append(board)
+        self.winners.append(player if is_win and self.winner == EMPTY else self.winner)
+        return is_win
+
+    def unmake(self):
+        self.boards.pop()
+        self.winners.pop()
+
+    def counts(self, line: Line, player: int) -> Tuple[int, int]:
+        return sum(self.board[c] == player for c in line), sum(self.board[c] == 1 - player for c in line)
+
+    def threats(self, player: int) -> Dict[int, int]:
+        threats: Dict[int, int] = {}
+        for line in self.lines:
+            own, other = self.counts(line, player)
+            if other == 0 and own == len(line) - 1:
+                cell = next(c for c in line if self.board[c] == EMPTY)
+                threats[cell] = threats.get(cell, 0) + 1
+        return threats
+
+    def line_value(self, line: Line, player: int) -> int:
+        own, other = self.counts(line, player)
+        if other == 0:
+            return 1 << (2 * own + 1)
+        elif own == 0:
+            return 1 << (2 * other)
+        return 0
+
+    def evaluate(self, cell: int, player: int) -> int:
+        return sum(self.line_value(line, player) for line in self.lines if cell in line)
+
+    def scores(self, player: int) -> List[int]:
+        # 全てのセルの評価値を、列ごとの値を列に含まれるセルに足して求める
+        scores = [0] * len(self.board)
+        for line in self.lines:
+            value = self.line_value(line, player)
+            for cell in line:
+                scores[cell] += value
+        return scores
+
+
+def random_lines(rng: random.Random) -> Tuple[int, List[Line]]:
+    # 三目並べの正方形・立方体の盤面と、列より大きな盤面（五目並べと同じ窓）から選ぶ
+    shape: Tuple[int, ...]
+    if rng.random() < 0.5:
+        size = rng.randint(2, 5)
+        shape, length = (size,) * rng.choice((2, 3)), size
+    else:
+        size = rng.randint(3, 9)
+        shape, length = (size, size), rng.randint(2, size)
+    return int(np.prod(shape)), make_lines(shape, length)
+
+
+def check_lines(board: LineBoard, ref: ReferenceLines):
+    expect("board", board.board, ref.board)
+    expect("rest", board.rest, ref.rest)
+    expect("winner", board.winner, ref.winner)
+    for player in (0, 1):
+        expect(f"threats[{player}]", board.threats[player], ref.threats(player))
+
+
+def make_and_unmake(rng: random.Random, board: LineBoard, ref: ReferenceLines, check: Callable[[], None]) -> int:
+    """
+    石を置く・取り除く操作を両方に適用し、操作ごとに状態を比べる。列が揃った後も置き続ける（探索と同じ）。
+
+    Args:
+        rng (random.Random): 乱数生成器
+        board (LineBoard): 最適化した盤面
+        ref (ReferenceLines): 参照実装
+        check (Callable[[], None]): 状態を比べる関数
+
+    Returns:
+        int: 適用した操作の数
+    """
+    for i in range(MAX_MOVES):
+        try:
+            if board.history and (not board.rest or rng.random() < 0.3):
+                board.unmake()
+                ref.unmake()
+            else:
+                cell = rng.choice(sorted(board.rest))
+                # 通常は交互に置き、ときどき同じプレイヤーが続けて置く
+                player = len(board.history) % 2 if rng.random() < 0.9 else rng.randrange(2)
+                expect("is_win", board.make(cell, player), ref.make(cell, player))
+            check()
+        except Divergence as e:
+            raise Divergence(f"operation {i}: {e}") from None
+    return MAX_MOVES
+
+
+def fuzz_lines(rng: random.Random) -> int:
+    num_cells, lines = random_lines(rng)
+    board = LineBoard(num_cells, lines)
+    ref = ReferenceLines(num_cells, lines)
+
+    def check():
+        check_lines(board, ref)
+        if rng.random() < 0.1:
+            # 盤面の読み込みは置いた順序によらず、同じ脅威になる
+            loaded = LineBoard(num_cells, lines)
+            loaded.load(board.board, rng.randrange(2))
+            for player in (0, 1):
+                expect(f"loaded threats[{player}]", loaded.threats[player], ref.threats(player))
+
+    return make_and_unmake(rng, board, ref, check)
+
+
+def fuzz_patterns(rng: random.Random) -> int:
+    num_cells, lines = random_lines(rng)
+    board = PatternBoard(num_cells, lines)
+    ref = ReferenceLines(num_cells, lines)
+
+    def check():
+        check_lines(board, ref)
+        for player in (0, 1):
+            expect(f"scores[{player}]", board.scores[player], ref.scores(player))
+
+    return make_and_unmake(rng, board, ref, check)
+
+
+def fuzz_gomoku(rng: random.Random) -> int:
+    size = rng.randint(3, 19)
+    length = rng.randint(2, min(size, 6))
+    game = Gomoku(size, length)
+    selector = GomokuSelector(size, length, seed=rng.randrange(2**32))
+    lines = make_lines((size, size), length)
+    num_ops = 0
+    # ページと同じく、同じ選択器のままリセットした盤面でも続けて対局する
+    for _ in range(2):
+        game.reset()
+        ref = ReferenceLines(size**2, lines)
+        for turn in range(size**2):
+            # 選択器の手とランダムな手を混ぜる（選択器が空いていないセルを選ぶとずれが出る）
+            num = selector.select(game.board, turn % 2) if rng.random() < 0.5 else rng.choice(sorted(game.rest))
+            num_ops += 1
+            try:
+                expect("empty", num in ref.rest, True)
+                expect("is_win", game.apply_select(turn, num), ref.make(num, turn % 2))
+                expect("board", game.board, ref.board)
+                expect("rest", game.rest, ref.rest)
+                selector.sync(game.board)
+                expect("selector board", selector.patterns.board, ref.board)
+                expect("selector rest", selector.patterns.rest, ref.rest)
+            except Divergence as e:
+                raise Divergence(f"turn {turn} (cell={num}): {e}") from None
+            if ref.winner != EMPTY:
+                break
+    return num_ops
+
+
+def fuzz_tictactoe(rng: random.Random) -> int:
+    # ページが使う三目並べのエンジンに、同じ手の列を参照実装と同じく交互に指し、勝ちと引き分けを比べる
+    size = rng.randint(3, 5)
+    dim = rng.choice((2, 3))
+    game = SquareTicTacToe(size) if dim == 2 else CubeTicTacToe(size)
+    lines = make_lines((size,) * dim, size)
+    num_ops = 0
+    # ページと同じく、リセットした盤面でも続けて対局する
+    for _ in range(2):
+        game.reset()
+        ref = ReferenceLines(size**dim, lines)
+        for turn in range(size**dim):
+            num = rng.choice(sorted(game.rest))
+            num_ops += 1
+            try:
+                is_win = game.apply_select(turn, num)
+                expect("is_win", is_win, ref.make(num, turn % 2))
+                expect("board", list(game.board), ref.board)
+                expect("rest", set(game.rest), ref.rest)
+                expect("is_draw", not is_win and len(game.rest) == 0, ref.winner == EMPTY and not ref.rest)
+            except Divergence as e:
+                raise Divergence(f"{dim}D size {size}, turn {turn} (cell={num}): {e}") from None
+            if is_win:
+                break
+    return num_ops
+
+
+FUZZERS: Dict[str, Callable[[random.Random], int]] = {
+    "minesweaper": fuzz_minesweaper,
+    "cube": fuzz_cube,
+    "lazy": fuzz_lazy,
+    "lines": fuzz_lines,
+    "patterns": fuzz_patterns,
+    "gomoku": fuzz_gomoku,
+    "tictactoe": fuzz_tictactoe,
+}
+
+
+def run_fuzz(target: str, seed: int, iterations: int) -> Tuple[int, Optional[str]]:
+    """
+    対象のエンジンを、シードを1つずつ変えながら検証する
+
+    Args:
+        target (str): 対象のエンジン
+        seed (int): 最初のシード。食い違いはそのシードと--iterations 1で再現できる
+        iterations (int): 試す盤面の数
+
+    Returns:
+        Tuple[int, Optional[str]]: 適用した操作の数と、食い違いの内容（ないときはNone）
+    """
+    total = 0
+    for case in range(seed, seed + iterations):
+        # エンジンが地雷の配置に使うシードもケースごとに固定する
+        random.seed(case)
+        try:
+            total += FUZZERS[target](random.Random(case))
+        except Divergence as e:
+            return total, f"seed {case}: {e}"
+    return total, None
+
+
+# ** 速度 **
+def solve_moves(seed: int, shape: Tuple[int, ...], num_mines: int) -> Tuple[int, List[Tuple[int, int]]]:
+    # 地雷以外の全てのセルをランダムな順に開け、ときどき地雷に旗を置く操作の列
+    rng = random.Random(seed)
+    ref = ReferenceMineSweaper(shape, num_mines)
+    first = rng.randrange(ref.num_cells)
+    ref.initialize(first, random.Random(seed))
+    safe = [n for n in range(ref.num_cells) if ref.actual[n] != MINE_NUM]
+    mines = [n for n in range(ref.num_cells) if ref.actual[n] == MINE_NUM]
+    rng.shuffle(safe)
+    moves = [(OPEN_MOVE, first)]
+    for n in safe:
+        moves.append((OPEN_MOVE, n))
+        if rng.random() < 0.2:
+            moves.append((FLAG_MOVE, rng.choice(mines)))
+    return first, moves
+
+
+def bench_minesweaper(
+    make_game: Callable[[], MineSweaper], shape: Tuple[int, ...], num_mines: int
+) -> Dict[str, float]:
+    workloads = [solve_moves(seed, shape, num_mines) for seed in range(10)]
+
+    def engine():
+        for seed, (first, moves) in enumerate(workloads):
+            game = make_game()
+            game.initialize(first, random.Random(seed))
+            for action, cell in moves:
+                apply_move(game, action, cell)
+
+    def reference():
+        for seed, (first, moves) in enumerate(workloads):
+            ref = ReferenceMineSweaper(shape, num_mines)
+            ref.initialize(first, random.Random(seed))
+            for action, cell in moves:
+                ref.apply(action, cell)
+
+    return compare_speed(engine, reference, sum(len(moves) for _, moves in workloads))
+
+
+def bench_lazy() -> Dict[str, float]:
+    height, width, num_mines = 96, 96, 1800
+    rng = random.Random(0)
+    cells = [rng.randrange(height * width) for _ in range(300)]
+    games = []
+    for seed in range(5):
+        game = LazyMineSweaper(height, width, num_mines, seed=seed)
+        game.open_cell(cells[0])
+        mines = [n for n in range(game.num_cells) if game.get_actual(*game.num2index(n)) == MINE_NUM]
+        games.append((seed, mines))
+
+    def engine():
+        for seed, _ in games:
+            game = LazyMineSweaper(height, width, num_mines, seed=seed)
+            for cell in cells:
+                game.open_cell(cell)
+
+    def reference():
+        for _, mines in games:
+            ref = ReferenceMineSweaper((height, width), num_mines)
+            ref.place_mines(mines)
+            for cell in cells:
+                ref.open_cell(cell)
+
+    return compare_speed(engine, reference, len(games) * len(cells))
+
+
+def bench_lines() -> Dict[str, float]:
+    num_cells, lines = 5**3, make_lines((5, 5, 5), 5)
+    rng = random.Random(0)
+    orders = [rng.sample(range(num_cells), num_cells) for _ in range(20)]
+
+    def engine():
+        board = LineBoard(num_cells, lines)
+        for order in orders:
+            for i, cell in enumerate(order):
+                board.make(cell, i % 2)
+            for _ in order:
+                board.unmake()
+
+    def reference():
+        ref = ReferenceLines(num_cells, lines)
+        for order in orders:
+            for i, cell in enumerate(order):
+                ref.make(cell, i % 2)
+            for _ in order:
+                ref.unmake()
+
+    return compare_speed(engine, reference, 2 * len(orders) * num_cells)
+
+
+def bench_patterns() -> Dict[str, float]:
+    size = 15
+    num_cells, lines = size**2, make_lines((size, size), 5)
+    rng = random.Random(0)
+    moves = rng.sample(range(num_cells), 60)
+    probes = [rng.sample(range(num_cells), 10) for _ in moves]
+
+    def engine():
+        board = PatternBoard(num_cells, lines)
+        for i, (cell, probe) in enumerate(zip(moves, probes)):
+            board.make(cell, i % 2)
+            for c in probe:
+                board.evaluate(c, i % 2)
+
+    def reference():
+        ref = ReferenceLines(num_cells, lines)
+        for i, (cell, probe) in enumerate(zip(moves, probes)):
+            ref.make(cell, i % 2)
+            for c in probe:
+                ref.evaluate(c, i % 2)
+
+    return compare_speed(engine, reference, len(moves) * 11)
+
+
+def bench_gomoku() -> Dict[str, float]:
+    size = 19
+    rng = random.Random(0)
+    orders = [rng.sample(range(size**2), size**2) for _ in range(3)]
+    lines = make_lines((size, size), 5)
+
+    def engine():
+        for order in orders:
+            game = Gomoku(size)
+            for turn, num in enumerate(order):
+                game.apply_select(turn, num)
+
+    def reference():
+        for order in orders:
+            ref = ReferenceLines(size**2, lines)
+            for turn, num in enumerate(order):
+                ref.make(num, turn % 2)
+
+    return compare_speed(engine, reference, len(orders) * size**2)
+
+
+def best_time(func: Callable[[], None], repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare_speed(engine: Callable[[], None], reference: Callable[[], None], num_ops: int) -> Dict[str, float]:
+    engine_time, reference_time = best_time(engine), best_time(reference)
+    return {
+        "ops_per_sec": num_ops / engine_time,
+        "reference_ops_per_sec": num_ops / reference_time,
+        "speedup": reference_time / engine_time,
+    }
+
+
+BENCHMARKS: Dict[str, Callable[[], Dict[str, float]]] = {
+    "minesweaper": lambda: bench_minesweaper(lambda: MineSweaper(20, 24, 99), (20, 24), 99),
+    "cube": lambda: bench_minesweaper(lambda: CubeMineSweaper(8, 8, 8, 60), (8, 8, 8), 60),
+    "lazy": bench_lazy,
+    "lines": bench_lines,
+    "patterns": bench_patterns,
+    "gomoku": bench_gomoku,
+}
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS, help="検証するエンジン")
+    parser.add_argument("--iterations", type=int, default=200, help="エンジンごとに試す盤面の数")
+    parser.add_argument("--seed", type=int, default=0, help="最初の盤面のシード")
+    parser.add_argument("--skip-perf", action="store_true", help="速度を計測しない")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="速度の基準を保存したファイル")
+    parser.add_argument("--threshold", type=float, default=0.25, help="基準から許容する速度の比の低下の割合")
+    parser.add_argument("--update-baseline", action="store_true", help="計測した速度の比を基準として保存する")
+    args = parser.parse_args()
+
+    failed = False
+    for target in args.targets:
+        start = time.perf_counter()
+        num_ops, divergence = run_fuzz(target, args.seed, args.iterations)
+        elapsed = time.perf_counter() - start
+        status = "ok" if divergence is None else f"DIVERGED at {divergence}"
+        print(f"fuzz {target:<12} {args.iterations} boards, {num_ops} operations, {elapsed:.1f} s: {status}")
+        failed |= divergence is not None
+
+    if not args.skip_perf:
+        baseline = load_baseline(args.baseline)
+        speedups = {}
+        # 参照実装との比較のみを行うエンジン（速度の基準を持たない）は計測しない
+        for target in [target for target in args.targets if target in BENCHMARKS]:
+            result = BENCHMARKS[target]()
+            speedups[target] = round(result["speedup"], 2)
+            line = (
+                f"perf {target:<12} {result['ops_per_sec']:>12,.0f} ops/s "
+                f"(reference {result['reference_ops_per_sec']:>10,.0f} ops/s), speedup {result['speedup']:.2f}x"
+            )
+            if target in baseline and not args.update_baseline:
+                limit = baseline[target] * (1 - args.threshold)
+                regressed = result["speedup"] < limit
+                line += f", baseline {baseline[target]:.2f}x: {'REGRESSED' if regressed else 'ok'}"
+                failed |= regressed
+            print(line)
+        if args.update_baseline:
+            baseline.update(speedups)
+            with open(args.baseline, "w") as f:
+                json.dump(baseline, f, indent=2, sort_keys=True)
+                f.write("\n")
+            print(f"saved baseline to {args.baseline}")
+
+    sys.exit(1 if failed else 0)
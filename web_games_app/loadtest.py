@@ -0,0 +1,368 @@
+"""
+ローカルで起動したバックエンドに対して、複数のクライアントを模擬して負荷をかける
+
+Example:
+    reflex run --backend-only
+    python -m web_games_app.loadtest --clients 100 --duration 60 --backend-pid <PID>
+    python -m web_games_app.loadtest --room-spectators 200 --room-moves 100
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+import psutil
+import websockets
+from reflex import constants
+from reflex.state import State
+
+from .minesweaper.pages.minesweaper import MineSweaperState
+from .tictactoe.pages.cube_tictactoe import LAYER_STATES, CubeTicTacToeState
+from .tictactoe.pages.rooms import ROOM_VARS, RoomState
+from .tictactoe.pages.square_tictactoe import SquareTicTacToeState
+from .tictactoe.rooms import PLAYING
+
+NAMESPACE = str(constants.Endpoint.EVENT)
+GAMES = ["minesweaper", "square", "cube"]
+# タイマーが毎秒送る変数。イベントへの応答とは区別する
+TICK_VARS = {"elapsed_time", "display_elapsed_time"}
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.num_events = 0
+        self.num_errors = 0
+        self.num_ticks = 0
+
+    def add(self, name: str, latency: float):
+        self.latencies[name.rsplit(".", 1)[-1]].append(latency)
+        self.num_events += 1
+
+
+class Client:
+    """
+    Socket.IOの最小限のプロトコルで、ブラウザのイベントキューと同様に1つずつイベントを処理するクライアント
+    """
+
+    def __init__(self, url: str, pathname: str, stats: Stats) -> None:
+        self.url = url
+        self.pathname = pathname
+        self.stats = stats
+        self.token = str(uuid.uuid4())
+        self.router_data = {"pathname": pathname, "query": {}, "asPath": pathname}
+        self.delta: Dict[str, dict] = {}
+        self.updates: asyncio.Queue = asyncio.Queue()
+        # Trueを返した更新はイベントへの応答として扱わない（部屋からの送信などに使う）
+        self.on_update: Optional[Callable[[dict], bool]] = None
+
+    async def __aenter__(self):
+        self.ws = await websockets.connect(f"{self.url}{NAMESPACE}/?EIO=4&transport=websocket", max_size=None)
+        await self.ws.recv()  # Engine.IOのハンドシェイク
+        await self.ws.send(f"40{NAMESPACE},")
+        await self.ws.recv()  # 名前空間への接続
+        self.receiver = asyncio.create_task(self.receive())
+        return self
+
+    async def __aexit__(self, *exc):
+        self.receiver.cancel()
+        await self.ws.close()
+
+    async def receive(self):
+        prefix = f"42{NAMESPACE},"
+        async for message in self.ws:
+            if message == "2":
+                await self.ws.send("3")
+            elif message.startswith(prefix):
+                _, update = json.loads(message[len(prefix) :])
+                for state, delta in update["delta"].items():
+                    self.delta.setdefault(state, {}).update(delta)
+                deltas = list(update["delta"].values())
+                if self.on_update is not None and self.on_update(update):
+                    continue
+                if update["events"]:
+                    await self.updates.put(update)
+                elif deltas and all(set(delta) <= TICK_VARS for delta in deltas):
+                    self.stats.num_ticks += 1
+                else:
+                    await self.updates.put(update)
+
+    async def emit(self, name: str, **payload):
+        """
+        イベントを送り、連鎖したイベントも含めて処理が終わるまで待つ
+
+        Args:
+            name (str): イベントハンドラの完全な名前
+        """
+        queue = [{"name": name, "payload": payload}]
+        while queue:
+            event = queue.pop(0)
+            event.update(token=self.token, router_data=self.router_data)
+            start = time.perf_counter()
+            await self.ws.send(f"42{NAMESPACE}," + json.dumps(["event", event]))
+            while True:
+                update = await asyncio.wait_for(self.updates.get(), timeout=30)
+                # バックエンドで処理するイベントのみ連鎖させる（トーストやリダイレクトは無視する）
+                queue.extend(e for e in update["events"] if not e["name"].startswith("_"))
+                if update["final"]:
+                    break
+            self.stats.add(event["name"], time.perf_counter() - start)
+
+    async def send(self, name: str, **payload):
+        """
+        イベントを送り、応答を待たない
+
+        Args:
+            name (str): イベントハンドラの完全な名前
+        """
+        event = {"name": name, "payload": payload, "token": self.token, "router_data": self.router_data}
+        await self.ws.send(f"42{NAMESPACE}," + json.dumps(["event", event]))
+
+    def get_var(self, state, name: str):
+        return self.delta.get(state.get_full_name(), {}).get(name)
+
+
+def handler(state, name: str) -> str:
+    return f"{state.get_full_name()}.{name}"
+
+
+async def think(low: float = 0.15, high: float = 0.6):
+    await asyncio.sleep(random.uniform(low, high))
+
+
+async def play_minesweaper(client: Client, deadline: float):
+    height, width, num_mines = random.choice([(8, 10, 10), (14, 18, 40), (20, 24, 99)])
+    await client.emit(handler(MineSweaperState, "set_state"), height=height, width=width, num_mines=num_mines)
+    await client.emit(handler(MineSweaperState, "on_load"))
+    while time.perf_counter() < deadline:
+        for _ in range(random.randint(10, 40)):
+            if time.perf_counter() > deadline:
+                return
+            index = random.randrange(height * width)
+            if random.random() < 0.15:
+                await client.emit(handler(MineSweaperState, "put_or_unput_flag"), index=index)
+            else:
+                await client.emit(handler(MineSweaperState, "open_cell"), index=index)
+            await think()
+        await client.emit(handler(MineSweaperState, "reset_board"))
+
+
+async def play_tictactoe(client: Client, state, deadline: float):
+    await client.emit(handler(state, "initialize"))
+    size = random.choice([3, 4, 5])
+    await client.emit(handler(state, "change_size"), size=str(size))
+    while time.perf_counter() < deadline:
+        if state is CubeTicTacToeState:
+            # 立体の盤面は層ごとの状態に分かれている
+            board = "".join(client.get_var(layer, "cells") or "" for layer in LAYER_STATES)
+        else:
+            board = client.get_var(state, "coded_board")
+        free = [i for i, code in enumerate(board or "") if code == "-"]
+        if not free:
+            await client.emit(handler(state, "reset_board"), sleep_time=0.5)
+            continue
+        index = random.choice(free)
+        # マウスを動かしてからクリックする
+        for hover in random.sample(free, min(3, len(free))):
+            await client.emit(handler(state, "focus_cell"), index=hover)
+            await client.emit(handler(state, "unfocus_cell"), index=hover)
+        await client.emit(handler(state, "select_cell"), index=index)
+        await think(0.5, 1.5)
+
+
+async def run_client(url: str, game: str, stats: Stats, deadline: float):
+    pathname = {"minesweaper": "/minesweaper/play", "square": "/tictactoe/2d", "cube": "/tictactoe/3d"}[game]
+    try:
+        async with Client(url, pathname, stats) as client:
+            await client.emit(f"{State.get_full_name()}.{constants.CompileVars.HYDRATE}")
+            if game == "minesweaper":
+                await play_minesweaper(client, deadline)
+            else:
+                state = SquareTicTacToeState if game == "square" else CubeTicTacToeState
+                await play_tictactoe(client, state, deadline)
+    except (asyncio.TimeoutError, websockets.WebSocketException, OSError):
+        stats.num_errors += 1
+
+
+class RoomWatcher:
+    """
+    部屋からの送信を受け取り、手数ごとに最初に届いた時刻を記録する
+    """
+
+    def __init__(self, client: Client) -> None:
+        self.arrivals: Dict[int, float] = {}
+        self.status = ""
+        client.on_update = self.on_update
+
+    def on_update(self, update: dict) -> bool:
+        delta = update["delta"].get(RoomState.get_full_name(), {})
+        # 手を指したプレイヤーへの応答（勝敗のトーストを含む）も同じ変数のみを持つため、送信と同様に扱う
+        if len(update["delta"]) != 1 or set(delta) != set(ROOM_VARS):
+            return False
+        self.arrivals.setdefault(delta["turn"], time.perf_counter())
+        self.status = delta["status"]
+        return True
+
+
+async def wait_arrivals(watchers: List[RoomWatcher], turn: int, timeout: float = 10.0):
+    deadline = time.perf_counter() + timeout
+    while any(turn not in watcher.arrivals for watcher in watchers):
+        if time.perf_counter() > deadline:
+            raise asyncio.TimeoutError
+        await asyncio.sleep(0.001)
+
+
+async def run_room(args: argparse.Namespace) -> dict:
+    """
+    2人のプレイヤーと多数の観戦者で部屋に入り、1手ごとに全員へ届くまでの時間を計測する
+    """
+    random.seed(args.seed)
+    stats = Stats()
+    pathname = "/tictactoe/rooms"
+    clients = [Client(args.url, pathname, stats) for _ in range(args.room_spectators + 2)]
+    for client in clients:
+        await client.__aenter__()
+    try:
+        hydrate = f"{State.get_full_name()}.{constants.CompileVars.HYDRATE}"
+        await asyncio.gather(*(client.emit(hydrate) for client in clients))
+        watchers = [RoomWatcher(client) for client in clients]
+        latencies: List[float] = []
+        num_games = 0
+        while len(latencies) < args.room_moves * args.room_spectators:
+            host, guest, spectators = clients[0], clients[1], clients[2:]
+            await host.emit(handler(RoomState, "create_room"), size="5")
+            room_id = host.get_var(RoomState, "room_id")
+            for client in [guest] + spectators:
+                await client.emit(handler(RoomState, "set_room_input"), room_input=room_id)
+            await guest.emit(handler(RoomState, "join_room"))
+            await asyncio.gather(*(client.emit(handler(RoomState, "join_room")) for client in spectators))
+            for watcher in watchers:
+                watcher.arrivals.clear()
+                watcher.status = PLAYING
+            free = list(range(25))
+            random.shuffle(free)
+            for turn, cell in enumerate(free):
+                start = time.perf_counter()
+                await clients[turn % 2].send(handler(RoomState, "select_cell"), index=cell)
+                await wait_arrivals(watchers, turn + 1)
+                latencies.extend(watcher.arrivals[turn + 1] - start for watcher in watchers[2:])
+                if watchers[0].status != PLAYING:
+                    break
+            num_games += 1
+    finally:
+        for client in clients:
+            await client.__aexit__()
+    return {
+        "spectators": args.room_spectators,
+        "games": num_games,
+        "moves": len(latencies) // args.room_spectators,
+        "fanout_p50_ms": percentile(latencies, 0.5) * 1000,
+        "fanout_p99_ms": percentile(latencies, 0.99) * 1000,
+        "fanout_max_ms": max(latencies) * 1000,
+    }
+
+
+async def sample_process(pid: int, samples: List[dict], stop: asyncio.Event):
+    process = psutil.Process(pid)
+    process.cpu_percent()
+    while not stop.is_set():
+        await asyncio.sleep(0.5)
+        samples.append({"rss": process.memory_info().rss, "cpu": process.cpu_percent()})
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main(args: argparse.Namespace) -> dict:
+    random.seed(args.seed)
+    stats = Stats()
+    samples: List[dict] = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_process(args.backend_pid, samples, stop)) if args.backend_pid else None
+    start = time.perf_counter()
+    deadline = start + args.duration
+    clients = []
+    for i in range(args.clients):
+        clients.append(asyncio.create_task(run_client(args.url, random.choice(args.games), stats, deadline)))
+        await asyncio.sleep(args.ramp_up / args.clients)
+    await asyncio.gather(*clients)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    if sampler is not None:
+        await sampler
+
+    report = {
+        "clients": args.clients,
+        "duration": elapsed,
+        "events": stats.num_events,
+        "errors": stats.num_errors,
+        "timer_ticks": stats.num_ticks,
+        "throughput": stats.num_events / elapsed,
+        "handlers": {
+            name: {
+                "count": len(values),
+                "p50_ms": percentile(values, 0.5) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+            }
+            for name, values in sorted(stats.latencies.items())
+        },
+    }
+    if samples:
+        report["backend"] = {
+            "max_rss_mb": max(s["rss"] for s in samples) / 2**20,
+            "mean_cpu_percent": sum(s["cpu"] for s in samples) / len(samples),
+            "max_cpu_percent": max(s["cpu"] for s in samples),
+        }
+    return report
+
+
+def print_report(report: dict):
+    print(
+        f"clients: {report['clients']}, events: {report['events']}, errors: {report['errors']}, "
+        f"timer ticks: {report['timer_ticks']}"
+    )
+    print(f"throughput: {report['throughput']:.1f} events/s")
+    for name, values in report["handlers"].items():
+        print(f"  {name:<22} n={values['count']:<6} p50={values['p50_ms']:7.1f} ms  p99={values['p99_ms']:7.1f} ms")
+    if "backend" in report:
+        backend = report["backend"]
+        print(
+            f"backend: max RSS {backend['max_rss_mb']:.1f} MiB, "
+            f"CPU mean {backend['mean_cpu_percent']:.0f}% / max {backend['max_cpu_percent']:.0f}%"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://localhost:8000", help="バックエンドのURL")
+    parser.add_argument("--clients", type=int, default=50, help="同時に接続するクライアントの数")
+    parser.add_argument("--duration", type=float, default=30.0, help="負荷をかける秒数")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="全クライアントが接続するまでの秒数")
+    parser.add_argument("--games", nargs="+", choices=GAMES, default=GAMES, help="プレイするゲーム")
+    parser.add_argument("--backend-pid", type=int, help="メモリとCPUを計測するバックエンドのプロセスID")
+    parser.add_argument("--room-spectators", type=int, help="部屋の送信を計測するときの観戦者の数")
+    parser.add_argument("--room-moves", type=int, default=50, help="部屋の送信を計測する手数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+
+    if args.room_spectators:
+        report = asyncio.run(run_room(args))
+        print(
+            f"spectators: {report['spectators']}, games: {report['games']}, moves: {report['moves']}, "
+            f"fan-out p50={report['fanout_p50_ms']:.1f} ms  p99={report['fanout_p99_ms']:.1f} ms  "
+            f"max={report['fanout_max_ms']:.1f} ms"
+        )
+    else:
+        report = asyncio.run(main(args))
+        print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
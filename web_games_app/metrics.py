@@ -0,0 +1,245 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import time
+from typing import Callable, Dict, Sequence, Tuple
+
+# 所要時間のバケット（マイクロ秒）
+TIME_BUCKETS = (10, 25, 50, 100, 250, 500, 1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 1_000_000)
+# ペイロードサイズのバケット（バイト）
+SIZE_BUCKETS = (64, 256, 1_024, 4_096, 16_384, 65_536, 262_144, 1_048_576)
+
+ENABLED = os.environ.get("WEB_GAMES_METRICS", "1") != "0"
+# 差分のサイズ計測はJSON化が必要なため、明示的に有効化したときのみ行う
+PAYLOAD_ENABLED = ENABLED and os.environ.get("WEB_GAMES_METRICS_PAYLOAD", "0") == "1"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Sequence[int]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value: int):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+# (ハンドラ名, 種類) -> ヒストグラム
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+_current_handler: contextvars.ContextVar[str] = contextvars.ContextVar("current_handler", default="unknown")
+# 実行中のハンドラで、所要時間から除く待ち時間（ナノ秒）
+_current_idle: contextvars.ContextVar[list] = contextvars.ContextVar("current_idle")
+
+
+def observe(name: str, kind: str, value: int, buckets: Sequence[int] = TIME_BUCKETS):
+    """
+    計測値をヒストグラムに記録する
+
+    Args:
+        name (str): ハンドラ名
+        kind (str): 計測の種類（wall、db、engine、idle、payload）
+        value (int): 計測値
+        buckets (Sequence[int], optional): ヒストグラムのバケット
+    """
+    hist = _histograms.get((name, kind))
+    if hist is None:
+        hist = _histograms[(name, kind)] = Histogram(buckets)
+    hist.observe(value)
+
+
+def _payload_size(state) -> int:
+    dirty_vars = getattr(state, "dirty_vars", None)
+    base_vars = getattr(state, "base_vars", None)
+    if not dirty_vars or base_vars is None:
+        return 0
+    delta = {name: getattr(state, name) for name in dirty_vars if name in base_vars and not name.startswith("_")}
+    return len(json.dumps(delta, default=str))
+
+
+def instrument(fn: Callable) -> Callable:
+    """
+    イベントハンドラや算出変数の実行時間を計測するデコレータ。
+    rx.varやrx.eventの内側（関数の直上）に付ける。
+
+    Args:
+        fn (Callable): 計測する関数
+
+    Returns:
+        Callable: 計測処理を追加した関数
+    """
+    if not ENABLED:
+        return fn
+    name = fn.__qualname__
+
+    def finish(state, tokens, start: int):
+        idle_ns = _current_idle.get()[0]
+        observe(name, "wall", (time.perf_counter_ns() - start - idle_ns) // 1000)
+        if PAYLOAD_ENABLED:
+            observe(name, "payload", _payload_size(state), SIZE_BUCKETS)
+        _current_idle.reset(tokens[1])
+        _current_handler.reset(tokens[0])
+
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def async_wrapper(self, *args, **kwargs):
+            tokens = _current_handler.set(name), _current_idle.set([0])
+            start = time.perf_counter_ns()
+            try:
+                return await fn(self, *args, **kwargs)
+            finally:
+                finish(self, tokens, start)
+
+        wrapper = async_wrapper
+    else:
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            tokens = _current_handler.set(name), _current_idle.set([0])
+            start = time.perf_counter_ns()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                finish(self, tokens, start)
+
+    # Reflexは__wrapped__を辿らないgetfullargspecで引数名を取得するため、元のシグネチャを明示する
+    wrapper.__signature__ = inspect.signature(fn)
+    return wrapper
+
+
+class measure:
+    """
+    ハンドラ内の一部の処理（DBやゲームエンジン）の時間を計測するコンテキストマネージャ
+
+    Example:
+        with measure("db"):
+            session.commit()
+    """
+
+    __slots__ = ("kind", "start")
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        if ENABLED:
+            observe(_current_handler.get(), self.kind, (time.perf_counter_ns() - self.start) // 1000)
+        return False
+
+
+class idle(measure):
+    """
+    演出のための待ち時間など、ハンドラの所要時間（wall）から除く処理。待ち時間はidleとして別に記録する
+
+    Example:
+        with idle():
+            await asyncio.sleep(sleep_time)
+    """
+
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        super().__init__("idle")
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        waited = _current_idle.get(None)
+        if waited is not None:
+            waited[0] += elapsed
+        if ENABLED:
+            observe(_current_handler.get(), self.kind, elapsed // 1000)
+        return False
+
+
+def reset():
+    _histograms.clear()
+
+
+def to_json() -> dict:
+    """
+    記録したヒストグラムを辞書に変換する
+
+    Returns:
+        dict: {ハンドラ名: {種類: ヒストグラム}}
+    """
+    data: Dict[str, dict] = {}
+    for (name, kind), hist in sorted(_histograms.items()):
+        data.setdefault(name, {})[kind] = hist.to_dict()
+    return data
+
+
+def dump(path: str):
+    with open(path, "w") as f:
+        json.dump(to_json(), f, indent=2)
+
+
+def to_prometheus() -> str:
+    """
+    記録したヒストグラムをPrometheusのテキスト形式に変換する
+
+    Returns:
+        str: Prometheusのテキスト形式
+    """
+    lines = []
+    for kind, unit in [("wall", "us"), ("db", "us"), ("engine", "us"), ("idle", "us"), ("payload", "bytes")]:
+        metric = f"web_games_handler_{kind}_{unit}"
+        hists = [(name, hist) for (name, k), hist in sorted(_histograms.items()) if k == kind]
+        if not hists:
+            continue
+        lines.append(f"# TYPE {metric} histogram")
+        for name, hist in hists:
+            cumulative = 0
+            for le, count in zip([*hist.buckets, "+Inf"], hist.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{handler="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{handler="{name}"}} {hist.sum}')
+            lines.append(f'{metric}_count{{handler="{name}"}} {hist.count}')
+    return "\n".join(lines) + "\n"
+
+
+async def prometheus_endpoint():
+    from starlette.responses import PlainTextResponse
+
+    return PlainTextResponse(to_prometheus())
+
+
+async def json_endpoint():
+    return to_json()
+
+
+if __name__ == "__main__":
+    # 計測によるオーバーヘッドを確認する
+    class Dummy:
+        def handler(self):
+            with measure("engine"):
+                pass
+
+    n = 100_000
+    raw = Dummy.handler
+    wrapped = instrument(Dummy.handler)
+    d = Dummy()
+    for label, f in [("raw", raw), ("instrumented", wrapped)]:
+        start = time.perf_counter()
+        for _ in range(n):
+            f(d)
+        print(f"{label}: {(time.perf_counter() - start) / n * 1e6:.2f} us/call")
@@ -1,5 +1,11 @@
-from .minesweaper import MineSweaper
+from .daily import get_daily_board, get_shared_board
+from .lazy_minesweaper import LazyMineSweaper
+from .minesweaper import CubeMineSweaper, MineSweaper
 
 __all__ = [
     "MineSweaper",
+    "CubeMineSweaper",
+    "LazyMineSweaper",
+    "get_daily_board",
+    "get_shared_board",
 ]
@@ -0,0 +1,75 @@
+import datetime
+import functools
+import hashlib
+import random as rnd
+from typing import NamedTuple
+
+import numpy as np
+
+from .minesweaper import MineSweaper
+
+
+class DailyBoard(NamedTuple):
+    # 実際の盤面（読み取り専用）
+    actual_board: np.ndarray
+    # 最初に開けるセル
+    start: int
+    bbbv: int
+    # 連鎖して開く領域の番号（読み取り専用）
+    openings: np.ndarray
+
+
+def today() -> str:
+    """
+    デイリーチャレンジの日付を取得する。全てのプレイヤーで揃えるため、UTCの日付とする。
+
+    Returns:
+        str: YYYY-MM-DD形式の日付
+    """
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+def get_seed(day: str, height: int, width: int, num_mines: int) -> int:
+    # hash()はプロセスごとに値が変わるため、ハッシュ関数から求める
+    digest = hashlib.sha256(f"{day}/{height}x{width}x{num_mines}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+@functools.lru_cache(maxsize=64)
+def get_shared_board(seed: int, height: int, width: int, num_mines: int) -> DailyBoard:
+    """
+    シードと難易度から決まる盤面を取得する。プロセス内で一度だけ生成し、全てのセッションで共有する。
+
+    Args:
+        seed (int): 盤面のシード
+        height (int): 盤面の高さ
+        width (int): 盤面の幅
+        num_mines (int): 地雷の数
+
+    Returns:
+        DailyBoard: 共有する盤面
+    """
+    rng = rnd.Random(seed)
+    start = rng.randrange(height * width)
+    ms = MineSweaper(height, width, num_mines)
+    ms.initialize(start, rng)
+    # 共有している盤面を誤って書き換えないようにする
+    ms.actual_board.flags.writeable = False
+    ms.openings.flags.writeable = False
+    return DailyBoard(ms.actual_board, start, ms.bbbv, ms.openings)
+
+
+def get_daily_board(day: str, height: int, width: int, num_mines: int) -> DailyBoard:
+    """
+    日付と難易度から決まる盤面を取得する
+
+    Args:
+        day (str): 日付
+        height (int): 盤面の高さ
+        width (int): 盤面の幅
+        num_mines (int): 地雷の数
+
+    Returns:
+        DailyBoard: 共有する盤面
+    """
+    return get_shared_board(get_seed(day, height, width, num_mines), height, width, num_mines)
@@ -0,0 +1,304 @@
+import random as rnd
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .minesweaper import FAILED_FLAG_NUM, FLAG_NUM, MINE_NUM, NOT_SELECTED_MINE_NUM, NOT_SELECTED_NUM
+
+ChunkKey = Tuple[int, int]
+
+
+class LazyMineSweaper:
+    """
+    大きな盤面用のマインスイーパー。
+    地雷はチャンクごとにシードから必要になった時点で生成し、触れたチャンクのみをメモリに保持する。
+    """
+
+    CHUNK_SIZE = 32
+
+    height: int
+    width: int
+    num_cells: int
+    num_mines: int
+    num_remain_cells: int
+    num_selected_cells: int
+    num_flags: int
+    is_initialized: bool
+    seed: int
+    # チャンクごとの地雷数
+    chunk_mine_counts: np.ndarray
+    # 生成済みのチャンク...地雷の位置
+    mine_chunks: Dict[ChunkKey, np.ndarray]
+    # 計算済みのチャンク...MINE_NUM：地雷、それ以外：周囲の地雷の数
+    actual_chunks: Dict[ChunkKey, np.ndarray]
+    # 表示用のチャンク...開けたか旗を置いたチャンクのみ
+    showing_chunks: Dict[ChunkKey, np.ndarray]
+
+    def __init__(self, height: int, width: int, num_mines: int, seed: Optional[int] = None) -> None:
+        self.height = height
+        self.width = width
+        self.num_cells = height * width
+        self.num_mines = num_mines
+        self.num_chunk_rows = -(-height // self.CHUNK_SIZE)
+        self.num_chunk_cols = -(-width // self.CHUNK_SIZE)
+        self.reset(seed)
+
+    def reset(self, seed: Optional[int] = None):
+        """
+        盤面をリセットする
+
+        Args:
+            seed (Optional[int], optional): 地雷の配置に使うシード。Noneのときはランダムに決める
+        """
+        self.seed = rnd.getrandbits(63) if seed is None else seed
+        self.num_remain_cells = self.num_cells - self.num_mines
+        self.num_selected_cells = 0
+        self.num_flags = 0
+        self.is_initialized = False
+        self.safe_cells: set = set()
+        self.chunk_mine_counts = np.zeros((self.num_chunk_rows, self.num_chunk_cols), dtype=int)
+        self.mine_chunks = {}
+        self.actual_chunks = {}
+        self.showing_chunks = {}
+
+    def num2index(self, num: int) -> Tuple[int, int]:
+        assert 0 <= num < self.num_cells
+        return num // self.width, num % self.width
+
+    def index2num(self, i: int, j: int) -> int:
+        assert 0 <= i < self.height and 0 <= j < self.width
+        return i * self.width + j
+
+    def chunk_shape(self, ci: int, cj: int) -> Tuple[int, int]:
+        size = self.CHUNK_SIZE
+        return min(size, self.height - ci * size), min(size, self.width - cj * size)
+
+    def get_surroundings(self, i: int, j: int):
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                if 0 <= i + di < self.height and 0 <= j + dj < self.width:
+                    yield i + di, j + dj
+
+    def initialize(self, num: int):
+        """
+        最初に選択したセルの周囲を除いて、各チャンクに置く地雷の数を決める。地雷の位置はまだ決めない。
+
+        Args:
+            num (int): 選択した数字
+        """
+        self.safe_cells = set(self.get_surroundings(*self.num2index(num)))
+        sizes = np.zeros_like(self.chunk_mine_counts)
+        for ci in range(self.num_chunk_rows):
+            for cj in range(self.num_chunk_cols):
+                h, w = self.chunk_shape(ci, cj)
+                sizes[ci, cj] = h * w
+        for i, j in self.safe_cells:
+            sizes[i // self.CHUNK_SIZE, j // self.CHUNK_SIZE] -= 1
+        # 盤面全体から一様に選んだ場合と同じ分布でチャンクごとの地雷数を決める
+        rng = np.random.default_rng(self.seed)
+        self.chunk_mine_counts = rng.multivariate_hypergeometric(sizes.ravel(), self.num_mines).reshape(sizes.shape)
+        self.is_initialized = True
+
+    def get_mine_chunk(self, ci: int, cj: int) -> np.ndarray:
+        """
+        チャンクの地雷の位置を取得する。未生成のときはシードから生成する。
+
+        Args:
+            ci (int): チャンクの行
+            cj (int): チャンクの列
+
+        Returns:
+            np.ndarray: 地雷の位置
+        """
+        mines = self.mine_chunks.get((ci, cj))
+        if mines is None:
+            h, w = self.chunk_shape(ci, cj)
+            top, left = ci * self.CHUNK_SIZE, cj * self.CHUNK_SIZE
+            allowed = np.ones(h * w, dtype=bool)
+            for i, j in self.safe_cells:
+                if top <= i < top + h and left <= j < left + w:
+                    allowed[(i - top) * w + (j - left)] = False
+            rng = np.random.default_rng([self.seed, ci, cj])
+            mines = np.zeros(h * w, dtype=bool)
+            mines[rng.choice(np.flatnonzero(allowed), self.chunk_mine_counts[ci, cj], replace=False)] = True
+            mines = mines.reshape(h, w)
+            self.mine_chunks[(ci, cj)] = mines
+        return mines
+
+    def get_actual_chunk(self, ci: int, cj: int) -> np.ndarray:
+        """
+        チャンクの実際の盤面を取得する。境界の数字を求めるため、隣接するチャンクの地雷も生成する。
+
+        Args:
+            ci (int): チャンクの行
+            cj (int): チャンクの列
+
+        Returns:
+            np.ndarray: 実際の盤面
+        """
+        actual = self.actual_chunks.get((ci, cj))
+        if actual is None:
+            h, w = self.chunk_shape(ci, cj)
+            padded = np.zeros((h + 2, w + 2), dtype=np.int8)
+            for dci in (-1, 0, 1):
+                for dcj in (-1, 0, 1):
+                    nci, ncj = ci + dci, cj + dcj
+                    if not (0 <= nci < self.num_chunk_rows and 0 <= ncj < self.num_chunk_cols):
+                        continue
+                    mines = self.get_mine_chunk(nci, ncj)
+                    nh, nw = mines.shape
+                    # 隣接するチャンクのうち、パディング部分に重なる範囲のみ使う
+                    rows = slice(0, nh) if dci == 0 else (slice(nh - 1, nh) if dci < 0 else slice(0, 1))
+                    cols = slice(0, nw) if dcj == 0 else (slice(nw - 1, nw) if dcj < 0 else slice(0, 1))
+                    prow = 1 if dci == 0 else (0 if dci < 0 else h + 1)
+                    pcol = 1 if dcj == 0 else (0 if dcj < 0 else w + 1)
+                    part = mines[rows, cols]
+                    padded[prow : prow + part.shape[0], pcol : pcol + part.shape[1]] = part
+            counts = sum(padded[1 + di : 1 + di + h, 1 + dj : 1 + dj + w] for di in (-1, 0, 1) for dj in (-1, 0, 1))
+            actual = np.where(padded[1:-1, 1:-1] == 1, MINE_NUM, counts - padded[1:-1, 1:-1]).astype(np.int8)
+            self.actual_chunks[(ci, cj)] = actual
+        return actual
+
+    def get_showing_chunk(self, ci: int, cj: int) -> np.ndarray:
+        showing = self.showing_chunks.get((ci, cj))
+        if showing is None:
+            showing = np.full(self.chunk_shape(ci, cj), NOT_SELECTED_NUM, dtype=np.int8)
+            self.showing_chunks[(ci, cj)] = showing
+        return showing
+
+    def get_actual(self, i: int, j: int) -> int:
+        size = self.CHUNK_SIZE
+        return int(self.get_actual_chunk(i // size, j // size)[i % size, j % size])
+
+    def get_showing(self, i: int, j: int) -> int:
+        size = self.CHUNK_SIZE
+        showing = self.showing_chunks.get((i // size, j // size))
+        return NOT_SELECTED_NUM if showing is None else int(showing[i % size, j % size])
+
+    @staticmethod
+    def is_closed(value: int) -> bool:
+        # MineSweaperと同様に、旗が置かれたセルも開ける対象とする
+        return value == NOT_SELECTED_NUM or value == FLAG_NUM
+
+    def open_cell(self, num: int) -> bool:
+        """
+        選択されたセルを開ける
+
+        Args:
+            num (int): 選択した数字
+
+        Returns:
+            bool: 地雷を選択したときのみFalseを返す
+        """
+        if not self.is_initialized:
+            self.initialize(num)
+        size = self.CHUNK_SIZE
+        i, j = self.num2index(num)
+        if self.get_actual(i, j) == MINE_NUM:
+            return False
+        q = deque([(i, j)])
+        while len(q) > 0:
+            i, j = q.pop()
+            showing = self.get_showing_chunk(i // size, j // size)
+            if not self.is_closed(showing[i % size, j % size]):
+                # 選択済みのときにスキップ
+                continue
+            if showing[i % size, j % size] == FLAG_NUM:
+                self.num_flags -= 1
+            value = self.get_actual(i, j)
+            showing[i % size, j % size] = value
+            self.num_selected_cells += 1
+            if value == 0:
+                # 周囲のセルも開ける候補にする
+                for s in self.get_surroundings(i, j):
+                    if self.is_closed(self.get_showing(*s)):
+                        q.append(s)
+        return True
+
+    def is_all_selected(self) -> bool:
+        return self.num_selected_cells == self.num_remain_cells
+
+    def put_or_unput_flag(self, num: int):
+        i, j = self.num2index(num)
+        size = self.CHUNK_SIZE
+        showing = self.get_showing_chunk(i // size, j // size)
+        if showing[i % size, j % size] == FLAG_NUM:
+            showing[i % size, j % size] = NOT_SELECTED_NUM
+            self.num_flags -= 1
+        elif showing[i % size, j % size] == NOT_SELECTED_NUM:
+            showing[i % size, j % size] = FLAG_NUM
+            self.num_flags += 1
+
+    def get_view(self, top: int, left: int, height: int, width: int) -> np.ndarray:
+        """
+        盤面の一部を表示用に取得する
+
+        Args:
+            top (int): 表示範囲の上端
+            left (int): 表示範囲の左端
+            height (int): 表示範囲の高さ
+            width (int): 表示範囲の幅
+
+        Returns:
+            np.ndarray: 表示用の盤面
+        """
+        bottom, right = min(top + height, self.height), min(left + width, self.width)
+        view = np.full((bottom - top, right - left), NOT_SELECTED_NUM, dtype=int)
+        size = self.CHUNK_SIZE
+        for (ci, cj), showing in self.showing_chunks.items():
+            t, l = ci * size, cj * size
+            it, il = max(t, top), max(l, left)
+            ib, ir = min(t + showing.shape[0], bottom), min(l + showing.shape[1], right)
+            if it < ib and il < ir:
+                view[it - top : ib - top, il - left : ir - left] = showing[it - t : ib - t, il - l : ir - l]
+        return view
+
+    def reveal_view(self, top: int, left: int, height: int, width: int) -> np.ndarray:
+        """
+        ゲームに失敗したときの表示用に、盤面の一部を取得する。
+        MineSweaper.reveal_boardと同じく、開けられていない地雷はNOT_SELECTED_MINE_NUM、誤って置かれた旗はFAILED_FLAG_NUMになる。
+        地雷は表示範囲に重なるチャンクのみ生成する。
+
+        Args:
+            top (int): 表示範囲の上端
+            left (int): 表示範囲の左端
+            height (int): 表示範囲の高さ
+            width (int): 表示範囲の幅
+
+        Returns:
+            np.ndarray: 表示用の盤面
+        """
+        view = self.get_view(top, left, height, width)
+        if not self.is_initialized:
+            return view
+        bottom, right = top + view.shape[0], left + view.shape[1]
+        is_mine = np.zeros(view.shape, dtype=bool)
+        size = self.CHUNK_SIZE
+        for ci in range(top // size, -(-bottom // size)):
+            for cj in range(left // size, -(-right // size)):
+                mines = self.get_mine_chunk(ci, cj)
+                t, l = ci * size, cj * size
+                it, il = max(t, top), max(l, left)
+                ib, ir = min(t + mines.shape[0], bottom), min(l + mines.shape[1], right)
+                is_mine[it - top : ib - top, il - left : ir - left] = mines[it - t : ib - t, il - l : ir - l]
+        return np.where(
+            is_mine & (view == NOT_SELECTED_NUM),
+            NOT_SELECTED_MINE_NUM,
+            np.where(~is_mine & (view == FLAG_NUM), FAILED_FLAG_NUM, view),
+        )
+
+    @property
+    def num_loaded_chunks(self) -> int:
+        return len(self.mine_chunks)
+
+
+if __name__ == "__main__":
+    import time
+
+    ms = LazyMineSweaper(1000, 1000, 150_000, seed=0)
+    start = time.perf_counter()
+    ms.open_cell(500_500)
+    print(f"first click: {time.perf_counter() - start:.3f} s, opened {ms.num_selected_cells} cells")
+    print(f"loaded chunks: {ms.num_loaded_chunks} / {ms.num_chunk_rows * ms.num_chunk_cols}")
+    print(ms.get_view(490, 490, 20, 20))
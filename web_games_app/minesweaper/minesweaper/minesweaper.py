@@ -1,6 +1,6 @@
+import itertools
 import random as rnd
-from collections import deque
-from typing import List, Tuple, Union
+from typing import List, Optional, Tuple, Union
 
 import numpy as np
 
@@ -23,33 +23,158 @@ def check_state_num(num: int) -> bool:
 MINE_NUM = -1
 FLAG_NUM = -2
 NOT_SELECTED_NUM = -3
+# ゲーム終了時の表示用
+NOT_SELECTED_MINE_NUM = -10
+FAILED_FLAG_NUM = -11
 assert check_state_num(MINE_NUM), f"MINE_NUM (={MINE_NUM}) is invalid number"
 assert check_state_num(FLAG_NUM), f"FLAG_NUM (={FLAG_NUM}) is invalid number"
 assert check_state_num(NOT_SELECTED_NUM), f"NOT_SELECTED_NUM (={NOT_SELECTED_NUM}) is invalid number"
-s = [MINE_NUM, FLAG_NUM, NOT_SELECTED_NUM]
+assert check_state_num(NOT_SELECTED_MINE_NUM), f"NOT_SELECTED_MINE_NUM (={NOT_SELECTED_MINE_NUM}) is invalid number"
+assert check_state_num(FAILED_FLAG_NUM), f"FAILED_FLAG_NUM (={FAILED_FLAG_NUM}) is invalid number"
+s = [MINE_NUM, FLAG_NUM, NOT_SELECTED_NUM, NOT_SELECTED_MINE_NUM, FAILED_FLAG_NUM]
 assert len(set(s)) == len(s), (
-    f"MINE_NUM (={MINE_NUM}), FLAG_NUM (={FLAG_NUM})" f" and NOT_SELECTED_NUM (={NOT_SELECTED_NUM}) must be differnt"
+    f"MINE_NUM (={MINE_NUM}), FLAG_NUM (={FLAG_NUM})"
+    f", NOT_SELECTED_NUM (={NOT_SELECTED_NUM}), NOT_SELECTED_MINE_NUM (={NOT_SELECTED_MINE_NUM})"
+    f" and FAILED_FLAG_NUM (={FAILED_FLAG_NUM}) must be differnt"
 )
 del s
+# セルの状態（MineSweaper.status）のビット
+OPENED_BIT = 1
+FLAG_BIT = 2
+MINE_BIT = 4
+
+
+def shift_all(padded: np.ndarray) -> List[np.ndarray]:
+    """
+    周囲を1セルずつパディングした盤面から、各方向にずらした盤面を取り出す。
+    2次元では自身を含めて9方向、3次元では27方向となる。
+
+    Args:
+        padded (np.ndarray): パディングした盤面
+
+    Returns:
+        List[np.ndarray]: ずらした盤面（元の盤面と同じ形）
+    """
+    shape = tuple(n - 2 for n in padded.shape)
+    return [
+        padded[tuple(slice(1 + d, 1 + d + n) for d, n in zip(offset, shape))]
+        for offset in itertools.product((-1, 0, 1), repeat=padded.ndim)
+    ]
+
+
+def count_neighbors(mask: np.ndarray) -> np.ndarray:
+    """
+    各セルの周囲（2次元では8方向、3次元では26方向）で条件を満たすセルの数を数える
+
+    Args:
+        mask (np.ndarray): 条件を満たすセルがTrueの盤面
+
+    Returns:
+        np.ndarray: 周囲で条件を満たすセルの数（自身は含まない）
+    """
+    return sum(shift_all(np.pad(mask.astype(int), 1))) - mask
+
+
+def expand(mask: np.ndarray) -> np.ndarray:
+    """
+    条件を満たすセルとその周囲のセルをTrueにする
+
+    Args:
+        mask (np.ndarray): 条件を満たすセルがTrueの盤面
+
+    Returns:
+        np.ndarray: 広げた盤面
+    """
+    return np.logical_or.reduce(shift_all(np.pad(mask, 1)))
+
+
+def label_openings(zero: np.ndarray) -> np.ndarray:
+    """
+    周囲に地雷のないセルが連結した領域（開けると連鎖する領域）ごとに番号を振る。
+    各セルに番号を振り、周囲の最小の番号で置き換える操作を収束するまで繰り返す。
+
+    Args:
+        zero (np.ndarray): 周囲に地雷のないセルがTrueの盤面
+
+    Returns:
+        np.ndarray: 領域の番号（領域内で最小のセルの数字）。領域外のセルはセルの数
+    """
+    size = zero.size
+    labels = np.where(zero.ravel(), np.arange(size), size).reshape(zero.shape)
+    while True:
+        neighbor_min = np.minimum.reduce(shift_all(np.pad(labels, 1, constant_values=size)))
+        new_labels = np.where(zero, neighbor_min, size)
+        # 番号が指すセルの番号を辿り、長い領域でも少ない反復で収束させる
+        flat = new_labels.ravel()
+        inside = flat < size
+        flat[inside] = flat[flat[inside]]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def count_labels(labels: np.ndarray) -> int:
+    # 番号は領域内で最小のセルの数字なので、自身の数字と番号が一致するセルが各領域に1つある
+    return int(np.count_nonzero(labels.ravel() == np.arange(labels.size)))
+
+
+def count_openings(zero: np.ndarray) -> int:
+    """
+    周囲に地雷のないセルが連結した領域（開けると連鎖する領域）の数を数える
+
+    Args:
+        zero (np.ndarray): 周囲に地雷のないセルがTrueの盤面
+
+    Returns:
+        int: 領域の数
+    """
+    return count_labels(label_openings(zero))
 
 
 class MineSweaper:
+    # 盤面の形...2次元では(height, width)、3次元では(depth, height, width)
+    shape: Tuple[int, ...]
     height: int
     width: int
     num_cells: int
     num_mines: int
     num_remain_cells: int
     num_selected_cells: int
+    # 置かれている旗の数と、そのうち地雷に置かれている旗の数
+    num_flags: int
+    num_correct_flags: int
     is_initialized: bool
+    # 盤面を解くのに最低限必要なクリック数（3BV）
+    bbbv: int
+    # デイリーチャレンジの日付（通常の盤面のときはNone）
+    daily: Optional[str]
+    # 他のセッションと共有している盤面のシード（共有していないときはNone）
+    seed: Optional[int]
+    # 地雷の配置に使った乱数のシード。最初に開けたセルと合わせて盤面を再現できる（リプレイ用）
+    mine_seed: Optional[int]
     # 実際の盤面...MINE_NUM：地雷、それ以外：周囲の地雷の数
     actual_board: np.ndarray
     # 表示用の盤面...MINE_NUM：地雷、FLAG_NUM：旗、NOT_SELECTED_NUM：未選択、それ以外：周囲の地雷の数
     showing_board: np.ndarray
+    # セルごとの状態...OPENED_BIT、FLAG_BIT、MINE_BITの組み合わせ。セルの判定や数の更新に使う
+    status: np.ndarray
+    # 連鎖して開く領域の番号（label_openingsの結果）。必要になったときに求める
+    openings: Optional[np.ndarray]
 
     def __init__(self, height: int, width: int, num_mines: int) -> None:
-        self.height = height
-        self.width = width
-        self.num_cells = height * width
+        self.setup((height, width), num_mines)
+
+    def setup(self, shape: Tuple[int, ...], num_mines: int):
+        """
+        盤面の形と地雷の数を設定してリセットする
+
+        Args:
+            shape (Tuple[int, ...]): 盤面の形
+            num_mines (int): 地雷の数
+        """
+        self.shape = shape
+        self.height, self.width = shape[-2:]
+        self.num_cells = int(np.prod(shape))
         self.num_mines = num_mines
         self.reset()
 
@@ -59,108 +184,193 @@ class MineSweaper:
         """
         self.num_remain_cells = self.num_cells - self.num_mines
         self.num_selected_cells = 0
+        self.num_flags = 0
+        self.num_correct_flags = 0
         self.is_initialized = False
-        self.actual_board = np.zeros((self.height, self.width), dtype=int)
-        self.showing_board = np.full((self.height, self.width), NOT_SELECTED_NUM, dtype=int)
-
-    def num2index(self, num: IntOrArray) -> Tuple[IntOrArray, IntOrArray]:
+        self.bbbv = 0
+        self.daily = None
+        self.seed = None
+        self.mine_seed = None
+        self.actual_board = np.zeros(self.shape, dtype=int)
+        self.showing_board = np.full(self.shape, NOT_SELECTED_NUM, dtype=int)
+        self.status = np.zeros(self.shape, dtype=np.uint8)
+        self.openings = None
+
+    def num2index(self, num: IntOrArray) -> Tuple[IntOrArray, ...]:
         """
-        数字を2次元のインデックスに変換する
+        数字を盤面の次元数のインデックスに変換する
 
         Args:
             num (IntOrArray): セルを表す数字（0 - self.num_cells-1）
 
         Returns:
-            Tuple[IntOrArray, IntOrArray]: 2次元のインデックスのタプル
+            Tuple[IntOrArray, ...]: 各次元のインデックスのタプル
         """
         if isinstance(num, int):
             assert 0 <= num < self.num_cells
         else:
             if isinstance(num, list):
-                num = np.array(num)
+                num = np.array(num, dtype=int)
             assert (0 <= num).all() and (num < self.num_cells).all()
-        return num // self.width, num % self.width
-
-    def index2num(self, i: IntOrArray, j: IntOrArray) -> IntOrArray:
+        index = []
+        for n in reversed(self.shape[1:]):
+            num, i = divmod(num, n)
+            index.append(i)
+        index.append(num)
+        return tuple(reversed(index))
+
+    def index2num(self, *index: IntOrArray) -> IntOrArray:
         """
-        2次元のインデックスを数字に変換する
+        盤面の次元数のインデックスを数字に変換する
 
         Args:
-            i (IntOrArray): 1次元目のインデックス
-            j (IntOrArray): 2次元目のインデックス
+            *index (IntOrArray): 各次元のインデックス
 
         Returns:
             IntOrArray: セルを表す数字
         """
-        if isinstance(i, int):
-            assert 0 <= i < self.height
-        else:
-            if isinstance(i, list):
-                i = np.array(i)
-            assert (0 <= i).all() and (i < self.height).all()
-        if isinstance(j, int):
-            assert 0 <= j < self.width
-        else:
-            if isinstance(j, list):
-                j = np.array(j)
-            assert (0 <= j).all() and (j < self.width).all()
-        return i * self.width + j
+        assert len(index) == len(self.shape)
+        num = 0
+        for i, n in zip(index, self.shape):
+            if isinstance(i, int):
+                assert 0 <= i < n
+            else:
+                if isinstance(i, list):
+                    i = np.array(i)
+                assert (0 <= i).all() and (i < n).all()
+            num = num * n + i
+        return num
 
     def is_selected(self, cell: Union[int, tuple]) -> bool:
         assert isinstance(cell, (int, tuple))
         if isinstance(cell, int):
-            idx = self.num2index(cell)
-        else:
-            idx = cell
-        return self.showing_board[idx] != NOT_SELECTED_NUM and self.showing_board[idx] != FLAG_NUM
+            assert 0 <= cell < self.num_cells
+            return bool(self.status.flat[cell] & OPENED_BIT)
+        return bool(self.status[cell] & OPENED_BIT)
 
     def get_surroundings(self, num: int) -> List[int]:
         """
-        周囲8方向のセルを表す数字を取得する。ただし、範囲外のものは含まれない。
+        周囲（2次元では8方向、3次元では26方向）のセルを表す数字を取得する。ただし、範囲外のものは含まれない。
 
         Args:
             num (int): セルを表す数字
 
         Returns:
-            List[int]: 周囲のセルを表す数字
+            List[int]: 周囲のセルを表す数字（自身も含む）
         """
-        diff = [-1, 0, 1]
         nums = []
-        i, j = self.num2index(num)
-        for dh in diff:
-            for dw in diff:
-                try:
-                    nums.append(self.index2num(i + dh, j + dw))
-                except AssertionError:
-                    continue
+        index = self.num2index(num)
+        for offset in itertools.product((-1, 0, 1), repeat=len(self.shape)):
+            neighbor = [i + d for i, d in zip(index, offset)]
+            if all(0 <= i < n for i, n in zip(neighbor, self.shape)):
+                nums.append(self.index2num(*neighbor))
         return nums
 
-    def initialize(self, num: int):
+    def initialize(self, num: int, rng: Optional[rnd.Random] = None):
         """
         選択した数字に応じてセルを初期化する。最初に選択した数字の周囲は地雷が設置されない。
 
         Args:
             num (int): 選択した数字
+            rng (Optional[rnd.Random], optional): 地雷の配置に使う乱数生成器。Noneのときはシードを決めて生成する
         """
+        if rng is None:
+            self.mine_seed = rnd.getrandbits(63)
+            rng = rnd.Random(self.mine_seed)
         # 選択したマスの周囲を除いて地雷の位置を決める
-        excluded_nums = self.get_surroundings(num)
+        excluded_nums = set(self.get_surroundings(num))
         candidates = [i for i in range(self.num_cells) if i not in excluded_nums]
-        mines_nums = rnd.sample(candidates, self.num_mines)
+        mines_nums = rng.sample(candidates, self.num_mines)
         self.actual_board[self.num2index(mines_nums)] = MINE_NUM
 
         # 周囲の地雷の数を数える
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.actual_board[i, j] == MINE_NUM:
-                    continue
-                surroundings = self.get_surroundings(self.index2num(i, j))
-                sum = 0
-                for n in surroundings:
-                    if self.actual_board[self.num2index(n)] == MINE_NUM:
-                        sum += 1
-                self.actual_board[i, j] = sum
+        is_mine = self.actual_board == MINE_NUM
+        self.actual_board = np.where(is_mine, MINE_NUM, count_neighbors(is_mine))
+        self.bbbv = self.compute_bbbv()
+        self.mark_mines()
+
+        self.is_initialized = True
+
+    def mark_mines(self):
+        """
+        各セルの状態に地雷のビットを設定する。地雷の配置より前に置かれた旗のうち、地雷に置かれたものも数える。
+        """
+        self.status |= np.where(self.actual_board == MINE_NUM, MINE_BIT, 0).astype(np.uint8)
+        self.num_correct_flags = int(np.count_nonzero(self.status == FLAG_BIT | MINE_BIT))
+
+    def compute_bbbv(self) -> int:
+        """
+        3BV（盤面を解くのに最低限必要なクリック数）を求める。
+        連鎖して開く領域の数と、どの領域にも接していない数字のセルの数の和となる。
+
+        Returns:
+            int: 3BV
+        """
+        is_mine = self.actual_board == MINE_NUM
+        zero = self.actual_board == 0
+        is_isolated = ~is_mine & ~zero & (count_neighbors(zero) == 0)
+        return count_labels(self.get_openings()) + int(np.count_nonzero(is_isolated))
+
+    def get_openings(self) -> np.ndarray:
+        """
+        連鎖して開く領域の番号を取得する。盤面ごとに一度だけ求める。
+
+        Returns:
+            np.ndarray: 領域の番号（label_openingsの結果）
+        """
+        if self.openings is None:
+            self.openings = label_openings(self.actual_board == 0)
+        return self.openings
+
+    def load_shared(self, seed: int):
+        """
+        シードから決まる盤面で始める。実際の盤面は同じシードの他のセッションと共有し、最初のセルを開けた状態にする。
 
+        Args:
+            seed (int): 盤面のシード
+        """
+        from .daily import get_shared_board
+
+        assert len(self.shape) == 2, "shared boards are only available for 2-D boards"
+        board = get_shared_board(seed, self.height, self.width, self.num_mines)
+        self.reset()
+        self.actual_board = board.actual_board
+        self.openings = board.openings
+        self.bbbv = board.bbbv
+        self.seed = seed
+        self.mark_mines()
         self.is_initialized = True
+        self.flood_fill([board.start])
+
+    def load_daily(self, day: str):
+        """
+        デイリーチャレンジの盤面で始める
+
+        Args:
+            day (str): 日付
+        """
+        from .daily import get_seed
+
+        self.load_shared(get_seed(day, self.height, self.width, self.num_mines))
+        self.daily = day
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # 領域の番号は実際の盤面から求め直せるため保存しない
+        state["openings"] = None
+        if self.seed is not None:
+            # 共有している盤面は保存せず、復元時に取得し直す
+            del state["actual_board"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if self.seed is not None:
+            from .daily import get_shared_board
+
+            board = get_shared_board(self.seed, self.height, self.width, self.num_mines)
+            self.actual_board = board.actual_board
+            self.openings = board.openings
 
     def open_cell(self, num: int) -> bool:
         """
@@ -177,23 +387,61 @@ class MineSweaper:
         else:
             if not self.is_initialized:
                 self.initialize(num)
-            q = deque([num])
-            while len(q) > 0:
-                n = q.pop()
-                idx = self.num2index(n)
-                if self.is_selected(idx):
-                    # 旗が置かれているか選択済みのときにスキップ
-                    continue
-                elif self.actual_board[idx] != MINE_NUM:
-                    self.showing_board[idx] = self.actual_board[idx]  # 表示値を更新
-                    self.num_selected_cells += 1  # 選択済みセルの数を更新
-                    if self.actual_board[idx] == 0:
-                        # 周囲のセルも開ける候補にする
-                        surroundings = self.get_surroundings(n)
-                        for s in surroundings:
-                            if not self.is_selected(s):
-                                q.append(s)
+            self.flood_fill([num])
+            return True
+
+    def flood_fill(self, nums: List[int]):
+        """
+        指定したセルから、周囲に地雷のないセルを連鎖的に開ける
+
+        Args:
+            nums (List[int]): 開け始めるセルを表す数字
+        """
+        for n in nums:
+            idx = self.num2index(n)
+            if self.status[idx] & (OPENED_BIT | MINE_BIT):
+                # 選択済みのときにスキップ
+                continue
+            elif self.actual_board[idx] != 0:
+                if self.status[idx] & FLAG_BIT:
+                    self.num_flags -= 1
+                self.status[idx] = OPENED_BIT
+                self.showing_board[idx] = self.actual_board[idx]  # 表示値を更新
+                self.num_selected_cells += 1  # 選択済みセルの数を更新
+                continue
+            # 連鎖する領域とその周囲の数字のセルをまとめて開ける（旗が置かれたセルも開ける）
+            openings = self.get_openings()
+            region = expand(openings == openings[idx])
+            region &= (self.status & OPENED_BIT) == 0
+            # 領域に地雷は含まれないため、外れる旗は全て誤った旗となる
+            self.num_flags -= int(np.count_nonzero(self.status[region] & FLAG_BIT))
+            self.status[region] = OPENED_BIT
+            self.showing_board[region] = self.actual_board[region]
+            self.num_selected_cells += int(np.count_nonzero(region))
+
+    def chord(self, num: int) -> bool:
+        """
+        開けられた数字のセルの周囲に、その数字と同じ数の旗が置かれているとき、旗のない周囲のセルをまとめて開ける
+
+        Args:
+            num (int): 選択した数字
+
+        Returns:
+            bool: 地雷を開けたときのみFalseを返す
+        """
+        idx = self.num2index(num)
+        if not self.is_selected(idx) or self.showing_board[idx] == 0:
+            return True
+        surroundings = self.get_surroundings(num)
+        status = self.status.flat
+        flags = [s for s in surroundings if status[s] & FLAG_BIT]
+        if len(flags) != self.showing_board[idx]:
             return True
+        targets = [s for s in surroundings if not status[s] & (OPENED_BIT | FLAG_BIT)]
+        if any(status[s] & MINE_BIT for s in targets):
+            return False
+        self.flood_fill(targets)
+        return True
 
     def is_all_selected(self) -> bool:
         """
@@ -204,6 +452,21 @@ class MineSweaper:
         """
         return self.num_selected_cells == self.num_remain_cells
 
+    def reveal_board(self) -> np.ndarray:
+        """
+        ゲームに失敗したときの表示用の盤面を取得する。
+        開けられていない地雷はNOT_SELECTED_MINE_NUM、誤って置かれた旗はFAILED_FLAG_NUMになる。
+
+        Returns:
+            np.ndarray: 表示用の盤面
+        """
+        is_mine = self.actual_board == MINE_NUM
+        return np.where(
+            is_mine & (self.showing_board == NOT_SELECTED_NUM),
+            NOT_SELECTED_MINE_NUM,
+            np.where(~is_mine & (self.showing_board == FLAG_NUM), FAILED_FLAG_NUM, self.showing_board),
+        )
+
     def put_or_unput_flag(self, num: int):
         """
         選択されたセルに旗を設置または排除する
@@ -212,10 +475,45 @@ class MineSweaper:
             num (int): 選択された数字
         """
         idx = self.num2index(num)
-        if self.showing_board[idx] == FLAG_NUM:
-            self.showing_board[idx] = NOT_SELECTED_NUM
-        elif self.showing_board[idx] == NOT_SELECTED_NUM:
-            self.showing_board[idx] = FLAG_NUM
+        status = self.status[idx]
+        if status & OPENED_BIT:
+            return
+        diff = -1 if status & FLAG_BIT else 1
+        self.status[idx] = status ^ FLAG_BIT
+        self.showing_board[idx] = FLAG_NUM if diff > 0 else NOT_SELECTED_NUM
+        self.num_flags += diff
+        if status & MINE_BIT:
+            self.num_correct_flags += diff
+
+    def restore(self, is_opened: np.ndarray, is_flag: np.ndarray):
+        """
+        開けたセルと旗のセルから、表示用の盤面と各セルの状態、数を復元する（数字は実際の盤面から求める）
+
+        Args:
+            is_opened (np.ndarray): 開けたセルがTrueの配列
+            is_flag (np.ndarray): 旗が置かれたセルがTrueの配列
+        """
+        is_opened = is_opened.reshape(self.shape)
+        is_flag = is_flag.reshape(self.shape)
+        is_mine = self.actual_board == MINE_NUM
+        self.showing_board = np.where(is_opened, self.actual_board, NOT_SELECTED_NUM)
+        self.showing_board[is_flag] = FLAG_NUM
+        self.status = (is_opened * OPENED_BIT | is_flag * FLAG_BIT | is_mine * MINE_BIT).astype(np.uint8)
+        self.num_selected_cells = int(np.count_nonzero(is_opened))
+        self.num_flags = int(np.count_nonzero(is_flag))
+        self.num_correct_flags = int(np.count_nonzero(is_flag & is_mine))
+
+
+class CubeMineSweaper(MineSweaper):
+    """
+    3次元の盤面のマインスイーパー。各セルの周囲26方向を数える。
+    """
+
+    depth: int
+
+    def __init__(self, depth: int, height: int, width: int, num_mines: int) -> None:
+        self.depth = depth
+        self.setup((depth, height, width), num_mines)
 
 
 if __name__ == "__main__":
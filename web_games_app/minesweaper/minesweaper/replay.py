@@ -0,0 +1,280 @@
+import asyncio
+import random as rnd
+import time
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+from .minesweaper import FLAG_BIT, NOT_SELECTED_NUM, OPENED_BIT, MineSweaper
+
+# 操作の種類
+OPEN_MOVE = 0
+CHORD_MOVE = 1
+FLAG_MOVE = 2
+# 何手ごとに盤面を保存するか
+CHECKPOINT_INTERVAL = 32
+
+
+class Move(NamedTuple):
+    # 最初の操作からの時間（センチ秒）
+    time: int
+    action: int
+    cell: int
+
+
+def apply_move(game: MineSweaper, action: int, cell: int) -> bool:
+    """
+    セルへの操作を盤面に反映する。プレイ中とリプレイで同じ処理を使い、結果が一致するようにする。
+
+    Args:
+        game (MineSweaper): 盤面
+        action (int): 操作の種類
+        cell (int): 操作するセル
+
+    Returns:
+        bool: 地雷を開けたときのみFalseを返す
+    """
+    if action == FLAG_MOVE:
+        game.put_or_unput_flag(cell)
+        return True
+    if action == CHORD_MOVE or game.is_selected(cell):
+        # 開けられた数字のセルをクリックしたときは周囲をまとめて開ける
+        return game.chord(cell)
+    return game.open_cell(cell)
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varints(data: bytes) -> Iterator[int]:
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            yield value
+            value = shift = 0
+
+
+def encode_moves(moves: List[Move]) -> bytes:
+    """
+    操作のログを圧縮する。各操作は前の操作からの時間と種類、セルの2つの可変長整数となる（多くは3-4バイト）。
+
+    Args:
+        moves (List[Move]): 操作のログ
+
+    Returns:
+        bytes: 圧縮したログ
+    """
+    out = bytearray()
+    prev = 0
+    for move in moves:
+        _write_varint(out, (move.time - prev) << 2 | move.action)
+        _write_varint(out, move.cell)
+        prev = move.time
+    return bytes(out)
+
+
+def decode_moves(data: bytes) -> List[Move]:
+    moves = []
+    values = _read_varints(data)
+    prev = 0
+    for head, cell in zip(values, values):
+        prev += head >> 2
+        moves.append(Move(prev, head & 3, cell))
+    return moves
+
+
+def pack_checkpoint(game: MineSweaper) -> bytes:
+    # 開けたセルと旗のセルのみを保存する（数字は実際の盤面から復元できる）
+    status = game.status.ravel()
+    return np.packbits((status & OPENED_BIT) != 0).tobytes() + np.packbits((status & FLAG_BIT) != 0).tobytes()
+
+
+def restore_checkpoint(game: MineSweaper, data: bytes):
+    size = len(data) // 2
+    is_opened = np.unpackbits(np.frombuffer(data[:size], dtype=np.uint8), count=game.num_cells).astype(bool)
+    is_flag = np.unpackbits(np.frombuffer(data[size:], dtype=np.uint8), count=game.num_cells).astype(bool)
+    game.restore(is_opened, is_flag)
+
+
+class Replayer:
+    """
+    盤面のシードと操作のログからゲームを再生する。
+    CHECKPOINT_INTERVAL手ごとの盤面を使い、任意の手数へ移動するときも直前の保存位置から進めるのみで済む。
+    """
+
+    game: MineSweaper
+    moves: List[Move]
+    # 反映した手数
+    position: int
+    # CHECKPOINT_INTERVAL * (i + 1)手を反映した後の盤面
+    checkpoints: List[bytes]
+
+    def __init__(
+        self,
+        height: int,
+        width: int,
+        num_mines: int,
+        seed: int,
+        shared: bool,
+        moves: bytes,
+        checkpoints: bytes = b"",
+    ) -> None:
+        self.game = MineSweaper(height, width, num_mines)
+        self.moves = decode_moves(moves)
+        size = 2 * -(-self.game.num_cells // 8)
+        self.checkpoints = [checkpoints[i : i + size] for i in range(0, len(checkpoints), size)]
+        if shared:
+            self.game.load_shared(seed)
+        else:
+            # 最初に開けたセルから盤面を生成する（プレイ中と同じ乱数の列になる）
+            first = next((move.cell for move in self.moves if move.action == OPEN_MOVE), None)
+            if first is not None:
+                self.game.initialize(first, rnd.Random(seed))
+                self.game.mine_seed = seed
+        # 盤面の生成は一度のみとし、最初に戻すときは開始時の盤面を復元する
+        self._start = pack_checkpoint(self.game)
+        self.position = 0
+
+    def reset(self):
+        """
+        最初の操作の前に戻す
+        """
+        restore_checkpoint(self.game, self._start)
+        self.position = 0
+
+    def step(self) -> bool:
+        """
+        1手進める
+
+        Returns:
+            bool: 地雷を開けたときのみFalseを返す
+        """
+        move = self.moves[self.position]
+        self.position += 1
+        return apply_move(self.game, move.action, move.cell)
+
+    def seek(self, position: int):
+        """
+        指定した手数まで反映した盤面にする
+
+        Args:
+            position (int): 手数
+        """
+        position = max(0, min(position, len(self.moves)))
+        index = min(position // CHECKPOINT_INTERVAL, len(self.checkpoints)) - 1
+        if position < self.position or (index >= 0 and (index + 1) * CHECKPOINT_INTERVAL > self.position):
+            # 直前の保存位置（なければ最初）から進める
+            self.reset()
+            if index >= 0:
+                restore_checkpoint(self.game, self.checkpoints[index])
+                self.position = (index + 1) * CHECKPOINT_INTERVAL
+        while self.position < position:
+            self.step()
+
+    def make_checkpoints(self) -> bytes:
+        """
+        最初から再生して、保存する盤面を作る
+
+        Returns:
+            bytes: 保存する盤面を連結したもの
+        """
+        self.reset()
+        checkpoints = []
+        while self.position < len(self.moves):
+            self.step()
+            if self.position % CHECKPOINT_INTERVAL == 0:
+                checkpoints.append(pack_checkpoint(self.game))
+        self.checkpoints = checkpoints
+        return b"".join(checkpoints)
+
+    def time_at(self, position: int) -> int:
+        # 指定した手数を反映した時点の時間（センチ秒）
+        return self.moves[position - 1].time if position > 0 else 0
+
+
+async def playback(moves: List[Move], start: int, speed: float = 1.0) -> AsyncIterator[int]:
+    """
+    操作を記録された間隔で順に返す。盤面は作らず、次に反映する手の番号のみを返す。
+
+    Args:
+        moves (List[Move]): 操作のログ
+        start (int): 再生を始める手数
+        speed (float, optional): 再生速度の倍率
+
+    Yields:
+        int: 反映する手の番号
+    """
+    origin = time.monotonic()
+    base = moves[start - 1].time if start > 0 else 0
+    for i in range(start, len(moves)):
+        delay = (moves[i].time - base) / 100 / speed - (time.monotonic() - origin)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield i
+
+
+class MoveRecorder:
+    """
+    プレイ中の操作を記録する
+    """
+
+    moves: List[Move]
+    started_at: Optional[float]
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self):
+        self.moves = []
+        self.started_at = None
+
+    def record(self, action: int, cell: int):
+        now = time.monotonic()
+        if self.started_at is None:
+            self.started_at = now
+        self.moves.append(Move(int((now - self.started_at) * 100), action, cell))
+
+
+if __name__ == "__main__":
+    # 上級の盤面を解いたログで、移動にかかる時間を保存位置の有無で比べる
+    rng = rnd.Random(0)
+    game = MineSweaper(20, 24, 99)
+    recorder = MoveRecorder()
+    while True:
+        closed = [
+            n
+            for n in range(game.num_cells)
+            if game.showing_board.ravel()[n] == NOT_SELECTED_NUM and game.actual_board.ravel()[n] != -1
+        ]
+        if not closed or (game.is_initialized and game.is_all_selected()):
+            break
+        cell = rng.choice(closed)
+        recorder.record(OPEN_MOVE, cell)
+        apply_move(game, OPEN_MOVE, cell)
+        mines = np.flatnonzero(game.actual_board.ravel() == -1)
+        flag = int(rng.choice(mines))
+        recorder.record(FLAG_MOVE, flag)
+        apply_move(game, FLAG_MOVE, flag)
+    data = encode_moves(recorder.moves)
+    assert decode_moves(data) == recorder.moves
+    print(f"{len(recorder.moves)} moves -> {len(data)} bytes")
+
+    replayer = Replayer(20, 24, 99, game.mine_seed, False, data)
+    checkpoints = replayer.make_checkpoints()
+    assert (replayer.game.showing_board == game.showing_board).all()
+    print(f"{len(replayer.checkpoints)} checkpoints -> {len(checkpoints)} bytes")
+    for name, blob in [("without checkpoints", b""), ("with checkpoints", checkpoints)]:
+        replayer = Replayer(20, 24, 99, game.mine_seed, False, data, blob)
+        start = time.perf_counter()
+        for _ in range(20):
+            replayer.seek(0)
+            replayer.seek(len(replayer.moves))
+        elapsed = (time.perf_counter() - start) / 20
+        assert (replayer.game.showing_board == game.showing_board).all()
+        print(f"seek to end {name}: {elapsed * 1000:.2f} ms")
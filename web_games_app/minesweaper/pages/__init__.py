@@ -1,11 +1,20 @@
+from .cube_minesweaper import cube_ms_page
 from .custom import custom_ms_page
+from .huge_minesweaper import huge_ms_page
 from .index import ms_index
 from .minesweaper import ms_page
+from .race import ms_race_page, serve_races
 from .record import ms_records
+from .replay import ms_replay
 
 __all__ = [
     "ms_index",
     "ms_page",
     "custom_ms_page",
+    "cube_ms_page",
+    "huge_ms_page",
+    "ms_race_page",
+    "serve_races",
     "ms_records",
+    "ms_replay",
 ]
@@ -0,0 +1,204 @@
+from typing import Dict, List, Tuple
+
+import reflex as rx
+
+from ...metrics import instrument, measure
+from ...sessions import EvictableMixin
+from ...style import RESULT_TOAST, THEME_BORDER
+from ...templates.minesweaper import ms_icon, ms_pages
+from ...timers import TimerMixin
+from ..minesweaper.minesweaper import CubeMineSweaper
+from .minesweaper import encode_board, get_background_color, get_box_content, get_hover_color
+
+BOX_SIZE = 30
+# 各層を縦に縮める割合（数字が読めるように三目並べより大きくする）
+SCALE = 0.5
+MARGIN = 5
+# 一辺の長さ -> 地雷の数
+SIZES: Dict[str, int] = {"4": 6, "6": 25, "8": 60, "10": 120}
+DEFAULT_SIZE = "4"
+
+
+def layer_style(size: int) -> Tuple[str, str, str]:
+    """
+    tictactoe.cssで層を重ねて表示するための値を求める
+
+    Args:
+        size (int): 一辺の長さ
+
+    Returns:
+        Tuple[str, str, str]: 全体の高さ、各層のずれ、層の間隔
+    """
+    height = BOX_SIZE * size**2 * SCALE + MARGIN * (size - 1)
+    offset = -BOX_SIZE * size * (1 - SCALE) / 2
+    trans_y = -BOX_SIZE * size * (1 - SCALE) + MARGIN
+    return f"{height}px", f"{offset}px", f"{trans_y}px"
+
+
+class CubeMineSweaperState(EvictableMixin, TimerMixin, rx.State):
+    size: int = int(DEFAULT_SIZE)
+    num_mines: int = SIZES[DEFAULT_SIZE]
+    _game: CubeMineSweaper = CubeMineSweaper(size, size, size, num_mines)
+    # 層ごとにCELL_CODEで表した盤面
+    coded_board: List[str] = []
+    _is_game_end: bool = False
+    num_flags: int = 0
+
+    # ** リセットなどの関数 **
+    def _on_evict(self):
+        self._unschedule_timer()
+
+    def _on_rehydrate(self):
+        self._sync_clock()
+
+    def on_load(self):
+        self._sync_clock()
+        self.apply_game_state()
+
+    def reset_board(self):
+        self._game.reset()
+        self.apply_game_state()
+        self._is_game_end = False
+        self._reset_clock()
+
+    def change_size(self, size: str):
+        self.size = int(size)
+        self.num_mines = SIZES[size]
+        self._game = CubeMineSweaper(self.size, self.size, self.size, self.num_mines)
+        self.reset_board()
+
+    @instrument
+    def apply_game_state(self, is_fail: bool = False):
+        board = self._game.reveal_board() if is_fail else self._game.showing_board
+        self.coded_board = [encode_board(layer) for layer in board]
+        self.num_flags = self._game.num_flags
+
+    @rx.var(cache=True)
+    def cube_height(self) -> str:
+        return layer_style(self.size)[0]
+
+    @rx.var(cache=True)
+    def panel_offset(self) -> str:
+        return layer_style(self.size)[1]
+
+    @rx.var(cache=True)
+    def panel_trans_y(self) -> str:
+        return layer_style(self.size)[2]
+
+    # ** マウスイベントに関する関数 **
+    @instrument
+    def open_cell(self, index: int):
+        if self._is_game_end:
+            return
+        self._start_clock()
+        with measure("engine"):
+            if self._game.is_selected(index):
+                # 開けられた数字のセルをクリックしたときは周囲をまとめて開ける
+                is_not_fail = self._game.chord(index)
+            else:
+                is_not_fail = self._game.open_cell(index)
+        if not is_not_fail or self._game.is_all_selected():
+            self._is_game_end = True
+            self._stop_clock()
+        self.apply_game_state(not is_not_fail)
+        if not is_not_fail:
+            return rx.toast.error("You failed...", **RESULT_TOAST)
+        elif self._game.is_all_selected():
+            return rx.toast.success("You succeeded!!", **RESULT_TOAST)
+
+    @instrument
+    def put_or_unput_flag(self, index: int):
+        if not self._is_game_end:
+            self._game.put_or_unput_flag(index)
+            self.apply_game_state()
+
+
+def setting():
+    return rx.hstack(
+        rx.vstack(
+            rx.text("Board Size"),
+            rx.select(
+                list(SIZES),
+                default_value=DEFAULT_SIZE,
+                on_change=lambda value: CubeMineSweaperState.change_size(value),
+                width="100%",
+                position="popper",
+            ),
+            align="center",
+            spacing="0",
+        ),
+        rx.button("Reset", on_click=CubeMineSweaperState.reset_board()),
+        align="end",
+    )
+
+
+def display_info():
+    return rx.hstack(
+        rx.hstack(
+            ms_icon("flag", 30),
+            rx.text(
+                f"{CubeMineSweaperState.num_flags} / {CubeMineSweaperState.num_mines}",
+                font_family="Instrument Sans",
+                size="4",
+                weight="medium",
+            ),
+            align="center",
+            spacing="1",
+        ),
+        rx.hstack(
+            ms_icon("clock", 30),
+            rx.text(
+                CubeMineSweaperState.display_elapsed_time, font_family="Instrument Sans", size="4", weight="medium"
+            ),
+            align="center",
+            spacing="1",
+        ),
+        align="center",
+    )
+
+
+def render_box(state: str, layer: int, index: int):
+    num = CubeMineSweaperState.size**2 * layer + index
+    return rx.box(
+        rx.center(get_box_content(state)),
+        bg=get_background_color(state),
+        width=f"{BOX_SIZE}px",
+        height=f"{BOX_SIZE}px",
+        border=THEME_BORDER,
+        on_click=CubeMineSweaperState.open_cell(num),
+        on_context_menu=CubeMineSweaperState.put_or_unput_flag(num).prevent_default,
+        _hover={"bg": get_hover_color(state)},
+        text_align="center",
+    )
+
+
+def display_layer(layer_cells: str, layer: int):
+    return rx.grid(
+        rx.foreach(layer_cells.split(""), lambda state, index: render_box(state, layer, index)),
+        columns=CubeMineSweaperState.size.to_string(),
+        border=THEME_BORDER,
+        justify="center",
+        class_name="panel",
+        style={
+            "--num": layer,
+            "--scale": SCALE,
+            "--offset": CubeMineSweaperState.panel_offset,
+            "--trans-y": CubeMineSweaperState.panel_trans_y,
+        },
+    )
+
+
+def display_board():
+    # 三目並べの立体盤面と同じく、傾けた層を重ねて表示する
+    return rx.vstack(
+        rx.foreach(CubeMineSweaperState.coded_board, lambda layer_cells, layer: display_layer(layer_cells, layer)),
+        spacing="0",
+        class_name="cube",
+        style={"--height": CubeMineSweaperState.cube_height},
+    )
+
+
+@rx.page(route="/minesweaper/3d", title="Play Cube Mine Sweaper", on_load=CubeMineSweaperState.on_load())
+@ms_pages(head_text="Cube Mine Sweaper")
+def cube_ms_page() -> List[rx.Component]:
+    return [setting(), display_info(), display_board()]
@@ -3,7 +3,8 @@ from typing import Dict, List
 import reflex as rx
 
 from ...templates.minesweaper import ms_pages
-from .minesweaper import MineSweaperState
+from .huge_minesweaper import MAX_HUGE_HEIGHT, MAX_HUGE_WIDTH, huge_url
+from .minesweaper import MAX_HEIGHT, MAX_WIDTH, MineSweaperState
 
 KEY = ["height", "width", "num_mines"]
 DEFAULT_STATE = {
@@ -20,9 +21,10 @@ class CustomMSState(rx.State):
         "width": 5,
         "num_mines": int(state["height"] * state["width"] * 0.1),
     }
+    # MAX_HEIGHT, MAX_WIDTHを超える盤面は表示範囲のみを送る大きな盤面のページで遊ぶ
     max_state: Dict[str, int] = {
-        "height": 99,
-        "width": 35,
+        "height": MAX_HUGE_HEIGHT,
+        "width": MAX_HUGE_WIDTH,
         "num_mines": int(state["height"] * state["width"] * 0.8),
     }
     TEXT: Dict[str, str] = {
@@ -33,6 +35,16 @@ class CustomMSState(rx.State):
 
     def reset_state(self):
         self.state = DEFAULT_STATE.copy()
+        self._update_num_mines()
+
+    def _update_num_mines(self):
+        # 地雷の数の範囲を盤面の大きさに合わせる
+        num_cells = self.state["height"] * self.state["width"]
+        self.min_state["num_mines"] = int(num_cells * 0.1)
+        self.max_state["num_mines"] = int(num_cells * 0.8)
+        self.state["num_mines"] = max(
+            self.min_state["num_mines"], min(self.state["num_mines"], self.max_state["num_mines"])
+        )
 
     def change_state(self, key: str, value: str):
         if not value == "":
@@ -42,14 +54,19 @@ class CustomMSState(rx.State):
         if value == "":
             self.state[key] = 0
         self.state[key] = max(self.min_state[key], min(self.state[key], self.max_state[key]))
+        self._update_num_mines()
 
     def increment(self, key: str):
         self.state[key] = min(self.state[key] + 1, self.max_state[key])
+        self._update_num_mines()
 
     def decrement(self, key: str):
         self.state[key] = max(self.state[key] - 1, self.min_state[key])
+        self._update_num_mines()
 
     def apply_state(self):
+        if self.state["height"] > MAX_HEIGHT or self.state["width"] > MAX_WIDTH:
+            return rx.redirect(huge_url(self.state["height"], self.state["width"], self.state["num_mines"]))
         return [
             MineSweaperState.set_state(self.state["height"], self.state["width"], self.state["num_mines"]),
             rx.redirect("/minesweaper/play"),
@@ -64,7 +81,7 @@ def render_input(key: str):
             default_value=CustomMSState.state[key].to_string(),
             on_change=CustomMSState.change_state(key),
             on_blur=CustomMSState.clip_state(key),
-            width="35px",
+            width="45px",
         ),
         rx.button(
             "-",
@@ -0,0 +1,231 @@
+from typing import Dict, List, Tuple
+
+import reflex as rx
+
+from ...metrics import instrument, measure
+from ...sessions import EvictableMixin
+from ...style import RESULT_TOAST, THEME_BORDER
+from ...templates.minesweaper import ms_icon, ms_pages
+from ...timers import TimerMixin
+from ..minesweaper.lazy_minesweaper import LazyMineSweaper
+from .minesweaper import BOX_SIZE, encode_board, get_background_color, get_box_content, get_hover_color, parse_settings
+
+# LazyMineSweaperで遊べる盤面の上限。表示と送信は表示範囲のみのため、盤面の大きさによらない
+MAX_HUGE_HEIGHT = 1000
+MAX_HUGE_WIDTH = 1000
+# 一度に表示する範囲（セル）
+VIEW_HEIGHT = 16
+VIEW_WIDTH = 30
+# 名前 -> 高さ、幅、地雷の数
+SIZES: Dict[str, Tuple[int, int, int]] = {
+    "100 x 100": (100, 100, 1800),
+    "300 x 300": (300, 300, 16000),
+    "1000 x 1000": (1000, 1000, 180000),
+}
+DEFAULT_SIZE = "100 x 100"
+
+
+def huge_url(height: int, width: int, num_mines: int) -> str:
+    """
+    大きな盤面のゲームを始めるURLを作る
+
+    Args:
+        height (int): 盤面の高さ
+        width (int): 盤面の幅
+        num_mines (int): 地雷の数
+
+    Returns:
+        str: URL
+    """
+    return f"/minesweaper/huge?height={height}&width={width}&num_mines={num_mines}"
+
+
+class HugeMineSweaperState(EvictableMixin, TimerMixin, rx.State):
+    height: int = SIZES[DEFAULT_SIZE][0]
+    width: int = SIZES[DEFAULT_SIZE][1]
+    num_mines: int = SIZES[DEFAULT_SIZE][2]
+    _game: LazyMineSweaper = LazyMineSweaper(height, width, num_mines)
+    # 表示範囲の左上のセル（盤面の中央から表示する）
+    top: int = max(0, (height - VIEW_HEIGHT) // 2)
+    left: int = max(0, (width - VIEW_WIDTH) // 2)
+    # CELL_CODEで表した表示範囲の盤面
+    coded_view: str = ""
+    view_width: int = VIEW_WIDTH
+    _is_game_end: bool = False
+    _is_failed: bool = False
+    num_flags: int = 0
+
+    # ** リセットなどの関数 **
+    def _on_evict(self):
+        self._unschedule_timer()
+
+    def _on_rehydrate(self):
+        self._sync_clock()
+
+    def on_load(self):
+        settings = parse_settings(self.router.page.params, MAX_HUGE_HEIGHT, MAX_HUGE_WIDTH)
+        if settings is not None and settings[:3] != (self.height, self.width, self.num_mines):
+            self.set_state(*settings[:3])
+        self._sync_clock()
+        self.apply_view()
+
+    def reset_board(self):
+        self._game.reset()
+        self._is_game_end = False
+        self._is_failed = False
+        self._reset_clock()
+        self.apply_view()
+
+    def set_state(self, height: int, width: int, num_mines: int):
+        self.height = height
+        self.width = width
+        self.num_mines = num_mines
+        self._game = LazyMineSweaper(height, width, num_mines)
+        self.top = max(0, (height - VIEW_HEIGHT) // 2)
+        self.left = max(0, (width - VIEW_WIDTH) // 2)
+        self.reset_board()
+
+    def change_size(self, size: str):
+        self.set_state(*SIZES[size])
+
+    @instrument
+    def apply_view(self):
+        # 送信するのは表示範囲のみとする
+        args = (self.top, self.left, VIEW_HEIGHT, VIEW_WIDTH)
+        view = self._game.reveal_view(*args) if self._is_failed else self._game.get_view(*args)
+        self.coded_view = encode_board(view)
+        self.view_width = view.shape[1]
+        self.num_flags = self._game.num_flags
+
+    def move_view(self, di: int, dj: int):
+        """
+        表示範囲を半分ずつずらす
+
+        Args:
+            di (int): 行方向の向き
+            dj (int): 列方向の向き
+        """
+        self.top = max(0, min(self.top + di * (VIEW_HEIGHT // 2), self.height - VIEW_HEIGHT))
+        self.left = max(0, min(self.left + dj * (VIEW_WIDTH // 2), self.width - VIEW_WIDTH))
+        self.apply_view()
+
+    # ** マウスイベントに関する関数 **
+    def _to_num(self, index: int) -> int:
+        # 表示範囲のセルの番号を、盤面全体のセルの番号に変換する
+        i, j = divmod(index, self.view_width)
+        return self._game.index2num(self.top + i, self.left + j)
+
+    @instrument
+    def open_cell(self, index: int):
+        if self._is_game_end:
+            return
+        self._start_clock()
+        with measure("engine"):
+            is_not_fail = self._game.open_cell(self._to_num(index))
+        if not is_not_fail or self._game.is_all_selected():
+            self._is_game_end = True
+            self._is_failed = not is_not_fail
+            self._stop_clock()
+        self.apply_view()
+        if not is_not_fail:
+            return rx.toast.error("You failed...", **RESULT_TOAST)
+        elif self._game.is_all_selected():
+            return rx.toast.success("You succeeded!!", **RESULT_TOAST)
+
+    @instrument
+    def put_or_unput_flag(self, index: int):
+        if not self._is_game_end:
+            self._game.put_or_unput_flag(self._to_num(index))
+            self.apply_view()
+
+
+def setting():
+    return rx.hstack(
+        rx.vstack(
+            rx.text("Board Size"),
+            rx.select(
+                list(SIZES),
+                default_value=DEFAULT_SIZE,
+                on_change=lambda value: HugeMineSweaperState.change_size(value),
+                width="100%",
+                position="popper",
+            ),
+            align="center",
+            spacing="0",
+        ),
+        rx.button("Reset", on_click=HugeMineSweaperState.reset_board()),
+        align="end",
+    )
+
+
+def display_info():
+    return rx.hstack(
+        rx.hstack(
+            ms_icon("flag", 30),
+            rx.text(
+                f"{HugeMineSweaperState.num_flags} / {HugeMineSweaperState.num_mines}",
+                font_family="Instrument Sans",
+                size="4",
+                weight="medium",
+            ),
+            align="center",
+            spacing="1",
+        ),
+        rx.hstack(
+            ms_icon("clock", 30),
+            rx.text(
+                HugeMineSweaperState.display_elapsed_time, font_family="Instrument Sans", size="4", weight="medium"
+            ),
+            align="center",
+            spacing="1",
+        ),
+        rx.text(
+            f"Row {HugeMineSweaperState.top + 1}, Column {HugeMineSweaperState.left + 1} "
+            f"of {HugeMineSweaperState.height} x {HugeMineSweaperState.width}"
+        ),
+        align="center",
+    )
+
+
+def render_box(state: str, index: int):
+    return rx.box(
+        rx.center(get_box_content(state)),
+        bg=get_background_color(state),
+        width=f"{BOX_SIZE}px",
+        height=f"{BOX_SIZE}px",
+        border=THEME_BORDER,
+        on_click=HugeMineSweaperState.open_cell(index),
+        on_context_menu=HugeMineSweaperState.put_or_unput_flag(index).prevent_default,
+        _hover={"bg": get_hover_color(state)},
+        text_align="center",
+    )
+
+
+def move_button(text: str, di: int, dj: int):
+    return rx.button(text, on_click=HugeMineSweaperState.move_view(di, dj), variant="soft", size="1")
+
+
+def display_board():
+    # 盤面のうち表示範囲のみを描画し、上下左右のボタンで動かす
+    return rx.vstack(
+        move_button("↑", -1, 0),
+        rx.hstack(
+            move_button("←", 0, -1),
+            rx.grid(
+                rx.foreach(HugeMineSweaperState.coded_view.split(""), lambda state, index: render_box(state, index)),
+                columns=HugeMineSweaperState.view_width.to_string(),
+                border=THEME_BORDER,
+                justify="center",
+            ),
+            move_button("→", 0, 1),
+            align="center",
+        ),
+        move_button("↓", 1, 0),
+        align="center",
+    )
+
+
+@rx.page(route="/minesweaper/huge", title="Play Huge Mine Sweaper", on_load=HugeMineSweaperState.on_load())
+@ms_pages(head_text="Huge Mine Sweaper")
+def huge_ms_page() -> List[rx.Component]:
+    return [setting(), display_info(), display_board()]
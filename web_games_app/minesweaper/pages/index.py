@@ -4,11 +4,12 @@ import reflex as rx
 
 from ...style import BOX_STYLE
 from ...templates.minesweaper import ms_pages
-from .minesweaper import MineSweaperState
+from .minesweaper import play_url
 
 CUSTOM_BOX_STYLE = BOX_STYLE.copy()
 CUSTOM_BOX_STYLE.update({"padding": "0em"})
 COMPONENT_WIDTH = "200px"
+DIFFICULTIES = [("Beginner", 8, 10, 10), ("Intermediate", 14, 18, 40), ("Expert", 20, 24, 99)]
 
 
 def difficulty_component(text: str, height: int, width: int, num_mines: int):
@@ -20,7 +21,34 @@ def difficulty_component(text: str, height: int, width: int, num_mines: int):
             align="center",
             spacing="0",
         ),
-        on_click=[MineSweaperState.set_state(height, width, num_mines), rx.redirect("/minesweaper/play")],
+        on_click=rx.redirect(play_url(height, width, num_mines)),
+        style=CUSTOM_BOX_STYLE,
+        width=COMPONENT_WIDTH,
+    )
+
+
+def daily_component():
+    # 日付ごとに全プレイヤーで同じ盤面を遊ぶ
+    return rx.box(
+        rx.vstack(
+            rx.text("Daily Challenge", weight="bold"),
+            rx.hstack(
+                *[
+                    rx.button(
+                        text,
+                        size="1",
+                        variant="soft",
+                        on_click=rx.redirect(play_url(height, width, num_mines, True)),
+                    )
+                    for text, height, width, num_mines in DIFFICULTIES
+                ],
+                spacing="1",
+                wrap="wrap",
+                justify="center",
+            ),
+            align="center",
+            spacing="1",
+        ),
         style=CUSTOM_BOX_STYLE,
         width=COMPONENT_WIDTH,
     )
@@ -36,6 +64,36 @@ def custom_component():
     )
 
 
+def cube_component():
+    return rx.box(
+        rx.text("\nCube\n\n", weight="bold", white_space="pre"),
+        on_click=rx.redirect("/minesweaper/3d"),
+        style=CUSTOM_BOX_STYLE,
+        width=COMPONENT_WIDTH,
+        text_align="center",
+    )
+
+
+def huge_component():
+    return rx.box(
+        rx.text("\nHuge\n\n", weight="bold", white_space="pre"),
+        on_click=rx.redirect("/minesweaper/huge"),
+        style=CUSTOM_BOX_STYLE,
+        width=COMPONENT_WIDTH,
+        text_align="center",
+    )
+
+
+def race_component():
+    return rx.box(
+        rx.text("\nRace\n\n", weight="bold", white_space="pre"),
+        on_click=rx.redirect("/minesweaper/race"),
+        style=CUSTOM_BOX_STYLE,
+        width=COMPONENT_WIDTH,
+        text_align="center",
+    )
+
+
 def record_component():
     return rx.box(
         rx.text("\nRecords\n\n", weight="bold", white_space="pre"),
@@ -51,10 +109,12 @@ def record_component():
 def ms_index() -> List[rx.Component]:
     return [
         rx.vstack(
-            difficulty_component("Beginner", 8, 10, 10),
-            difficulty_component("Intermediate", 14, 18, 40),
-            difficulty_component("Expert", 20, 24, 99),
+            *[difficulty_component(*difficulty) for difficulty in DIFFICULTIES],
+            daily_component(),
             custom_component(),
+            cube_component(),
+            huge_component(),
+            race_component(),
             record_component(),
             align="center",
         )
@@ -1,159 +1,357 @@
-import asyncio
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import reflex as rx
+import sqlalchemy as sa
 
+from ...database import asession
+from ...metrics import instrument, measure
+from ...sessions import EvictableMixin
 from ...style import RESULT_TOAST, THEME_BORDER, THEME_BORDER_DOUBLE
-from ...templates.minesweaper import ms_pages
+from ...templates.minesweaper import ms_icon, ms_pages
+from ...timers import TimerMixin
+from ..minesweaper.daily import today
 from ..minesweaper.minesweaper import (
+    FAILED_FLAG_NUM,
     FLAG_NUM,
     MINE_NUM,
+    NOT_SELECTED_MINE_NUM,
     NOT_SELECTED_NUM,
     MineSweaper,
-    check_state_num,
 )
-from .record import MSRecord, MSRecordState, to_state
-
-NOT_SELECTED_MINE_NUM = -10
-FAILED_FLAG_NUM = -11
-assert check_state_num(NOT_SELECTED_MINE_NUM), f"NOT_SELECTED_MINE_NUM (={NOT_SELECTED_MINE_NUM}) is invalid number"
-assert check_state_num(FAILED_FLAG_NUM), f"FAILED_FLAG_NUM (={FAILED_FLAG_NUM}) is invalid number"
-s = [MINE_NUM, FLAG_NUM, NOT_SELECTED_NUM, NOT_SELECTED_MINE_NUM, FAILED_FLAG_NUM]
-assert len(set(s)) == len(s), (
-    f"MINE_NUM (={MINE_NUM}), FLAG_NUM (={FLAG_NUM})"
-    f", NOT_SELECTED_NUM (={NOT_SELECTED_NUM}), NOT_SELECTED_MINE_NUM (={NOT_SELECTED_MINE_NUM})"
-    f" and FAILED_FLAG_NUM (={FAILED_FLAG_NUM}) must be differnt"
+from ..minesweaper.replay import FLAG_MOVE, OPEN_MOVE, MoveRecorder, Replayer, apply_move, encode_moves
+from .record import (
+    MAX_RECORD,
+    ORDER_BY,
+    MSRecord,
+    MSRecordState,
+    MSReplay,
+    add_stats,
+    load_stats,
+    to_bbbv_per_sec,
+    to_daily_state,
+    to_signed64,
+    to_state,
 )
-del s
 
 BOX_SIZE = 25
-
-
-class MineSweaperState(rx.State):
+MAX_HEIGHT = 99
+MAX_WIDTH = 35
+# 盤面を何行ごとのチャンクに分割して描画するか
+CHUNK_ROWS = 4
+NUM_CHUNKS = -(-MAX_HEIGHT // CHUNK_ROWS)
+# キューに溜めるセルへの操作（リプレイのログと同じ値）
+OPEN_ACTION = OPEN_MOVE
+FLAG_ACTION = FLAG_MOVE
+
+# 盤面を1セル1文字の文字列で送るための符号
+CELL_CODE = {
+    MINE_NUM: "*",
+    FLAG_NUM: "F",
+    NOT_SELECTED_NUM: ".",
+    NOT_SELECTED_MINE_NUM: "M",
+    FAILED_FLAG_NUM: "X",
+    **{n: str(n) for n in range(9)},
+}
+_MIN_CELL_NUM = min(CELL_CODE)
+_CELL_CODE_TABLE = np.zeros(max(CELL_CODE) - _MIN_CELL_NUM + 1, dtype=np.uint8)
+for num, code in CELL_CODE.items():
+    _CELL_CODE_TABLE[num - _MIN_CELL_NUM] = ord(code)
+del num, code
+
+
+def encode_board(board: np.ndarray) -> str:
+    """
+    盤面を1セル1文字の文字列に変換する
+
+    Args:
+        board (np.ndarray): 表示用の盤面
+
+    Returns:
+        str: 各セルをCELL_CODEで表した文字列
+    """
+    return _CELL_CODE_TABLE[board.ravel() - _MIN_CELL_NUM].tobytes().decode("ascii")
+
+
+def play_url(height: int, width: int, num_mines: int, daily: bool = False) -> str:
+    """
+    難易度を指定してゲームを始めるURLを作る。状態を使わずに遷移できるため、静的なメニューからも使える。
+
+    Args:
+        height (int): 盤面の高さ
+        width (int): 盤面の幅
+        num_mines (int): 地雷の数
+        daily (bool, optional): デイリーチャレンジか
+
+    Returns:
+        str: URL
+    """
+    url = f"/minesweaper/play?height={height}&width={width}&num_mines={num_mines}"
+    return url + "&daily=1" if daily else url
+
+
+def parse_settings(
+    params: Dict[str, str], max_height: int = MAX_HEIGHT, max_width: int = MAX_WIDTH
+) -> Optional[Tuple[int, int, int, bool]]:
+    """
+    play_urlで指定された難易度を読み取る
+
+    Args:
+        params (Dict[str, str]): URLのクエリ
+        max_height (int, optional): 盤面の高さの上限
+        max_width (int, optional): 盤面の幅の上限
+
+    Returns:
+        Optional[Tuple[int, int, int, bool]]: 高さ、幅、地雷の数、デイリーチャレンジか。指定がないときや範囲外のときはNone
+    """
+    try:
+        height, width, num_mines = (int(params[key]) for key in ("height", "width", "num_mines"))
+    except (KeyError, TypeError, ValueError):
+        return None
+    # 最初に開けたセルの周囲（最大9セル）には地雷を置かないため、残りのセルに収まる数までとする
+    if not (1 <= height <= max_height and 1 <= width <= max_width and 0 <= num_mines <= height * width - 9):
+        return None
+    return height, width, num_mines, params.get("daily") == "1"
+
+
+class MSBoardChunkMixin(rx.State, mixin=True):
+    # CELL_CODEで表した盤面
+    cells: str = ""
+    offset: int = 0
+    width: int = 0
+
+
+# チャンクごとに状態を分けることで、変更されたチャンクのみが送信・再描画される
+BOARD_CHUNK_STATES = [
+    type(f"MSBoardChunk{i}State", (MSBoardChunkMixin, rx.State), {"__module__": __name__}) for i in range(NUM_CHUNKS)
+]
+# 状態の永続化（pickle）でクラスを名前から参照できるように、モジュールに登録する
+globals().update((chunk.__name__, chunk) for chunk in BOARD_CHUNK_STATES)
+
+
+class MineSweaperState(EvictableMixin, TimerMixin, rx.State):
+    ENGINE_VARS = ("_game", "_sent_board")
     height: int = 8
     width: int = 10
     num_mines: int = 10
     _game: MineSweaper = MineSweaper(height, width, num_mines)
-    showing_board: List[int]
-    focused_idx: int = -1
+    # 最後にチャンクへ反映した盤面
+    _sent_board: Optional[np.ndarray] = None
     _is_game_end: bool = False
     num_flags: int = 0
-    elapsed_time: int = 0
-    _is_running: bool = False
+    best_time: int = 0
+    beaten_percent: int = 0
+    bbbv: int = 0
+    bbbv_per_sec: float = 0.0
+    # デイリーチャレンジの日付（通常の盤面のときは空文字）
+    daily: str = ""
+    # 記録済みのデイリーチャレンジの日付。記録するのは各日の最初の1回のみ
+    _daily_played: str = ""
     posing: bool = False
     is_popup: bool = False
+    # まだ盤面に反映していないセルへの操作
+    _pending_actions: List[Tuple[int, int]] = []
+    _is_drain_scheduled: bool = False
+    # 盤面に反映した操作のログ（上位の記録のリプレイとして保存する）
+    _recorder: MoveRecorder = MoveRecorder()
 
     # ** リセットなどの関数 **
-    def on_load(self):
-        self.apply_game_state()
-
-    def reset_board(self):
-        self._game.reset()
-        self.apply_game_state()
+    def _on_evict(self):
+        # 放置されたゲームの経過時間の送信を止める。時間は進めたままとし、次のイベントで送り直す
+        self._unschedule_timer()
+
+    def _on_rehydrate(self):
+        self._sync_clock()
+
+    async def on_load(self):
+        settings = parse_settings(self.router.page.params)
+        if settings is not None and settings != (self.height, self.width, self.num_mines, self.daily != ""):
+            # メニューからは難易度をURLで受け取る
+            await self.set_state(*settings)
+        elif settings is not None and (self._is_game_end or self.daily not in ("", today())):
+            # 終わった盤面の難易度を選び直したときや、前日のデイリーチャレンジを開いたときは新しいゲームにする
+            await self.reset_board()
+        # 前の接続で予約したdrain_actionsが届かなかったときに盤面が止まらないよう、反映前の操作は捨てて受け付け直す
+        self._pending_actions = []
+        self._is_drain_scheduled = False
+        self._sync_clock()
+        self._sent_board = None
+        await self.apply_game_state()
+        await self.load_best_time()
+
+    async def reset_board(self):
+        if self.daily:
+            # 日付が変わっていれば、その日の盤面にする
+            self.daily = today()
+            self._game.load_daily(self.daily)
+        else:
+            self._game.reset()
+        self._pending_actions = []
+        self._is_drain_scheduled = False
+        self._recorder.reset()
+        await self.apply_game_state()
         self._is_game_end = False
         self.num_flags = 0
-        self.elapsed_time = 0
-        self._is_running = False
+        self._reset_clock()
         self.posing = False
         self.is_popup = False
 
-    def set_state(self, height: int, width: int, num_mines: int):
+    async def set_state(self, height: int, width: int, num_mines: int, daily: bool = False):
         self.height = height
         self.width = width
         self.num_mines = num_mines
+        self.daily = today() if daily else ""
         self._game = MineSweaper(self.height, self.width, self.num_mines)
-        self.reset_board()
-
-    def apply_game_state(self, is_fail=False):
-        self.showing_board = self._game.showing_board.flatten().tolist()
-        self.num_flags = np.count_nonzero(self._game.showing_board == FLAG_NUM)
-        if is_fail:
-            actual = self._game.actual_board.flatten().tolist()
-            for i in range(len(self.showing_board)):
-                if actual[i] == MINE_NUM and self.showing_board[i] == NOT_SELECTED_NUM:
-                    self.showing_board[i] = NOT_SELECTED_MINE_NUM
-                elif self.showing_board[i] == FLAG_NUM and 0 <= actual[i] <= 8:
-                    self.showing_board[i] = FAILED_FLAG_NUM
+        await self.reset_board()
+        await self.load_best_time()
 
-    # ** 記録に関する関数 **
-    def update_record(self) -> int:
-        state = to_state(height=self.height, width=self.width, num_mines=self.num_mines)
-        with rx.session() as session:
-            session.add(MSRecord(state=state, time=self.elapsed_time))
-            session.commit()
-
-            records = session.exec(
-                MSRecord.select().where(MSRecord.state == state).order_by(MSRecord.time.asc())
-            ).all()
-            for i in range(10, len(records)):
-                session.delete(records[i])
-                session.commit()
-
-    @rx.var(cache=False)
-    def best_time(self) -> int:
-        state = to_state(height=self.height, width=self.width, num_mines=self.num_mines)
-        with rx.session() as session:
-            records = session.exec(
-                MSRecord.select().where(MSRecord.state == state).order_by(MSRecord.time.asc())
-            ).all()
-
-        if len(records):
-            return records[0].time
+    async def apply_game_state(self, is_fail=False):
+        board = self._game.reveal_board() if is_fail else self._game.showing_board
+        if self._sent_board is None or self._sent_board.shape != board.shape:
+            chunks = range(NUM_CHUNKS)
         else:
-            return 0
-
-    # ** 経過時間に関する関数 **
-    @rx.event(background=True)
-    async def update_elapsed_time(self):
-        if self._is_running:
-            return
-        while True:
-            await asyncio.sleep(1)
-            if self._is_game_end or not self._is_running:
-                break
-            elif self.posing:
-                continue
-            async with self:
-                self.elapsed_time += 1
+            # 前回から変化した行を含むチャンクのみ更新する
+            changed_rows = np.flatnonzero((board != self._sent_board).any(axis=1))
+            chunks = np.unique(changed_rows // CHUNK_ROWS).tolist()
+        for i in chunks:
+            chunk = await self.get_state(BOARD_CHUNK_STATES[i])
+            chunk.cells = encode_board(board[i * CHUNK_ROWS : (i + 1) * CHUNK_ROWS])
+            chunk.offset = i * CHUNK_ROWS * self.width
+            chunk.width = self.width
+        self._sent_board = board.copy()
+        self.num_flags = self._game.num_flags
 
+    # ** 記録に関する関数 **
     @rx.var(cache=True)
-    def display_elapsed_time(self) -> str:
-        return str(self.elapsed_time).zfill(3)
+    def record_state(self) -> str:
+        state = to_state(height=self.height, width=self.width, num_mines=self.num_mines)
+        return to_daily_state(self.daily, state) if self.daily else state
+
+    @instrument
+    async def update_record(self):
+        state = self.record_state
+        self.bbbv = self._game.bbbv
+        self.bbbv_per_sec = round(to_bbbv_per_sec(self.bbbv, self.elapsed_time), 2)
+        with measure("db"):
+            async with asession() as session:
+                record = MSRecord(state=state, time=self.elapsed_time, bbbv=self.bbbv)
+                session.add(record)
+                await add_stats(session, state, self.elapsed_time)
+                await session.commit()
+
+                # どの並べ方でも上位に入らない記録を削除する
+                kept = set()
+                for order_by in ORDER_BY.values():
+                    kept.update(
+                        (
+                            await session.exec(
+                                MSRecord.select()
+                                .with_only_columns(MSRecord.id)
+                                .where(MSRecord.state == state)
+                                .order_by(order_by, MSRecord.id.asc())
+                                .limit(MAX_RECORD)
+                            )
+                        ).all()
+                    )
+                if record.id in kept:
+                    session.add(self._make_replay(record.id))
+                records = (
+                    await session.exec(MSRecord.select().where(MSRecord.state == state, MSRecord.id.not_in(kept)))
+                ).all()
+                await session.execute(
+                    sa.delete(MSReplay).where(MSReplay.record_id.in_([record.id for record in records]))
+                )
+                for record in records:
+                    await session.delete(record)
+                await session.commit()
+                stats = await load_stats(session, state)
+        self.best_time = stats.best
+        self.beaten_percent = stats.beaten_percent(self.elapsed_time)
+
+    def _make_replay(self, record_id: int) -> MSReplay:
+        # デイリーチャレンジは共有の盤面のシード、それ以外は地雷の配置に使ったシードから盤面を再現する
+        shared = self._game.seed is not None
+        seed = self._game.seed if shared else self._game.mine_seed
+        moves = encode_moves(self._recorder.moves)
+        with measure("engine"):
+            checkpoints = Replayer(self.height, self.width, self.num_mines, seed, shared, moves).make_checkpoints()
+        return MSReplay(
+            record_id=record_id, seed=to_signed64(seed), shared=shared, moves=moves, checkpoints=checkpoints
+        )
+
+    @instrument
+    async def load_best_time(self):
+        state = self.record_state
+        with measure("db"):
+            async with asession() as session:
+                record = (
+                    await session.exec(
+                        MSRecord.select().where(MSRecord.state == state).order_by(MSRecord.time.asc()).limit(1)
+                    )
+                ).first()
+        self.best_time = record.time if record is not None else 0
 
     # ** マウスイベントに関する関数 **
+    # セルへの操作はキューに溜め、drain_actionsでまとめて盤面に反映する
+    def _enqueue_action(self, action: int, index: int):
+        self._pending_actions.append((action, index))
+        if not self._is_drain_scheduled:
+            self._is_drain_scheduled = True
+            return MineSweaperState.drain_actions()
+
+    @instrument
     def open_cell(self, index: int):
         if not self._is_game_end:
-            self._is_running = True
-            is_not_fail = self._game.open_cell(index)
-            if not is_not_fail or self._game.is_all_selected():
-                self._is_game_end = True
-            self.apply_game_state(not is_not_fail)
-            if not is_not_fail:
-                return rx.toast.error("You failed...", **RESULT_TOAST)
-            elif self._game.is_all_selected():
-                self.update_record()
-                self.is_popup = True
-                return rx.toast.success("You succeeded!!", **RESULT_TOAST)
+            self._start_clock()
+            return self._enqueue_action(OPEN_ACTION, index)
 
+    @instrument
     def put_or_unput_flag(self, index: int):
         if not self._is_game_end:
-            self._game.put_or_unput_flag(index)
-            self.apply_game_state()
+            return self._enqueue_action(FLAG_ACTION, index)
 
-    def focus_cell(self, index: int):
-        if not self._is_game_end:
-            self.focused_idx = index
-
-    def unfocus_cell(self):
-        self.focused_idx = -1
+    @instrument
+    async def drain_actions(self):
+        actions, self._pending_actions = self._pending_actions, []
+        self._is_drain_scheduled = False
+        if self._is_game_end or len(actions) == 0:
+            return
+        is_not_fail = True
+        with measure("engine"):
+            for action, index in actions:
+                self._recorder.record(action, index)
+                is_not_fail = apply_move(self._game, action, index)
+                if action == FLAG_ACTION:
+                    continue
+                if not is_not_fail or self._game.is_all_selected():
+                    # ゲームが終了した後の操作は無視する
+                    break
+        is_first_daily = self.daily != self._daily_played
+        if not is_not_fail or self._game.is_all_selected():
+            self._is_game_end = True
+            self._stop_clock()
+            if self.daily:
+                self._daily_played = self.daily
+        await self.apply_game_state(not is_not_fail)
+        if not is_not_fail:
+            return rx.toast.error("You failed...", **RESULT_TOAST)
+        elif self._game.is_all_selected():
+            if not self.daily or is_first_daily:
+                await self.update_record()
+                self.is_popup = True
+            return rx.toast.success("You succeeded!!", **RESULT_TOAST)
 
     def change_pose_state(self):
         self.posing = not self.posing
+        if self.posing:
+            self._stop_clock()
+        elif not self._is_game_end:
+            self._resume_clock()
 
 
 def display_info():
     return rx.vstack(
+        rx.cond(MineSweaperState.daily != "", rx.text(f"Daily {MineSweaperState.daily}", weight="bold")),
         rx.hstack(
             rx.button("Reset", on_click=MineSweaperState.reset_board()),
             rx.button("Pose", on_click=MineSweaperState.change_pose_state()),
@@ -161,9 +359,7 @@ def display_info():
                 "Records",
                 on_click=[
                     rx.redirect("/minesweaper/records"),
-                    MSRecordState.set_state(
-                        to_state(MineSweaperState.height, MineSweaperState.width, MineSweaperState.num_mines)
-                    ),
+                    MSRecordState.set_state(MineSweaperState.record_state),
                 ],
             ),
             align="center",
@@ -171,7 +367,7 @@ def display_info():
         rx.hstack(
             rx.box(
                 rx.hstack(
-                    rx.image(src="/minesweaper/flag.png", width="30px"),
+                    ms_icon("flag", 30),
                     rx.text(
                         f"{MineSweaperState.num_flags} / {MineSweaperState.num_mines}",
                         font_family="Instrument Sans",
@@ -185,7 +381,7 @@ def display_info():
             ),
             rx.box(
                 rx.hstack(
-                    rx.image(src="/minesweaper/clock.png", width="30px"),
+                    ms_icon("clock", 30),
                     rx.text(
                         MineSweaperState.display_elapsed_time, font_family="Instrument Sans", size="4", weight="medium"
                     ),
@@ -209,14 +405,14 @@ def popup_dialog():
             rx.flex(
                 rx.text(f"Your Time: {MineSweaperState.elapsed_time}"),
                 rx.text(f"Best Time: {MineSweaperState.best_time}"),
+                rx.text(f"You beat {MineSweaperState.beaten_percent}% of players"),
+                rx.text(f"3BV: {MineSweaperState.bbbv} ({MineSweaperState.bbbv_per_sec} 3BV/s)"),
                 rx.button(
                     "Show Records",
                     width="150px",
                     on_click=[
                         rx.redirect("/minesweaper/records"),
-                        MSRecordState.set_state(
-                            to_state(MineSweaperState.height, MineSweaperState.width, MineSweaperState.num_mines)
-                        ),
+                        MSRecordState.set_state(MineSweaperState.record_state),
                     ],
                 ),
                 rx.dialog.close(
@@ -233,52 +429,65 @@ def popup_dialog():
     )
 
 
-def get_box_content(state: int):
+def get_box_content(state: str):
     return rx.cond(
-        (state != 0) & (state != NOT_SELECTED_NUM),
+        (state != CELL_CODE[0]) & (state != CELL_CODE[NOT_SELECTED_NUM]),
         rx.cond(
-            (state == FLAG_NUM) | (state == FAILED_FLAG_NUM),
-            rx.image(src="/minesweaper/flag.png", width="20px"),
+            (state == CELL_CODE[FLAG_NUM]) | (state == CELL_CODE[FAILED_FLAG_NUM]),
+            ms_icon("flag", 20),
             rx.cond(
-                state == NOT_SELECTED_MINE_NUM,
-                rx.image(src="/minesweaper/mine.png", width="20px"),
+                state == CELL_CODE[NOT_SELECTED_MINE_NUM],
+                ms_icon("mine", 20),
                 rx.text(state),
             ),
         ),
     )
 
 
-def get_background_color(index: int):
+def get_background_color(state: str):
     return rx.cond(
-        (MineSweaperState.showing_board[index] != NOT_SELECTED_NUM)
-        & (MineSweaperState.showing_board[index] != FLAG_NUM)
-        & (MineSweaperState.showing_board[index] != FAILED_FLAG_NUM)
-        & (MineSweaperState.showing_board[index] != NOT_SELECTED_MINE_NUM),
+        (state != CELL_CODE[NOT_SELECTED_NUM])
+        & (state != CELL_CODE[FLAG_NUM])
+        & (state != CELL_CODE[FAILED_FLAG_NUM])
+        & (state != CELL_CODE[NOT_SELECTED_MINE_NUM]),
         rx.color("gray", shade=2),
         rx.cond(
-            (MineSweaperState.showing_board[index] == FAILED_FLAG_NUM)
-            | (MineSweaperState.showing_board[index] == NOT_SELECTED_MINE_NUM),
+            (state == CELL_CODE[FAILED_FLAG_NUM]) | (state == CELL_CODE[NOT_SELECTED_MINE_NUM]),
             rx.color("red", shade=7),
-            rx.cond(MineSweaperState.focused_idx == index, rx.color("gray", shade=5), rx.color("gray", shade=9)),
+            rx.color("gray", shade=9),
         ),
     )
 
 
-def render_box(state: int, index: int):
+def get_hover_color(state: str):
+    # フォーカスはサーバーを介さずCSSで表示する
+    return rx.cond(
+        (state == CELL_CODE[NOT_SELECTED_NUM]) | (state == CELL_CODE[FLAG_NUM]), rx.color("gray", shade=5), ""
+    )
+
+
+def render_box(state: str, index: int):
     return rx.box(
         rx.center(get_box_content(state)),
-        bg=get_background_color(index),
+        bg=get_background_color(state),
         width=f"{BOX_SIZE}px",
         height=f"{BOX_SIZE}px",
         border=THEME_BORDER,
-        on_click=[MineSweaperState.update_elapsed_time(), MineSweaperState.open_cell(index)],
+        on_click=MineSweaperState.open_cell(index),
         on_context_menu=MineSweaperState.put_or_unput_flag(index).prevent_default,
-        on_mouse_enter=MineSweaperState.focus_cell(index),
-        on_mouse_leave=MineSweaperState.unfocus_cell(),
+        _hover={"bg": get_hover_color(state)},
         text_align="center",
     )
 
 
+def display_chunk(chunk: MSBoardChunkMixin):
+    return rx.grid(
+        rx.foreach(chunk.cells.split(""), lambda state, index: render_box(state, chunk.offset + index)),
+        columns=chunk.width.to_string(),
+        justify="center",
+    )
+
+
 def display_board():
     return rx.cond(
         MineSweaperState.posing,
@@ -290,11 +499,10 @@ def display_board():
             width=f"{BOX_SIZE*MineSweaperState.width}px",
             height=f"{BOX_SIZE*MineSweaperState.height+2}px",
         ),
-        rx.grid(
-            rx.foreach(MineSweaperState.showing_board, lambda state, index: render_box(state, index)),
-            columns=MineSweaperState.width.to_string(),
+        rx.vstack(
+            *[display_chunk(chunk) for chunk in BOARD_CHUNK_STATES],
             border=THEME_BORDER,
-            justify="center",
+            spacing="0",
         ),
     )
 
@@ -0,0 +1,250 @@
+from typing import List
+
+import reflex as rx
+
+from ...metrics import instrument, measure
+from ...sessions import EvictableMixin
+from ...style import RESULT_TOAST, THEME_BORDER
+from ...templates.minesweaper import ms_icon, ms_pages
+from ..minesweaper.minesweaper import MineSweaper
+from ..race import CLEARED, FAILED, PLAYING, RUNNING, WAITING, Progress, Race, get_store
+from .index import DIFFICULTIES
+from .minesweaper import BOX_SIZE, encode_board, get_background_color, get_box_content, get_hover_color
+
+RACE_DIFFICULTIES = {text: (height, width, num_mines) for text, height, width, num_mines in DIFFICULTIES}
+DEFAULT_DIFFICULTY = DIFFICULTIES[0][0]
+
+
+class RaceState(EvictableMixin, rx.State):
+    race_id: str = ""
+    race_input: str = ""
+    name: str = ""
+    height: int = 8
+    width: int = 10
+    num_mines: int = 10
+    # 自分の盤面。実際の盤面はレースの全員で共有する
+    _game: MineSweaper = MineSweaper(height, width, num_mines)
+    # CELL_CODEで表した盤面
+    coded_board: str = ""
+    num_flags: int = 0
+    is_host: bool = False
+    # 自分の状態
+    player_status: str = PLAYING
+    # 参加者全員に送る変数。他のプレイヤーの進捗はサーバーの状態を経由せずに直接届く
+    race_status: str = WAITING
+    progress: List[Progress] = []
+
+    # ** レースへの参加に関する関数 **
+    def _token(self) -> str:
+        return self.router.session.client_token
+
+    async def enter(self, race: Race):
+        store = get_store()
+        if self.race_id and self.race_id != race.race_id:
+            await store.unsubscribe(self.router.session.session_id, self.race_id)
+        await store.subscribe(self.router.session.session_id, race.race_id)
+        self.race_id = race.race_id
+        self.is_host = race.host == self._token()
+        self.height, self.width, self.num_mines = race.height, race.width, race.num_mines
+        self._game = MineSweaper(self.height, self.width, self.num_mines)
+        # 全員が同じ盤面を参照する（シードごとに一度だけ生成される）
+        self._game.load_shared(race.seed)
+        self.player_status = PLAYING
+        self.apply_game_state()
+        self.report(race)
+
+    def report(self, race: Race):
+        # 進捗は次の送信でまとめて全員に届く。自分には通常の応答で返す
+        race.update(self._token(), self._game.num_selected_cells, self.num_flags, self.player_status)
+        get_store().mark(race.race_id)
+        delta = race.to_delta()
+        self.race_status = delta["race_status"]
+        self.progress = delta["progress"]
+
+    @instrument
+    async def create_race(self, difficulty: str):
+        race = get_store().create(*RACE_DIFFICULTIES[difficulty], host=self._token())
+        race.join(self._token(), self.name or "Player 1")
+        await self.enter(race)
+
+    @instrument
+    async def join_race(self):
+        race = get_store().get(self.race_input.strip().lower())
+        if race is None:
+            return rx.toast.warning("The race does not exist", position="top-center", duration=1500)
+        if not race.join(self._token(), self.name or f"Player {len(race.players) + 1}"):
+            return rx.toast.warning("The race has already started or is full", position="top-center", duration=1500)
+        await self.enter(race)
+
+    async def on_load(self):
+        # 再接続するとセッションIDが変わるため、参加中のレースに入り直す
+        race = get_store().get(self.race_id)
+        if race is None or self._token() not in race.players:
+            self.race_id = ""
+            return
+        await get_store().subscribe(self.router.session.session_id, race.race_id)
+        self.apply_game_state()
+        delta = race.to_delta()
+        self.race_status = delta["race_status"]
+        self.progress = delta["progress"]
+
+    def start_race(self):
+        race = get_store().get(self.race_id)
+        if race is not None and race.host == self._token() and race.status == WAITING:
+            race.start()
+            self.report(race)
+
+    # ** 盤面に関する関数 **
+    @instrument
+    def apply_game_state(self, is_fail: bool = False):
+        board = self._game.reveal_board() if is_fail else self._game.showing_board
+        self.coded_board = encode_board(board)
+        self.num_flags = self._game.num_flags
+
+    def _playing_race(self):
+        # 他のプレイヤーが開始したことはサーバー側の変数に反映されないため、レースの状態を確認する
+        race = get_store().get(self.race_id)
+        if race is None or race.status != RUNNING or self.player_status != PLAYING:
+            return None
+        return race
+
+    @instrument
+    def open_cell(self, index: int):
+        race = self._playing_race()
+        if race is None:
+            return
+        with measure("engine"):
+            if self._game.is_selected(index):
+                # 開けられた数字のセルをクリックしたときは周囲をまとめて開ける
+                is_not_fail = self._game.chord(index)
+            else:
+                is_not_fail = self._game.open_cell(index)
+        if not is_not_fail:
+            self.player_status = FAILED
+        elif self._game.is_all_selected():
+            self.player_status = CLEARED
+        self.apply_game_state(not is_not_fail)
+        self.report(race)
+        if not is_not_fail:
+            return rx.toast.error("You failed...", **RESULT_TOAST)
+        elif self.player_status == CLEARED:
+            time = race.players[self._token()].finish_time
+            return rx.toast.success(f"You cleared in {time} seconds!!", **RESULT_TOAST)
+
+    @instrument
+    def put_or_unput_flag(self, index: int):
+        race = self._playing_race()
+        if race is not None:
+            self._game.put_or_unput_flag(index)
+            self.apply_game_state()
+            self.report(race)
+
+
+async def serve_races(reflex_app: rx.App):
+    """
+    レースの送信先を設定し、進捗を一定間隔でまとめて送るライフスパンタスク
+    """
+    store = get_store()
+    store.attach(reflex_app.event_namespace, RaceState.get_full_name())
+    await store.serve()
+
+
+def setting():
+    return rx.vstack(
+        rx.input(placeholder="Your Name", value=RaceState.name, on_change=RaceState.set_name),
+        rx.hstack(
+            rx.select(
+                list(RACE_DIFFICULTIES),
+                placeholder=DEFAULT_DIFFICULTY,
+                on_change=lambda value: RaceState.create_race(value),
+                position="popper",
+            ),
+            rx.text("Create Race"),
+            align="center",
+        ),
+        rx.hstack(
+            rx.input(placeholder="Race ID", value=RaceState.race_input, on_change=RaceState.set_race_input),
+            rx.button("Join", on_click=RaceState.join_race()),
+            align="center",
+        ),
+        align="center",
+    )
+
+
+def render_progress(progress: rx.Var):
+    return rx.hstack(
+        rx.text(progress[0], width="100px", trim="both"),
+        rx.progress(value=progress[1], width="150px"),
+        rx.text(f"{progress[1]}%", width="45px"),
+        rx.box(
+            rx.hstack(
+                ms_icon("flag", 20),
+                rx.text(progress[2]),
+                align="center",
+                spacing="1",
+            ),
+            width="50px",
+        ),
+        rx.match(
+            progress[3],
+            (CLEARED, rx.text(f"{progress[4]} s", color=rx.color("green", shade=9))),
+            (FAILED, rx.text("Failed", color=rx.color("red", shade=9))),
+            rx.text(""),
+        ),
+        align="center",
+    )
+
+
+def race_info():
+    return rx.cond(
+        RaceState.race_id != "",
+        rx.vstack(
+            rx.text(f"Race {RaceState.race_id}", weight="bold"),
+            rx.cond(
+                RaceState.race_status == WAITING,
+                rx.cond(
+                    RaceState.is_host,
+                    rx.button("Start", on_click=RaceState.start_race()),
+                    rx.text("Waiting for the host to start..."),
+                ),
+            ),
+            rx.foreach(RaceState.progress, render_progress),
+            align="center",
+        ),
+    )
+
+
+def render_box(state: str, index: int):
+    return rx.box(
+        rx.center(get_box_content(state)),
+        bg=get_background_color(state),
+        width=f"{BOX_SIZE}px",
+        height=f"{BOX_SIZE}px",
+        border=THEME_BORDER,
+        on_click=RaceState.open_cell(index),
+        on_context_menu=RaceState.put_or_unput_flag(index).prevent_default,
+        _hover={"bg": get_hover_color(state)},
+        text_align="center",
+    )
+
+
+def display_board():
+    return rx.cond(
+        RaceState.race_status == RUNNING,
+        rx.vstack(
+            rx.text(f"{RaceState.num_flags} / {RaceState.num_mines} flags"),
+            rx.grid(
+                rx.foreach(RaceState.coded_board.split(""), lambda state, index: render_box(state, index)),
+                columns=RaceState.width.to_string(),
+                border=THEME_BORDER,
+                justify="center",
+            ),
+            align="center",
+        ),
+    )
+
+
+@rx.page(route="/minesweaper/race", title="Mine Sweaper Race", on_load=RaceState.on_load())
+@ms_pages(head_text="Mine Sweaper Race")
+def ms_race_page() -> List[rx.Component]:
+    return [setting(), race_info(), display_board()]
@@ -1,62 +1,266 @@
+import bisect
 from typing import List
 
 import reflex as rx
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from ...database import asession
+from ...metrics import instrument, measure
 from ...templates.minesweaper import ms_pages
 
 MAX_RECORD = 10
+# 記録の並べ方
+TIME_ORDER = "Time"
+BBBV_ORDER = "3BV/s"
+# 統計のヒストグラムの各区間の上限（秒）。最後の区間は上限なし
+TIME_BUCKETS = [10, 20, 30, 45, 60, 90, 120, 180, 240, 300, 450, 600, 900]
 
 
 def to_state(height: int, width: int, num_mines: int) -> str:
     return f"{height}x{width}x{num_mines}"
 
 
+def to_daily_state(day: str, state: str) -> str:
+    # デイリーチャレンジの記録は通常の記録と分けて集計する
+    return f"daily-{day}-{state}"
+
+
+def parse_state(state: str) -> List[int]:
+    # 難易度（デイリーチャレンジを含む）から盤面の高さ、幅、地雷の数を取り出す
+    return [int(x) for x in state.rsplit("-", 1)[-1].split("x")]
+
+
+def is_daily_state(state: str) -> bool:
+    return state.startswith("daily-")
+
+
+def to_bucket(time: int) -> int:
+    return bisect.bisect_left(TIME_BUCKETS, time)
+
+
+def to_bbbv_per_sec(bbbv: int, time: int) -> float:
+    # 0秒の記録は1秒として扱う
+    return bbbv / max(time, 1)
+
+
 class MSRecord(rx.Model, table=True):
     state: str
     time: int
+    # 盤面の3BV（3BVを記録する前の記録は0）
+    bbbv: int = 0
+
+    @property
+    def bbbv_per_sec(self) -> float:
+        return to_bbbv_per_sec(self.bbbv, self.time)
+
+
+class MSReplay(rx.Model, table=True):
+    """
+    上位の記録のリプレイ。盤面のシード、圧縮した操作のログ、一定手数ごとの盤面を保存する。
+    """
+
+    __table_args__ = (sa.UniqueConstraint("record_id"),)
+
+    record_id: int
+    # 符号付き64ビットで保存する（to_signed64）
+    seed: int = sqlmodel.Field(sa_type=sa.BigInteger)
+    # シードから生成した共有の盤面（デイリーチャレンジ）か
+    shared: bool
+    moves: bytes
+    checkpoints: bytes
+
+
+def to_signed64(value: int) -> int:
+    # デイリーチャレンジのシードは符号なし64ビットのため、BIGINTの列に収まるように変換する
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_signed64(value: int) -> int:
+    return value % (1 << 64)
+
+
+# to_bbbv_per_secと同じ値を求めるSQLの式
+BBBV_PER_SEC = MSRecord.bbbv * 1.0 / sa.case((MSRecord.time > 0, MSRecord.time), else_=1)
+ORDER_BY = {
+    TIME_ORDER: MSRecord.time.asc(),
+    BBBV_ORDER: BBBV_PER_SEC.desc(),
+}
+
+
+class MSRecordStats(rx.Model, table=True):
+    """
+    難易度ごと・ヒストグラムの区間ごとの記録の統計。勝つたびに1行だけ更新する。
+    """
+
+    __tablename__ = "msrecord_stats"
+    __table_args__ = (sa.UniqueConstraint("state", "bucket"),)
+
+    state: str
+    bucket: int
+    count: int
+    total: int
+    best: int
+
+
+class MSStats:
+    count: int
+    best: int
+    mean: float
+    # 区間ごとの記録の数
+    histogram: List[int]
+
+    def __init__(self, rows: List[MSRecordStats]) -> None:
+        self.histogram = [0] * (len(TIME_BUCKETS) + 1)
+        for row in rows:
+            self.histogram[row.bucket] = row.count
+        self.count = sum(self.histogram)
+        self.best = min((row.best for row in rows), default=0)
+        self.mean = sum(row.total for row in rows) / self.count if self.count else 0.0
+
+    def beaten_percent(self, time: int) -> int:
+        """
+        記録したタイムより遅い記録の割合を求める。同じ区間の記録は区間内で一様に分布するとみなす。
+
+        Args:
+            time (int): 記録したタイム（自身の記録は統計に含まれているものとする）
+
+        Returns:
+            int: 遅い記録の割合（%）
+        """
+        if self.count <= 1:
+            return 100
+        bucket = to_bucket(time)
+        slower = sum(self.histogram[bucket + 1 :])
+        if bucket < len(TIME_BUCKETS):
+            lower = TIME_BUCKETS[bucket - 1] if bucket > 0 else 0
+            upper = TIME_BUCKETS[bucket]
+            slower += (self.histogram[bucket] - 1) * (upper - time) / (upper - lower)
+        return int(100 * slower / (self.count - 1))
+
+
+async def add_stats(session: AsyncSession, state: str, time: int):
+    """
+    記録を統計に加える。同じトランザクション内で該当する区間の1行のみを更新する。
+
+    Args:
+        session (AsyncSession): 記録を追加しているセッション
+        state (str): 難易度
+        time (int): 記録したタイム
+    """
+    insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+    statement = insert(MSRecordStats).values(state=state, bucket=to_bucket(time), count=1, total=time, best=time)
+    statement = statement.on_conflict_do_update(
+        index_elements=["state", "bucket"],
+        set_={
+            "count": MSRecordStats.count + 1,
+            "total": MSRecordStats.total + time,
+            "best": sa.case((MSRecordStats.best > time, time), else_=MSRecordStats.best),
+        },
+    )
+    await session.execute(statement)
+
+
+async def load_stats(session: AsyncSession, state: str) -> MSStats:
+    rows = (await session.exec(MSRecordStats.select().where(MSRecordStats.state == state))).all()
+    return MSStats(rows)
 
 
 class MSRecordState(rx.State):
     state: str = to_state(8, 10, 10)
+    order: str = TIME_ORDER
+    # 順位、タイム、3BV、3BV/s、リプレイのID（リプレイがないときは空文字）
+    data: List[List[str]] = []
+    states: List[str] = []
+    num_records: int = 0
+    mean_time: float = 0.0
 
-    @rx.var(cache=False)
-    def data(self) -> List[List[int]]:
-        with rx.session() as session:
-            records = session.exec(
-                MSRecord.select().where(MSRecord.state == self.state).order_by(MSRecord.time.asc())
-            ).all()
+    async def set_state(self, state: str):
+        self.state = state
+        await self.load_records()
+
+    async def set_order(self, order: str):
+        self.order = order
+        await self.load_records()
+
+    @instrument
+    async def load_records(self):
+        with measure("db"):
+            async with asession() as session:
+                records = (
+                    await session.exec(
+                        MSRecord.select()
+                        .where(MSRecord.state == self.state)
+                        .order_by(ORDER_BY[self.order], MSRecord.id.asc())
+                        .limit(MAX_RECORD)
+                    )
+                ).all()
+                states = (
+                    await session.exec(
+                        MSRecord.select()
+                        .with_only_columns(MSRecord.state)
+                        .distinct(MSRecord.state)
+                        .order_by(MSRecord.state.asc())
+                    )
+                ).all()
+                stats = await load_stats(session, self.state)
+                replays = set(
+                    (
+                        await session.exec(
+                            MSReplay.select()
+                            .with_only_columns(MSReplay.record_id)
+                            .where(MSReplay.record_id.in_([record.id for record in records]))
+                        )
+                    ).all()
+                )
 
         data = []
-        for i in range(min(10, len(records))):
-            time = records[i].time
-            if i > 0 and time == records[i - 1].time:
+        keys = [record.time if self.order == TIME_ORDER else -record.bbbv_per_sec for record in records]
+        for i, record in enumerate(records):
+            if i > 0 and keys[i] == keys[i - 1]:
                 rank = data[-1][0]
             else:
-                rank = i + 1
-            data.append([rank, time])
-
-        return data
+                rank = str(i + 1)
+            replay = str(record.id) if record.id in replays else ""
+            data.append([rank, str(record.time), str(record.bbbv), f"{record.bbbv_per_sec:.2f}", replay])
 
-    @rx.var(cache=False)
-    def states(self) -> List[str]:
-        with rx.session() as session:
-            return session.exec(
-                MSRecord.select()
-                .with_only_columns(MSRecord.state)
-                .distinct(MSRecord.state)
-                .order_by(MSRecord.state.asc())
-            ).all()
+        self.data = data
+        self.states = states
+        self.num_records = stats.count
+        self.mean_time = round(stats.mean, 1)
 
 
-def show_data(data: List[List[int]]):
+def show_data(data: List[str]):
     return rx.table.row(
         rx.table.cell(data[0]),
         rx.table.cell(data[1]),
+        rx.table.cell(data[2]),
+        rx.table.cell(data[3]),
+        rx.table.cell(
+            rx.cond(
+                data[4] != "",
+                rx.button(
+                    "Watch", size="1", variant="soft", on_click=rx.redirect("/minesweaper/replay?id=" + data[4])
+                ),
+            )
+        ),
     )
 
 
 def states():
-    return rx.select(MSRecordState.states, value=MSRecordState.state, on_change=MSRecordState.set_state)
+    return rx.hstack(
+        rx.select(MSRecordState.states, value=MSRecordState.state, on_change=MSRecordState.set_state),
+        rx.select(list(ORDER_BY), value=MSRecordState.order, on_change=MSRecordState.set_order),
+    )
+
+
+def summary():
+    return rx.hstack(
+        rx.text(f"Played: {MSRecordState.num_records}"),
+        rx.text(f"Mean Time: {MSRecordState.mean_time}"),
+    )
 
 
 def table():
@@ -65,13 +269,16 @@ def table():
             rx.table.row(
                 rx.table.column_header_cell("Rank"),
                 rx.table.column_header_cell("Time"),
+                rx.table.column_header_cell("3BV"),
+                rx.table.column_header_cell("3BV/s"),
+                rx.table.column_header_cell("Replay"),
             ),
         ),
         rx.table.body(rx.foreach(MSRecordState.data, show_data)),
     )
 
 
-@rx.page(route="/minesweaper/records", title="Mine Sweaper Records")
+@rx.page(route="/minesweaper/records", title="Mine Sweaper Records", on_load=MSRecordState.load_records())
 @ms_pages(head_text="Records")
 def ms_records() -> List[rx.Component]:
-    return [states(), table()]
+    return [states(), summary(), table()]
@@ -0,0 +1,185 @@
+from typing import List, Optional, Union
+
+import reflex as rx
+
+from ...database import asession
+from ...metrics import instrument, measure
+from ...style import THEME_BORDER
+from ...templates.minesweaper import ms_pages
+from ..minesweaper.replay import Replayer, playback
+from .minesweaper import BOX_SIZE, encode_board, get_background_color, get_box_content
+from .record import MSRecord, MSRecordState, MSReplay, from_signed64, parse_state
+
+SPEEDS = ["0.5", "1", "2", "4"]
+
+
+class ReplayState(rx.State):
+    record_id: int = 0
+    state: str = ""
+    record_time: int = 0
+    width: int = 0
+    total_moves: int = 0
+    # 反映した手数
+    position: int = 0
+    is_playing: bool = False
+    speed: str = "1"
+    # CELL_CODEで表した盤面
+    coded_board: str = ""
+    # 反映した手の時間（センチ秒）
+    clock: int = 0
+    _replayer: Optional[Replayer] = None
+    # 再生を始めるたびに増やし、古い再生を止める
+    _generation: int = 0
+
+    @instrument
+    async def on_load(self):
+        self._generation += 1
+        self.is_playing = False
+        try:
+            record_id = int(self.router.page.params.get("id", 0) or 0)
+        except (TypeError, ValueError):
+            # 数字でないIDは、存在しない記録と同じく再生できないとする
+            record_id = 0
+        record = replay = None
+        # データベースの整数に収まらないIDは問い合わせない
+        if 0 < record_id < 2**63:
+            with measure("db"):
+                async with asession() as session:
+                    record = await session.get(MSRecord, record_id)
+                    replay = (
+                        await session.exec(MSReplay.select().where(MSReplay.record_id == record_id))
+                    ).first()
+        if record is None or replay is None:
+            self._replayer = None
+            self.record_id = 0
+            return
+        height, self.width, num_mines = parse_state(record.state)
+        self.record_id = record.id
+        self.state = record.state
+        self.record_time = record.time
+        with measure("engine"):
+            self._replayer = Replayer(
+                height,
+                self.width,
+                num_mines,
+                from_signed64(replay.seed),
+                replay.shared,
+                replay.moves,
+                replay.checkpoints,
+            )
+        self.total_moves = len(self._replayer.moves)
+        self.apply_replay()
+
+    def apply_replay(self):
+        self.position = self._replayer.position
+        self.coded_board = encode_board(self._replayer.game.showing_board)
+        self.clock = self._replayer.time_at(self.position)
+
+    @rx.event(background=True)
+    async def play(self):
+        async with self:
+            if self._replayer is None or self.is_playing:
+                return
+            if self.position >= self.total_moves:
+                self._replayer.seek(0)
+                self.apply_replay()
+            self._generation += 1
+            generation = self._generation
+            self.is_playing = True
+            moves, start, speed = self._replayer.moves, self.position, float(self.speed)
+        # 手は記録された間隔で1つずつ届くため、盤面は届いた手の分だけ進める
+        async for index in playback(moves, start, speed):
+            async with self:
+                if self._generation != generation:
+                    return
+                self._replayer.seek(index + 1)
+                self.apply_replay()
+        async with self:
+            if self._generation == generation:
+                self.is_playing = False
+
+    def pause(self):
+        self._generation += 1
+        self.is_playing = False
+
+    @instrument
+    def seek(self, value: List[Union[int, float]]):
+        if self._replayer is None:
+            return
+        self.pause()
+        with measure("engine"):
+            self._replayer.seek(int(value[0]))
+        self.apply_replay()
+
+    def change_speed(self, speed: str):
+        self.speed = speed
+        if self.is_playing:
+            # 新しい速度で再生し直す
+            self.pause()
+            return ReplayState.play()
+
+    @rx.var(cache=True)
+    def display_clock(self) -> str:
+        return f"{self.clock // 100}.{self.clock % 100 // 10}"
+
+
+def controls():
+    return rx.vstack(
+        rx.text(f"{ReplayState.state}: {ReplayState.record_time} s"),
+        rx.hstack(
+            rx.cond(
+                ReplayState.is_playing,
+                rx.button("Pause", on_click=ReplayState.pause()),
+                rx.button("Play", on_click=ReplayState.play()),
+            ),
+            rx.select(SPEEDS, value=ReplayState.speed, on_change=ReplayState.change_speed),
+            rx.text(f"{ReplayState.display_clock} s"),
+            align="center",
+        ),
+        rx.slider(
+            value=[ReplayState.position],
+            min=0,
+            max=ReplayState.total_moves,
+            on_value_commit=ReplayState.seek,
+            width="300px",
+        ),
+        rx.text(f"Move {ReplayState.position} / {ReplayState.total_moves}"),
+        rx.button(
+            "Back to Records",
+            variant="soft",
+            on_click=[rx.redirect("/minesweaper/records"), MSRecordState.set_state(ReplayState.state)],
+        ),
+        align="center",
+    )
+
+
+def render_box(state: str):
+    return rx.box(
+        rx.center(get_box_content(state)),
+        bg=get_background_color(state),
+        width=f"{BOX_SIZE}px",
+        height=f"{BOX_SIZE}px",
+        border=THEME_BORDER,
+        text_align="center",
+    )
+
+
+def display_board():
+    return rx.grid(
+        rx.foreach(ReplayState.coded_board.split(""), render_box),
+        columns=ReplayState.width.to_string(),
+        border=THEME_BORDER,
+        justify="center",
+    )
+
+
+@rx.page(route="/minesweaper/replay", title="Mine Sweaper Replay", on_load=ReplayState.on_load())
+@ms_pages(head_text="Replay")
+def ms_replay() -> List[rx.Component]:
+    return [
+        rx.cond(
+            ReplayState.record_id != 0,
+            rx.vstack(controls(), display_board(), align="center"),
+            rx.text("This replay is not available"),
+        )
+    ]
@@ -0,0 +1,204 @@
+import asyncio
+import secrets
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..broadcast import Broadcaster
+
+# レースの状態
+WAITING = "waiting"
+RUNNING = "running"
+# プレイヤーの状態
+PLAYING = "playing"
+CLEARED = "cleared"
+FAILED = "failed"
+STATUS_ORDER = {CLEARED: 0, PLAYING: 1, FAILED: 2}
+MAX_PLAYERS = 20
+# 進捗をまとめて送る間隔（秒）。この間の操作は1つのメッセージにまとめる
+PROGRESS_INTERVAL = 0.25
+# 作成から削除するまでの時間（秒）
+RACE_TTL = 3600
+
+# 名前、開けたセルの割合（%）、旗の数、状態、クリアした時間（クリアしていないときは-1）
+Progress = Tuple[str, int, int, str, int]
+
+
+class Player:
+    __slots__ = ("name", "revealed", "flags", "status", "finish_time")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.revealed = 0
+        self.flags = 0
+        self.status = PLAYING
+        self.finish_time = -1
+
+
+class Race:
+    """
+    全てのプレイヤーが同じシードの盤面で競うレース。
+    盤面はシードから各プロセスで一度だけ生成して共有し、レースにはプレイヤーごとの進捗のみを保持する。
+    """
+
+    race_id: str
+    height: int
+    width: int
+    num_mines: int
+    seed: int
+    host: str
+    # クライアントのトークン -> プレイヤー（参加順）
+    players: Dict[str, Player]
+    status: str
+    started_at: float
+    created_at: float
+
+    def __init__(self, race_id: str, height: int, width: int, num_mines: int, host: str) -> None:
+        self.race_id = race_id
+        self.height = height
+        self.width = width
+        self.num_mines = num_mines
+        self.seed = secrets.randbits(63)
+        self.host = host
+        self.players = {}
+        self.status = WAITING
+        self.started_at = 0.0
+        self.created_at = time.monotonic()
+
+    @property
+    def num_remain_cells(self) -> int:
+        return self.height * self.width - self.num_mines
+
+    def join(self, token: str, name: str) -> bool:
+        """
+        レースに参加する。既に参加しているときは名前のみ更新する。
+
+        Args:
+            token (str): クライアントのトークン
+            name (str): 表示する名前
+
+        Returns:
+            bool: 参加できたときにTrue（開始後や満員のときは新たに参加できない）
+        """
+        if token in self.players:
+            self.players[token].name = name
+            return True
+        if self.status != WAITING or len(self.players) >= MAX_PLAYERS:
+            return False
+        self.players[token] = Player(name)
+        return True
+
+    def start(self):
+        self.status = RUNNING
+        self.started_at = time.monotonic()
+
+    def elapsed_time(self) -> int:
+        return int(time.monotonic() - self.started_at)
+
+    def update(self, token: str, revealed: int, flags: int, status: str):
+        """
+        プレイヤーの進捗を更新する
+
+        Args:
+            token (str): クライアントのトークン
+            revealed (int): 開けたセルの数
+            flags (int): 置いた旗の数
+            status (str): プレイヤーの状態
+        """
+        player = self.players[token]
+        player.revealed = revealed
+        player.flags = flags
+        if player.status == PLAYING and status == CLEARED:
+            player.finish_time = self.elapsed_time()
+        player.status = status
+
+    def to_progress(self) -> List[Progress]:
+        """
+        全プレイヤーの進捗を、クリアした人（早い順）、プレイ中の人、失敗した人の順に、開けたセルの多い順で並べる
+
+        Returns:
+            List[Progress]: 進捗
+        """
+        players = sorted(
+            self.players.values(),
+            key=lambda p: (STATUS_ORDER[p.status], p.finish_time, -p.revealed),
+        )
+        return [
+            (p.name, p.revealed * 100 // self.num_remain_cells, p.flags, p.status, p.finish_time) for p in players
+        ]
+
+    def to_delta(self) -> dict:
+        """
+        参加者に送る変数（レースの状態の変数名と同じ）
+
+        Returns:
+            dict: 変数名 -> 値
+        """
+        return {"race_status": self.status, "progress": self.to_progress()}
+
+
+class RaceStore(Broadcaster):
+    """
+    プロセス内でレースを管理する。
+    進捗の更新はレースに印を付けるのみとし、PROGRESS_INTERVALごとに印の付いたレースの進捗をまとめて送る。
+    そのため、送信の数はクリックの数によらず、レースごとに一定間隔で1回となる。
+    """
+
+    PREFIX = "msrace"
+    races: Dict[str, Race]
+    # 前回の送信から変化したレース
+    dirty: Set[str]
+
+    def __init__(self) -> None:
+        self.races = {}
+        self.dirty = set()
+
+    def create(self, height: int, width: int, num_mines: int, host: str) -> Race:
+        race_id = secrets.token_hex(3)
+        while race_id in self.races:
+            race_id = secrets.token_hex(3)
+        race = self.races[race_id] = Race(race_id, height, width, num_mines, host)
+        return race
+
+    def get(self, race_id: str) -> Optional[Race]:
+        return self.races.get(race_id)
+
+    def mark(self, race_id: str):
+        """
+        レースの進捗を次の送信に含める
+
+        Args:
+            race_id (str): レースのID
+        """
+        self.dirty.add(race_id)
+
+    async def flush(self):
+        """
+        印の付いたレースの進捗を、レースごとに一度の送信で参加者全員に送る
+        """
+        dirty, self.dirty = self.dirty, set()
+        for race_id in dirty:
+            race = self.races.get(race_id)
+            if race is not None:
+                await self.fanout(race_id, race.to_delta())
+
+    def expire(self):
+        now = time.monotonic()
+        for race_id in [race_id for race_id, race in self.races.items() if now - race.created_at > RACE_TTL]:
+            del self.races[race_id]
+            self.dirty.discard(race_id)
+
+    async def serve(self):
+        """
+        一定間隔で進捗を送り、古いレースを削除する
+        """
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            await self.flush()
+            self.expire()
+
+
+_store = RaceStore()
+
+
+def get_store() -> RaceStore:
+    return _store
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import pickle
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from typing import ClassVar, Dict, Optional, Tuple
+
+import numpy as np
+import reflex as rx
+from reflex.event import Event
+from reflex.middleware import Middleware
+from reflex.state import BaseState, StateManagerDisk, StateManagerMemory, _substate_key
+
+# 操作がないゲームエンジンを退避するまでの秒数
+SESSION_TTL = float(os.environ.get("WEB_GAMES_SESSION_TTL", "900"))
+# 展開中のゲームエンジンに使うメモリの上限（超えた分は古いものから退避する）
+ENGINE_BUDGET = int(float(os.environ.get("WEB_GAMES_ENGINE_BUDGET_MB", "256")) * 2**20)
+# 操作がないセッションを状態管理から取り除くまでの秒数
+SESSION_EXPIRE = float(os.environ.get("WEB_GAMES_SESSION_EXPIRE", "86400"))
+REAP_INTERVAL = 30.0
+
+
+def estimate_size(obj, depth: int = 3) -> int:
+    """
+    オブジェクトのおおよそのメモリ使用量を求める
+
+    Args:
+        obj: 対象のオブジェクト
+        depth (int, optional): 属性や要素を辿る深さ
+
+    Returns:
+        int: おおよそのバイト数
+    """
+    if isinstance(obj, np.ndarray):
+        # 読み取り専用の配列はセッション間で共有しているものとして数えない
+        owned = obj.base is None and obj.flags.writeable
+        return sys.getsizeof(obj) + (obj.nbytes if owned else 0)
+    size = sys.getsizeof(obj)
+    if depth == 0:
+        return size
+    if hasattr(obj, "__dict__"):
+        size += sum(estimate_size(value, depth - 1) for value in vars(obj).values())
+    elif isinstance(obj, dict):
+        size += sum(estimate_size(value, depth - 1) for value in obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(value, depth - 1) for value in obj)
+    return size
+
+
+class EvictableMixin(rx.State, mixin=True):
+    """
+    ゲームエンジンを圧縮して退避し、次のイベントで復元できる状態
+    """
+
+    # 退避・復元するバックエンド変数
+    ENGINE_VARS: ClassVar[Tuple[str, ...]] = ("_game",)
+    # 退避したゲームエンジン
+    _snapshot: Optional[bytes] = None
+
+    def _evict(self):
+        if self._snapshot is not None:
+            return
+        engines = tuple(getattr(self, name, None) for name in self.ENGINE_VARS)
+        self._snapshot = zlib.compress(pickle.dumps(engines, protocol=pickle.HIGHEST_PROTOCOL))
+        for name in self.ENGINE_VARS:
+            setattr(self, name, None)
+        self._on_evict()
+
+    def _rehydrate(self):
+        if self._snapshot is None:
+            return
+        engines = pickle.loads(zlib.decompress(self._snapshot))
+        for name, engine in zip(self.ENGINE_VARS, engines):
+            setattr(self, name, engine)
+        self._snapshot = None
+        self._on_rehydrate()
+
+    def _on_evict(self):
+        """
+        退避した後に呼ばれる。タイマーなどを止める場合に上書きする。
+        """
+
+    def _on_rehydrate(self):
+        """
+        復元した後に呼ばれる。退避したときに止めたものを動かし直す場合に上書きする。
+        """
+
+
+class _Entry:
+    __slots__ = ("last_seen", "size", "engine_id")
+
+    def __init__(self) -> None:
+        self.last_seen = 0.0
+        self.size = 0
+        self.engine_id = 0
+
+
+# 展開中のゲームエンジン（状態のキー -> 最終操作時刻など）。最近操作したものほど末尾に置く
+_engines: "OrderedDict[str, _Entry]" = OrderedDict()
+# セッション（クライアントのトークン -> 最終操作時刻）
+_sessions: "OrderedDict[str, float]" = OrderedDict()
+
+
+def touch(token: str, state: EvictableMixin):
+    """
+    ゲームエンジンを操作したことを記録する
+
+    Args:
+        token (str): クライアントのトークン
+        state (EvictableMixin): 操作した状態
+    """
+    key = _substate_key(token, state)
+    entry = _engines.pop(key, None) or _Entry()
+    entry.last_seen = time.monotonic()
+    engine = getattr(state, state.ENGINE_VARS[0], None)
+    if entry.engine_id != id(engine):
+        # エンジンが作り直されたときのみ大きさを求め直す
+        entry.engine_id = id(engine)
+        entry.size = sum(estimate_size(getattr(state, name, None)) for name in state.ENGINE_VARS)
+    _engines[key] = entry
+
+
+def engine_memory() -> int:
+    return sum(entry.size for entry in _engines.values())
+
+
+def num_live_engines() -> int:
+    return len(_engines)
+
+
+class SessionMiddleware(Middleware):
+    """
+    イベントの処理前に、退避したゲームエンジンを復元し、操作時刻を記録する
+    """
+
+    async def preprocess(self, app, state: BaseState, event: Event):
+        token = event.token
+        _sessions.pop(token, None)
+        _sessions[token] = time.monotonic()
+        substate, handler = state._get_event_handler(event)
+        # バックグラウンドのイベントはゲームエンジンを使わず、状態もロックの外で変更できない
+        if not handler.is_background and isinstance(substate, EvictableMixin):
+            substate._rehydrate()
+            touch(token, substate)
+        return None
+
+
+async def evict(app: rx.App, key: str):
+    """
+    ゲームエンジンを退避する
+
+    Args:
+        app (rx.App): アプリ
+        key (str): 状態のキー
+    """
+    _engines.pop(key, None)
+    async with app.state_manager.modify_state(key) as root:
+        substate = root.get_substate(key.partition("_")[2].split("."))
+        if isinstance(substate, EvictableMixin):
+            substate._evict()
+
+
+async def reap(app: rx.App, now: Optional[float] = None) -> Dict[str, int]:
+    """
+    一定時間操作のないゲームエンジンや、メモリの上限を超えた分のゲームエンジンを退避する。
+    さらに長く操作のないセッションは状態管理から取り除く。
+    取り除くのは状態をプロセス内に持つStateManagerMemoryとStateManagerDiskのみで、その内部の変数に依存する。
+    Redisの状態管理では、Reflexのtoken_expirationによる期限切れに任せる。
+
+    Args:
+        app (rx.App): アプリ
+        now (Optional[float], optional): 現在時刻（time.monotonic）
+
+    Returns:
+        Dict[str, int]: 退避したエンジンと取り除いたセッションの数
+    """
+    now = time.monotonic() if now is None else now
+    num_evicted = 0
+    total = engine_memory()
+    while len(_engines) > 0:
+        key, entry = next(iter(_engines.items()))
+        if now - entry.last_seen < SESSION_TTL and total <= ENGINE_BUDGET:
+            break
+        total -= entry.size
+        await evict(app, key)
+        num_evicted += 1
+
+    num_expired = 0
+    manager = app.state_manager
+    can_expire = isinstance(manager, (StateManagerMemory, StateManagerDisk))
+    while len(_sessions) > 0:
+        token, last_seen = next(iter(_sessions.items()))
+        if now - last_seen < SESSION_EXPIRE:
+            break
+        del _sessions[token]
+        if not can_expire:
+            continue
+        lock = manager._states_locks.get(token)
+        if lock is not None and lock.locked():
+            continue
+        # 再度アクセスされたときは、Reflexがクライアントに再読み込みさせる（ディスク管理ならファイルから復元される）
+        manager.states.pop(token, None)
+        manager._states_locks.pop(token, None)
+        for key in [key for key in _engines if key.startswith(f"{token}_")]:
+            del _engines[key]
+        num_expired += 1
+    return {"evicted": num_evicted, "expired": num_expired}
+
+
+async def reap_sessions(reflex_app: rx.App):
+    """
+    定期的にreapを実行するライフスパンタスク
+    """
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        await reap(reflex_app)
@@ -0,0 +1,327 @@
+"""
+メニューのページ（/、/tictactoe、/minesweaper）を、Reflexを読み込まない静的なHTMLとして書き出す。
+これらのページは状態を使わないため、JavaScriptの読み込みやバックエンドへのwebsocketの接続を待たずに表示できる。
+ゲームへのリンクは通常のリンクとし、ゲームのページを開いたときに初めてwebsocketに接続する。
+画像は表示する大きさに縮小してHTMLに埋め込み、1ページを1回のリクエストで表示する。
+
+Example:
+    reflex export --frontend-only --no-zip
+    python -m web_games_app.static_pages --out .web/_static
+    python -m web_games_app.static_pages --icons  # アイコンの画像を変えたとき
+"""
+
+import argparse
+import base64
+import html
+import os
+import struct
+import zlib
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from .minesweaper.pages.index import DIFFICULTIES
+from .minesweaper.pages.minesweaper import play_url
+from .templates.minesweaper import ICON_SPRITE_PATH, ICONS
+from .tictactoe.pages.gomoku import GOMOKU_LENGTH
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# スプライトの1つのアイコンの大きさ。表示は最大30pxのため、高解像度の画面でもぼやけない2倍強とする
+ICON_PIXELS = 64
+# 内容のハッシュをURLに含むファイルは長期間キャッシュし、メニューは更新が早く反映されるよう短くする
+LONG_CACHE = "public, max-age=31536000, immutable"
+PAGE_CACHE = "public, max-age=600"
+
+CSS = """
+:root { color-scheme: light dark; --fg: #1c2024; --bg: #fff; --gray: #8b8d98; --accent: #30a46c; --soft: #e9f6e9; }
+@media (prefers-color-scheme: dark) {
+  :root { --fg: #edeef0; --bg: #111113; --gray: #696e77; --accent: #3dd68c; --soft: #132d21; }
+}
+body { margin: 0; font-family: system-ui, sans-serif; color: var(--fg); background: var(--bg); }
+main { max-width: 1100px; margin: 2em auto; padding: 2em; border: 1px solid var(--fg); border-radius: 5px;
+  box-shadow: 0 0 10px 0 var(--gray); display: flex; flex-direction: column; align-items: center; gap: 1em; }
+h1 { margin: 0; font-size: 3.5em; text-align: center; }
+hr { width: 100%; border: none; border-top: 1px solid var(--gray); }
+a { color: inherit; text-decoration: none; }
+.column, .row { display: flex; align-items: center; gap: 1em; }
+.column { flex-direction: column; }
+.row { flex-wrap: wrap; justify-content: center; }
+.tile { display: flex; flex-direction: column; align-items: center; gap: 0.5em; cursor: pointer; }
+.title { font-size: 2em; font-weight: bold; }
+.card { width: 200px; padding: 0.5em 0; border: 1px solid var(--fg); border-radius: 5px;
+  box-shadow: 0 0 10px 0 var(--gray); text-align: center; }
+.card .title { font-size: 1em; }
+.button { display: inline-block; padding: 0.3em 0.9em; border-radius: 8px; background: var(--accent); color: #fff; }
+.soft { background: var(--soft); color: var(--accent); font-size: 0.8em; }
+.back { position: fixed; bottom: 1em; right: 1em; display: flex; flex-direction: column; align-items: end;
+  gap: 0.25em; }
+"""
+
+
+# ** PNG **
+def _unfilter_row(kind: int, line: np.ndarray, prev: np.ndarray) -> np.ndarray:
+    if kind == 0:
+        return line.copy()
+    if kind == 1:
+        # 左のピクセルとの差分は、ピクセルごとの累積和で戻せる（uint8の桁あふれがそのまま剰余になる）
+        return np.cumsum(line.reshape(-1, 4), axis=0, dtype=np.uint8).ravel()
+    if kind == 2:
+        return line + prev
+    # 平均とPaethは左の復元結果に依存するため、1バイトずつ戻す
+    out = bytearray(line.tobytes())
+    up = prev.tobytes()
+    for i in range(len(out)):
+        a = out[i - 4] if i >= 4 else 0
+        b = up[i]
+        if kind == 3:
+            out[i] = (out[i] + ((a + b) >> 1)) & 0xFF
+        else:
+            c = up[i - 4] if i >= 4 else 0
+            pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+            out[i] = (out[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+    return np.frombuffer(bytes(out), dtype=np.uint8)
+
+
+def read_png(path: str) -> np.ndarray:
+    """
+    8ビットのRGBAのPNGを読み込む
+
+    Args:
+        path (str): ファイルのパス
+
+    Returns:
+        np.ndarray: (高さ, 幅, 4)の画像
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data[:8] == PNG_SIGNATURE, f"{path} is not a PNG file"
+    pos = 8
+    idat = []
+    while pos < len(data):
+        length, kind = struct.unpack(">I4s", data[pos : pos + 8])
+        body = data[pos + 8 : pos + 8 + length]
+        if kind == b"IHDR":
+            width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", body)
+            assert (depth, color, interlace) == (8, 6, 0), f"{path} is not a non-interlaced 8-bit RGBA PNG"
+        elif kind == b"IDAT":
+            idat.append(body)
+        pos += 12 + length
+    raw = np.frombuffer(zlib.decompress(b"".join(idat)), dtype=np.uint8).reshape(height, width * 4 + 1)
+    image = np.zeros((height, width * 4), dtype=np.uint8)
+    prev = image[0]
+    for y in range(height):
+        image[y] = prev = _unfilter_row(int(raw[y, 0]), raw[y, 1:], prev)
+    return image.reshape(height, width, 4)
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """
+    (高さ, 幅, 4)の画像をPNGにする。フィルタはなし・左との差分・上との差分のうち最も小さくなるものを使う。
+
+    Args:
+        image (np.ndarray): 画像
+
+    Returns:
+        bytes: PNGのデータ
+    """
+    height, width, _ = image.shape
+    rows = image.reshape(height, width * 4)
+    left = np.zeros_like(rows)
+    left[:, 4:] = rows[:, :-4]
+    up = np.zeros_like(rows)
+    up[1:] = rows[:-1]
+    idat = b""
+    for kind, base in ((0, np.zeros_like(rows)), (1, left), (2, up)):
+        filtered = np.hstack([np.full((height, 1), kind, dtype=np.uint8), rows - base])
+        compressed = zlib.compress(filtered.tobytes(), 9)
+        if not idat or len(compressed) < len(idat):
+            idat = compressed
+
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return PNG_SIGNATURE + chunk(b"IHDR", header) + chunk(b"IDAT", idat) + chunk(b"IEND", b"")
+
+
+def resize(image: np.ndarray, height: int, width: int) -> np.ndarray:
+    """
+    画像を縮小する。縮小後の各ピクセルに含まれる元のピクセルを、透明度で重み付けして平均する。
+
+    Args:
+        image (np.ndarray): (高さ, 幅, 4)の画像
+        height (int): 縮小後の高さ
+        width (int): 縮小後の幅
+
+    Returns:
+        np.ndarray: 縮小した画像
+    """
+    src_height, src_width, _ = image.shape
+    rows = np.arange(height) * src_height // height
+    cols = np.arange(width) * src_width // width
+    pixels = image.astype(np.float64)
+    alpha = pixels[..., 3:]
+    # 透明なピクセルの色が混ざらないよう、透明度を掛けてから足し合わせる
+    weighted = np.concatenate([pixels[..., :3] * alpha, alpha], axis=2)
+    sums = np.add.reduceat(np.add.reduceat(weighted, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, src_height)), np.diff(np.append(cols, src_width)))[..., None]
+    color = np.divide(sums[..., :3], sums[..., 3:], out=np.zeros_like(sums[..., :3]), where=sums[..., 3:] > 0)
+    result = np.concatenate([color, sums[..., 3:] / counts], axis=2)
+    return np.clip(np.rint(result), 0, 255).astype(np.uint8)
+
+
+def thumbnail(path: str, height: int) -> str:
+    """
+    画像を表示する高さの2倍に縮小し、HTMLに埋め込めるdata URLにする
+
+    Args:
+        path (str): assetsからの画像のパス
+        height (int): 表示する高さ
+
+    Returns:
+        str: data URL
+    """
+    image = read_png(os.path.join(ASSETS_DIR, path))
+    if image.shape[0] > 2 * height:
+        image = resize(image, 2 * height, image.shape[1] * 2 * height // image.shape[0])
+    return "data:image/png;base64," + base64.b64encode(encode_png(image)).decode("ascii")
+
+
+def build_icons():
+    """
+    マインスイーパーのアイコンを縮小し、ICONSの順に横に並べた1枚の画像にする
+    """
+    icons = [
+        resize(read_png(os.path.join(ASSETS_DIR, "minesweaper", f"{name}.png")), ICON_PIXELS, ICON_PIXELS)
+        for name in ICONS
+    ]
+    with open(ICON_SPRITE_PATH, "wb") as f:
+        f.write(encode_png(np.hstack(icons)))
+
+
+# ** ページ **
+def image(path: str, height: int) -> str:
+    return f'<img src="{thumbnail(path, height)}" height="{height}" alt="">'
+
+
+def link(href: str, content: str, class_name: str = "tile") -> str:
+    return f'<a class="{class_name}" href="{html.escape(href)}">{content}</a>'
+
+
+def text(content: str, class_name: str = "title") -> str:
+    attribute = f' class="{class_name}"' if class_name else ""
+    return f"<span{attribute}>{html.escape(content)}</span>"
+
+
+def render(title: str, head_text: str, content: str, backs: List[Tuple[str, str]]) -> str:
+    back = "".join(link(href, html.escape(label), "button") for label, href in backs)
+    return (
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">\n'
+        f'<title>{html.escape(title)}</title>\n<link rel="icon" href="/favicon.ico">\n<style>{CSS}</style>\n'
+        f"</head>\n<body>\n<main>\n<h1>{html.escape(head_text)}</h1>\n<hr>\n{content}\n</main>\n"
+        f'<nav class="back">{back}</nav>\n</body>\n</html>\n'
+    )
+
+
+def index_page() -> str:
+    content = '<div class="column">{}{}</div>'.format(
+        link(
+            "/tictactoe/",
+            text("Tic Tac Toe")
+            + f'<div class="row">{image("tictactoe/2d_tictactoe.png", 100)}'
+            + f'{image("tictactoe/3d_tictactoe.png", 100)}</div>',
+        ),
+        link("/minesweaper/", text("Mine Sweaper") + image("minesweaper/minesweaper.png", 150)),
+    )
+    return render("Web Games", "Welcome to My Web Games!", content, [])
+
+
+def t3_index_page() -> str:
+    tiles = [
+        link("/tictactoe/2d/", text("2D", "button") + image("tictactoe/2d_tictactoe.png", 200)),
+        link("/tictactoe/3d/", text("3D", "button") + image("tictactoe/3d_tictactoe.png", 200)),
+        link("/tictactoe/gomoku/", text("Gomoku", "button") + text(f"{GOMOKU_LENGTH} in a row on up to 19 x 19", "")),
+        link("/tictactoe/rooms/", text("Online", "button") + text("Play with a friend or watch a game", "")),
+    ]
+    content = f'<div class="row">{"".join(tiles)}</div>'
+    return render("Tic Tac Toe", "Welcome to Tic Tac Toe!", content, [("Back to Top", "/")])
+
+
+def ms_index_page() -> str:
+    cards = [
+        link(
+            play_url(height, width, num_mines),
+            text(name) + text(f"{height} x {width}", "") + "<br>" + text(f"{num_mines} mines", ""),
+            "tile card",
+        )
+        for name, height, width, num_mines in DIFFICULTIES
+    ]
+    daily = "".join(
+        link(play_url(height, width, num_mines, True), html.escape(name), "button soft")
+        for name, height, width, num_mines in DIFFICULTIES
+    )
+    cards.append(f'<div class="tile card">{text("Daily Challenge")}<div class="row">{daily}</div></div>')
+    for name, href in [
+        ("Custom", "/minesweaper/custom/"),
+        ("Cube", "/minesweaper/3d/"),
+        ("Huge", "/minesweaper/huge/"),
+        ("Race", "/minesweaper/race/"),
+        ("Records", "/minesweaper/records/"),
+    ]:
+        cards.append(link(href, text(name), "tile card"))
+    content = f'<div class="column">{"".join(cards)}</div>'
+    return render("Mine Sweaper", "Welcome to Mine Sweaper!", content, [("Back to Top", "/")])
+
+
+# ルート -> ページを生成する関数（Reflexのページと同じ内容）
+PAGES: Dict[str, Callable[[], str]] = {
+    "/": index_page,
+    "/tictactoe/": t3_index_page,
+    "/minesweaper/": ms_index_page,
+}
+
+
+def headers() -> str:
+    """
+    静的ホスティング向けのキャッシュの設定（_headers形式）を作る
+
+    Returns:
+        str: 設定
+    """
+    rules = [("/_next/static/*", LONG_CACHE), ("/minesweaper/icons.png", LONG_CACHE)]
+    rules += [(route, PAGE_CACHE) for route in PAGES]
+    return "".join(f"{route}\n  Cache-Control: {value}\n" for route, value in rules)
+
+
+def write_pages(out: str):
+    """
+    書き出したフロントエンドのメニューのページを、静的なHTMLで置き換える
+
+    Args:
+        out (str): reflex exportで書き出したディレクトリ
+    """
+    for route, page in PAGES.items():
+        path = os.path.join(out, route.strip("/"), "index.html")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(page())
+    with open(os.path.join(out, "_headers"), "w") as f:
+        f.write(headers())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join(".web", "_static"), help="reflex exportで書き出したディレクトリ")
+    parser.add_argument("--icons", action="store_true", help="アイコンの画像（スプライト）を作り直す")
+    args = parser.parse_args()
+
+    if args.icons:
+        build_icons()
+        print(f"wrote {ICON_SPRITE_PATH} ({os.path.getsize(ICON_SPRITE_PATH)} bytes)")
+    else:
+        write_pages(args.out)
+        for route in PAGES:
+            path = os.path.join(args.out, route.strip("/"), "index.html")
+            print(f"wrote {path} ({os.path.getsize(path)} bytes)")
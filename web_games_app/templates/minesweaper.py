@@ -1,3 +1,5 @@
+import hashlib
+import os
 from typing import Callable
 
 import reflex as rx
@@ -5,6 +7,41 @@ import reflex as rx
 from ..style import BACK_COMPONENT_STYLE
 from .template import back_component, template
 
+# マインスイーパーのアイコン。static_pages.pyで縮小し、この順に横に並べた1枚の画像にしている
+ICONS = ("flag", "mine", "clock")
+ICON_SPRITE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "assets", "minesweaper", "icons.png"
+)
+
+
+def _icon_sprite_url() -> str:
+    # 内容のハッシュをURLに含め、長期間キャッシュしても画像の更新が反映されるようにする
+    if not os.path.exists(ICON_SPRITE_PATH):
+        return "/minesweaper/icons.png"
+    with open(ICON_SPRITE_PATH, "rb") as f:
+        return f"/minesweaper/icons.png?v={hashlib.sha256(f.read()).hexdigest()[:8]}"
+
+
+ICON_SPRITE_URL = _icon_sprite_url()
+
+
+def ms_icon(name: str, size: int):
+    """
+    アイコンを画像から切り出して表示する。全てのアイコンで1つの画像を共有するため、読み込みは1回で済む。
+
+    Args:
+        name (str): ICONSのいずれか
+        size (int): 表示する大きさ（px）
+    """
+    return rx.box(
+        width=f"{size}px",
+        height=f"{size}px",
+        flex_shrink="0",
+        background_image=f"url({ICON_SPRITE_URL})",
+        background_size=f"{size * len(ICONS)}px {size}px",
+        background_position=f"-{size * ICONS.index(name)}px 0",
+    )
+
 
 def ms_back_component(need_back_t3: bool = True):
     if need_back_t3:
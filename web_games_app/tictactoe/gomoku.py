@@ -0,0 +1,199 @@
+import random
+from typing import List, Optional, Sequence, Set
+
+from .lines import EMPTY, LineBoard, make_lines
+
+# 盤面上の4方向（横、縦、右下、左下）
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+class Gomoku:
+    """
+    大きな盤面でk個並べると勝ちになる五目並べ。
+    SquareTicTacToeと同じく、board・rest・apply_selectで操作する。
+    """
+
+    size: int
+    length: int
+    num_cells: int
+    # EMPTY：空き、それ以外：石を置いたプレイヤー
+    board: List[int]
+    rest: Set[int]
+
+    def __init__(self, size: int, length: int = 5) -> None:
+        assert length <= size
+        self.size = size
+        self.length = length
+        self.num_cells = size**2
+        self.reset()
+
+    def reset(self):
+        """
+        盤面をリセットする
+        """
+        self.board = [EMPTY] * self.num_cells
+        self.rest = set(range(self.num_cells))
+
+    def count_stones(self, num: int, di: int, dj: int) -> int:
+        """
+        セルから指定した方向に、同じプレイヤーの石が連続する数を数える（セル自身は含まない）
+
+        Args:
+            num (int): セルを表す数字
+            di (int): 行方向の向き
+            dj (int): 列方向の向き
+
+        Returns:
+            int: 連続する石の数
+        """
+        player = self.board[num]
+        i, j = divmod(num, self.size)
+        count = 0
+        for _ in range(self.length - 1):
+            i, j = i + di, j + dj
+            if not (0 <= i < self.size and 0 <= j < self.size) or self.board[i * self.size + j] != player:
+                break
+            count += 1
+        return count
+
+    def apply_select(self, turn: int, num: int) -> bool:
+        """
+        セルに石を置く。置いたセルを通る4方向のみを調べて勝敗を判定する。
+
+        Args:
+            turn (int): 手数（偶数：先攻、奇数：後攻）
+            num (int): 置くセル
+
+        Returns:
+            bool: 石が並んだときにTrueを返す
+        """
+        self.board[num] = turn % 2
+        self.rest.remove(num)
+        return any(
+            self.count_stones(num, di, dj) + self.count_stones(num, -di, -dj) + 1 >= self.length
+            for di, dj in DIRECTIONS
+        )
+
+
+class PatternBoard(LineBoard):
+    """
+    長さkの窓ごとの石の数に加えて、各セルの評価値（LineBoard.evaluateの値）を差分で更新する盤面。
+    石を置くと、そのセルを通る窓に含まれるセルの評価値のみを更新する。
+    """
+
+    # プレイヤーごと・セルごとの評価値
+    scores: List[List[int]]
+
+    def reset(self):
+        super().reset()
+        self.scores = [[0] * self.num_cells, [0] * self.num_cells]
+        for line in range(len(self.lines)):
+            self._add_scores(line, 1)
+
+    def _add_scores(self, line: int, sign: int):
+        # 窓の評価値への寄与を、窓に含まれる全てのセルに加える（sign=-1で取り除く）
+        for player in (0, 1):
+            own, other = self.counts[player][line], self.counts[1 - player][line]
+            if other == 0:
+                value = 1 << (2 * own + 1)
+            elif own == 0:
+                value = 1 << (2 * other)
+            else:
+                continue
+            scores = self.scores[player]
+            for cell in self.lines[line]:
+                scores[cell] += sign * value
+
+    def make(self, cell: int, player: int) -> bool:
+        for line in self.cell_lines[cell]:
+            self._add_scores(line, -1)
+        is_win = super().make(cell, player)
+        for line in self.cell_lines[cell]:
+            self._add_scores(line, 1)
+        return is_win
+
+    def unmake(self):
+        cell = self.history[-1][0]
+        for line in self.cell_lines[cell]:
+            self._add_scores(line, -1)
+        super().unmake()
+        for line in self.cell_lines[cell]:
+            self._add_scores(line, 1)
+
+    def evaluate(self, cell: int, player: int) -> int:
+        return self.scores[player][cell]
+
+
+class GomokuSelector:
+    """
+    評価値の表を差分で更新しながら手を選ぶ。
+    勝てる手があれば指し、相手が勝てる手があれば塞ぎ、それ以外は評価値が最大のセルを選ぶ。
+    """
+
+    patterns: PatternBoard
+
+    def __init__(self, size: int, length: int = 5, seed: Optional[int] = None) -> None:
+        self.size = size
+        self.patterns = PatternBoard(size**2, make_lines((size, size), length))
+        self.rng = random.Random(seed)
+
+    def sync(self, board: Sequence[int]):
+        """
+        エンジンの盤面に合わせる。前回から追加された石のみを置く。
+
+        Args:
+            board (Sequence[int]): 盤面（EMPTYと各プレイヤーの番号）
+        """
+        # 置いた石が消えたか変わったときは新しいゲームとして置き直す
+        if any(known != EMPTY and state != known for known, state in zip(self.patterns.board, board)):
+            self.patterns.reset()
+        # resetで盤面のリストが入れ替わるため、リセットの後に読む
+        known = self.patterns.board
+        for cell, state in enumerate(board):
+            if state != EMPTY and known[cell] == EMPTY:
+                self.patterns.make(cell, state)
+
+    def select(self, board: Sequence[int], player: int) -> int:
+        """
+        手を選ぶ
+
+        Args:
+            board (Sequence[int]): 盤面（EMPTYと各プレイヤーの番号）
+            player (int): 手番のプレイヤー
+
+        Returns:
+            int: 選んだセル
+        """
+        self.sync(board)
+        patterns = self.patterns
+        for p in (player, 1 - player):
+            if patterns.threats[p]:
+                return next(iter(patterns.threats[p]))
+        # 評価値（攻めと守りの和）が最大のセルを選ぶ（同点のときはランダム）
+        scores = patterns.scores[player]
+        best = max(scores[cell] for cell in patterns.rest)
+        return self.rng.choice([cell for cell in patterns.rest if scores[cell] == best])
+
+
+if __name__ == "__main__":
+    import time
+
+    for size in (15, 19):
+        game = Gomoku(size)
+        selectors = [GomokuSelector(size, seed=0), GomokuSelector(size, seed=1)]
+        times: List[float] = []
+        turn = 0
+        while game.rest:
+            start = time.perf_counter()
+            num = selectors[turn % 2].select(game.board, turn % 2)
+            is_win = game.apply_select(turn, num)
+            times.append(time.perf_counter() - start)
+            if is_win:
+                break
+            turn += 1
+        times.sort()
+        result = f"player {turn % 2} wins" if is_win else "draw"
+        print(
+            f"{size}x{size}: {result} after {len(times)} moves, "
+            f"select+apply p50={times[len(times) // 2] * 1000:.2f} ms, max={times[-1] * 1000:.2f} ms"
+        )
@@ -0,0 +1,295 @@
+import functools
+import itertools
+from typing import Dict, List, Sequence, Set, Tuple
+
+EMPTY = -1
+Line = Tuple[int, ...]
+
+
+def make_lines(shape: Sequence[int], length: int) -> List[Line]:
+    """
+    盤面上の縦・横・斜めの全ての方向で、指定した長さの連続したセルの並びを列挙する
+
+    Args:
+        shape (Sequence[int]): 盤面の形（2次元では(size, size)、3次元では(size, size, size)）
+        length (int): 並びの長さ。一辺の長さと同じときは三目並べの列となる
+
+    Returns:
+        List[Line]: セルを表す数字の並び
+    """
+    dim = len(shape)
+    strides = [1] * dim
+    for axis in reversed(range(dim - 1)):
+        strides[axis] = strides[axis + 1] * shape[axis + 1]
+    # 向きが逆のものは同じ並びになるため、最初の0でない成分が正の方向のみ使う
+    directions = [d for d in itertools.product((-1, 0, 1), repeat=dim) if any(d) and next(x for x in d if x) > 0]
+    lines = []
+    for start in itertools.product(*(range(n) for n in shape)):
+        for direction in directions:
+            end = [s + d * (length - 1) for s, d in zip(start, direction)]
+            if all(0 <= e < n for e, n in zip(end, shape)):
+                num = sum(s * stride for s, stride in zip(start, strides))
+                step = sum(d * stride for d, stride in zip(direction, strides))
+                lines.append(tuple(num + step * t for t in range(length)))
+    return lines
+
+
+@functools.lru_cache(maxsize=None)
+def get_lines(shape: Tuple[int, ...], length: int) -> Tuple[Line, ...]:
+    # 同じ形の盤面では列を使い回す
+    return tuple(make_lines(shape, length))
+
+
+def winning_cells(board: Sequence[int], lines: Sequence[Line], cell: int) -> List[int]:
+    """
+    最後に置いたセルを通る列のうち、そのセルに置いた石で揃った列のセルを求める
+
+    Args:
+        board (Sequence[int]): 盤面（EMPTYと各プレイヤーの番号）
+        lines (Sequence[Line]): 盤面の列
+        cell (int): 最後に置いたセル
+
+    Returns:
+        List[int]: 揃った列のセル（複数の列が同時に揃ったときは全ての列のセル）
+    """
+    player = board[cell]
+    cells: Set[int] = set()
+    for line in lines:
+        if cell in line and all(board[c] == player for c in line):
+            cells.update(line)
+    return sorted(cells)
+
+
+class LineBoard:
+    """
+    各列の石の数と、あと1手で揃う列（脅威）を差分で更新する盤面。
+    makeで1手進め、unmakeで1手戻せるため、盤面をコピーせずに探索できる。
+    どちらも選択したセルを通る列の数に比例する時間で済む。
+    """
+
+    num_cells: int
+    lines: List[Line]
+    # セルごとに、そのセルを通る列の番号
+    cell_lines: List[Tuple[int, ...]]
+    # プレイヤーごと・列ごとの石の数
+    counts: List[List[int]]
+    # EMPTY：空き、それ以外：石を置いたプレイヤー
+    board: List[int]
+    # 空いているセル
+    rest: Set[int]
+    # プレイヤーごとに、置くと列が揃うセル -> そのセルで揃う列の数
+    threats: List[Dict[int, int]]
+    # 置いたセルと、置く前のwinnerの履歴
+    history: List[Tuple[int, int]]
+    # 列を揃えたプレイヤー（まだいないときはEMPTY）
+    winner: int
+
+    def __init__(self, num_cells: int, lines: List[Line]) -> None:
+        self.num_cells = num_cells
+        self.lines = lines
+        cell_lines: List[List[int]] = [[] for _ in range(num_cells)]
+        for i, line in enumerate(lines):
+            for cell in line:
+                cell_lines[cell].append(i)
+        self.cell_lines = [tuple(ls) for ls in cell_lines]
+        self.reset()
+
+    @classmethod
+    def square(cls, size: int) -> "LineBoard":
+        return cls(size**2, make_lines((size, size), size))
+
+    @classmethod
+    def cube(cls, size: int) -> "LineBoard":
+        return cls(size**3, make_lines((size, size, size), size))
+
+    def reset(self):
+        """
+        盤面をリセットする
+        """
+        self.counts = [[0] * len(self.lines), [0] * len(self.lines)]
+        self.board = [EMPTY] * self.num_cells
+        self.rest = set(range(self.num_cells))
+        self.threats = [{}, {}]
+        self.history = []
+        self.winner = EMPTY
+
+    def load(self, board: Sequence[int], turn: int = 0):
+        """
+        三目並べのエンジンの盤面（EMPTYと各プレイヤーの番号）を読み込む
+
+        Args:
+            board (Sequence[int]): 盤面
+            turn (int, optional): 先に置いたとみなすプレイヤー（交互に置いた順序は結果に影響しない）
+        """
+        self.reset()
+        moves = [[cell for cell, state in enumerate(board) if state == player] for player in (0, 1)]
+        for i in range(max(len(moves[0]), len(moves[1]))):
+            for player in (turn % 2, (turn + 1) % 2):
+                if i < len(moves[player]):
+                    self.make(moves[player][i], player)
+
+    def _add_threat(self, player: int, cell: int, diff: int):
+        threats = self.threats[player]
+        count = threats.get(cell, 0) + diff
+        if count == 0:
+            del threats[cell]
+        else:
+            threats[cell] = count
+
+    def _missing_cell(self, line: int) -> int:
+        return next(cell for cell in self.lines[line] if self.board[cell] == EMPTY)
+
+    def make(self, cell: int, player: int) -> bool:
+        """
+        セルに石を置く
+
+        Args:
+            cell (int): 置くセル
+            player (int): 置くプレイヤー（0または1）
+
+        Returns:
+            bool: 列が揃ったときにTrueを返す
+        """
+        opponent = 1 - player
+        own, other = self.counts[player], self.counts[opponent]
+        self.board[cell] = player
+        self.rest.remove(cell)
+        is_win = False
+        for line in self.cell_lines[cell]:
+            need = len(self.lines[line]) - 1
+            if other[line] == 0:
+                if own[line] == need:
+                    # 脅威だったセルに置いて揃った
+                    self._add_threat(player, cell, -1)
+                    is_win = True
+                elif own[line] == need - 1:
+                    self._add_threat(player, self._missing_cell(line), 1)
+            elif own[line] == 0 and other[line] == need:
+                # 相手の脅威を塞いだ
+                self._add_threat(opponent, cell, -1)
+            own[line] += 1
+        self.history.append((cell, self.winner))
+        if is_win and self.winner == EMPTY:
+            self.winner = player
+        return is_win
+
+    def unmake(self):
+        """
+        最後に置いた石を取り除く
+        """
+        cell, self.winner = self.history.pop()
+        player = self.board[cell]
+        opponent = 1 - player
+        own, other = self.counts[player], self.counts[opponent]
+        for line in self.cell_lines[cell]:
+            own[line] -= 1
+            need = len(self.lines[line]) - 1
+            if other[line] == 0:
+                if own[line] == need:
+                    self._add_threat(player, cell, 1)
+                elif own[line] == need - 1:
+                    self._add_threat(player, self._missing_cell(line), -1)
+            elif own[line] == 0 and other[line] == need:
+                self._add_threat(opponent, cell, 1)
+        self.board[cell] = EMPTY
+        self.rest.add(cell)
+
+    def is_winning_move(self, cell: int, player: int) -> bool:
+        """
+        セルに置くと列が揃うか判定する
+
+        Args:
+            cell (int): 置くセル
+            player (int): 置くプレイヤー
+
+        Returns:
+            bool: 列が揃うときにTrue
+        """
+        return cell in self.threats[player]
+
+    def evaluate(self, cell: int, player: int) -> int:
+        """
+        セルに置いたときの評価値を求める。セルを通る列のうち、相手の石がない列ほど、自分の石が多い列ほど高くなる。
+        相手の列を塞ぐ価値も同様に加える。
+
+        Args:
+            cell (int): 置くセル
+            player (int): 置くプレイヤー
+
+        Returns:
+            int: 評価値
+        """
+        own, other = self.counts[player], self.counts[1 - player]
+        score = 0
+        for line in self.cell_lines[cell]:
+            if other[line] == 0:
+                score += 1 << (2 * own[line] + 1)
+            elif own[line] == 0:
+                score += 1 << (2 * other[line])
+        return score
+
+
+if __name__ == "__main__":
+    import time
+
+    def negamax(board: LineBoard, player: int) -> int:
+        # 全ての手を読み切る（勝ち：1、引き分け：0、負け：-1）
+        global nodes
+        best = -1
+        for cell in list(board.rest):
+            nodes += 1
+            if board.make(cell, player):
+                board.unmake()
+                return 1
+            score = -negamax(board, 1 - player) if board.rest else 0
+            board.unmake()
+            if score > best:
+                best = score
+                if best == 1:
+                    break
+        return best
+
+    def copy_negamax(board: List[int], lines: List[Line], player: int) -> int:
+        # 比較用：盤面をコピーして、全ての列を調べ直す
+        global nodes
+        best = -1
+        rest = [cell for cell, state in enumerate(board) if state == EMPTY]
+        for cell in rest:
+            nodes += 1
+            child = board.copy()
+            child[cell] = player
+            if any(all(child[c] == player for c in line) for line in lines):
+                return 1
+            score = -copy_negamax(child, lines, 1 - player) if len(rest) > 1 else 0
+            if score > best:
+                best = score
+                if best == 1:
+                    break
+        return best
+
+    for name, board in [("3x3", LineBoard.square(3)), ("4x4", LineBoard.square(4))]:
+        if name == "4x4":
+            # 4x4は全探索に時間がかかるため、数手進めた局面から読む
+            for cell, player in [(0, 0), (5, 1), (10, 0), (3, 1), (12, 0), (15, 1), (6, 0), (9, 1)]:
+                board.make(cell, player)
+        nodes = 0
+        start = time.perf_counter()
+        result = negamax(board, len(board.history) % 2)
+        elapsed = time.perf_counter() - start
+        print(f"{name} make/unmake: result={result}, {nodes} nodes, {nodes / elapsed:,.0f} nodes/s")
+
+        nodes = 0
+        start = time.perf_counter()
+        result = copy_negamax(board.board.copy(), board.lines, len(board.history) % 2)
+        elapsed = time.perf_counter() - start
+        print(f"{name} copy+rescan: result={result}, {nodes} nodes, {nodes / elapsed:,.0f} nodes/s")
+
+    cube = LineBoard.cube(5)
+    start = time.perf_counter()
+    for _ in range(2000):
+        for cell in range(cube.num_cells):
+            cube.make(cell, cell % 2)
+        while cube.history:
+            cube.unmake()
+    elapsed = time.perf_counter() - start
+    print(f"5x5x5 make+unmake: {2000 * cube.num_cells * 2 / elapsed:,.0f} moves/s")
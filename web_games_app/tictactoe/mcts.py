@@ -0,0 +1,403 @@
+import math
+import random
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..metrics import ENABLED, observe
+from .lines import EMPTY, Line, make_lines
+
+# 1秒あたりのプレイアウト数のバケット
+PLAYOUT_BUCKETS = (100, 250, 500, 1_000, 2_500, 5_000, 10_000, 25_000, 50_000)
+# ノードの結果...NOT_TERMINAL：未決着、WIN：そのノードへの手を指したプレイヤーの勝ち、DRAW：引き分け
+NOT_TERMINAL = 0
+WIN = 1
+DRAW = 2
+NO_CHILD = -1
+
+
+class MCTSSelector:
+    """
+    モンテカルロ木探索で手を選ぶ。
+    ノードはオブジェクトではなく固定長の配列（アリーナ）に確保し、子ノードは連続した範囲に置く。
+    局面はビットボード（プレイヤーごとの整数）で表し、ランダムなプレイアウトで評価する。
+    自分の手と相手の手に対応する部分木は次の探索で再利用する。
+    """
+
+    num_cells: int
+    # セルごとに、そのセルを通る列のビットマスク
+    cell_masks: List[Tuple[int, ...]]
+    line_masks: List[int]
+    line_length: int
+    time_limit: Optional[float]
+    max_playouts: Optional[int]
+    capacity: int
+    exploration: float
+    # ノードの配列...訪問回数、そのノードへの手を指したプレイヤーの勝ち数、最初の子、子の数、手、結果
+    visits: np.ndarray
+    wins: np.ndarray
+    first_child: np.ndarray
+    num_children: np.ndarray
+    move: np.ndarray
+    result: np.ndarray
+    num_nodes: int
+    # 根の局面（プレイヤーごとのビットボード）と手番
+    root_bits: List[int]
+    root_player: int
+    # 直前の探索の統計
+    stats: dict
+
+    def __init__(
+        self,
+        num_cells: int,
+        lines: List[Line],
+        time_limit: Optional[float] = 0.5,
+        max_playouts: Optional[int] = None,
+        capacity: int = 50_000,
+        exploration: float = 1.4,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            num_cells (int): セルの数
+            lines (List[Line]): 揃えると勝ちになる列
+            time_limit (Optional[float], optional): 1手あたりの探索時間（秒）
+            max_playouts (Optional[int], optional): 1手あたりのプレイアウト数の上限
+            capacity (int, optional): ノードの最大数。使い切った後は展開せずにプレイアウトのみ行う
+            exploration (float, optional): UCTの探索の重み
+            seed (Optional[int], optional): 乱数のシード
+        """
+        assert time_limit is not None or max_playouts is not None
+        self.num_cells = num_cells
+        masks: List[List[int]] = [[] for _ in range(num_cells)]
+        for line in lines:
+            mask = sum(1 << cell for cell in line)
+            for cell in line:
+                masks[cell].append(mask)
+        self.cell_masks = [tuple(m) for m in masks]
+        self.line_masks = [sum(1 << cell for cell in line) for line in lines]
+        self.line_length = len(lines[0])
+        self.time_limit = time_limit
+        self.max_playouts = max_playouts
+        self.capacity = capacity
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        self.wins = np.zeros(capacity, dtype=np.float32)
+        self.first_child = np.full(capacity, NO_CHILD, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int16)
+        self.move = np.zeros(capacity, dtype=np.int16)
+        self.result = np.zeros(capacity, dtype=np.int8)
+        self.reset()
+
+    @classmethod
+    def square(cls, size: int, **kwargs) -> "MCTSSelector":
+        return cls(size**2, make_lines((size, size), size), **kwargs)
+
+    @classmethod
+    def cube(cls, size: int, **kwargs) -> "MCTSSelector":
+        return cls(size**3, make_lines((size, size, size), size), **kwargs)
+
+    def reset(self):
+        """
+        木を捨てて、空の盤面から始める
+        """
+        self.root_bits = [0, 0]
+        self.root_player = 0
+        self._clear()
+        self.stats = {}
+
+    def _clear(self):
+        # 根のみを残す
+        self.visits[0] = 0
+        self.wins[0] = 0
+        self.first_child[0] = NO_CHILD
+        self.num_children[0] = 0
+        self.result[0] = NOT_TERMINAL
+        self.num_nodes = 1
+
+    # *** 局面に関する関数 ***
+    def is_win(self, bits: int, cell: int) -> bool:
+        return any(bits & mask == mask for mask in self.cell_masks[cell])
+
+    def empty_cells(self, bits: List[int]) -> List[int]:
+        occupied = bits[0] | bits[1]
+        return [cell for cell in range(self.num_cells) if not occupied >> cell & 1]
+
+    def threats(self, bits: List[int], player: int) -> int:
+        """
+        置くと列が揃うセルを求める
+
+        Args:
+            bits (List[int]): 局面
+            player (int): プレイヤー
+
+        Returns:
+            int: 該当するセルのビットマスク
+        """
+        own_bits, other_bits = bits[player], bits[player ^ 1]
+        threats = 0
+        for mask in self.line_masks:
+            own = own_bits & mask
+            if other_bits & mask == 0 and own.bit_count() == self.line_length - 1:
+                threats |= mask & ~own
+        return threats
+
+    def playout(self, bits: List[int], player: int) -> int:
+        """
+        勝てるときは勝ち、相手が勝てるときは塞ぎ、それ以外はランダムに交互に置いて、勝ったプレイヤーを求める
+
+        Args:
+            bits (List[int]): 局面（変更される）
+            player (int): 手番
+
+        Returns:
+            int: 勝ったプレイヤー（引き分けのときはEMPTY）
+        """
+        cells = self.empty_cells(bits)
+        self.rng.shuffle(cells)
+        occupied = bits[0] | bits[1]
+        threats = [self.threats(bits, 0), self.threats(bits, 1)]
+        i = 0
+        while True:
+            if threats[player] & ~occupied:
+                return player
+            block = threats[player ^ 1] & ~occupied
+            if block:
+                cell = (block & -block).bit_length() - 1
+            else:
+                while i < len(cells) and occupied >> cells[i] & 1:
+                    i += 1
+                if i == len(cells):
+                    return EMPTY
+                cell = cells[i]
+            own_bits = bits[player] = bits[player] | 1 << cell
+            occupied |= 1 << cell
+            # 置いたセルを通る列のみ調べ、新しくできた脅威を加える
+            other_bits = bits[player ^ 1]
+            for mask in self.cell_masks[cell]:
+                own = own_bits & mask
+                if other_bits & mask == 0 and own.bit_count() == self.line_length - 1:
+                    threats[player] |= mask & ~own
+            player ^= 1
+
+    # *** 木に関する関数 ***
+    def _expand(self, node: int, bits: List[int]) -> bool:
+        cells = self.empty_cells(bits)
+        if self.num_nodes + len(cells) > self.capacity:
+            return False
+        first, end = self.num_nodes, self.num_nodes + len(cells)
+        self.first_child[node] = first
+        self.num_children[node] = len(cells)
+        self.move[first:end] = cells
+        # 詰め直しの後は古いノードの値が残っているため、確保した範囲を初期化する
+        self.visits[first:end] = 0
+        self.wins[first:end] = 0
+        self.first_child[first:end] = NO_CHILD
+        self.num_children[first:end] = 0
+        self.result[first:end] = NOT_TERMINAL
+        self.num_nodes = end
+        return True
+
+    def _select_child(self, node: int) -> int:
+        first = self.first_child[node]
+        end = first + self.num_children[node]
+        visits = self.visits[first:end]
+        unvisited = np.flatnonzero(visits == 0)
+        if len(unvisited) > 0:
+            return first + int(unvisited[self.rng.randrange(len(unvisited))])
+        scores = self.wins[first:end] / visits + self.exploration * np.sqrt(math.log(self.visits[node]) / visits)
+        return first + int(np.argmax(scores))
+
+    def _iterate(self):
+        bits = self.root_bits.copy()
+        player = self.root_player
+        node = 0
+        path = [0]
+        while self.first_child[node] != NO_CHILD and self.result[node] == NOT_TERMINAL:
+            node = self._select_child(node)
+            path.append(node)
+            cell = int(self.move[node])
+            bits[player] |= 1 << cell
+            if self.result[node] == NOT_TERMINAL:
+                if self.is_win(bits[player], cell):
+                    self.result[node] = WIN
+                elif bits[0] | bits[1] == (1 << self.num_cells) - 1:
+                    self.result[node] = DRAW
+            player ^= 1
+
+        if self.result[node] == WIN:
+            winner = player ^ 1
+        elif self.result[node] == DRAW:
+            winner = EMPTY
+        else:
+            # 2回目に訪れたときに展開する
+            if self.visits[node] > 0 or node == 0:
+                self._expand(node, bits)
+            winner = self.playout(bits, player)
+
+        # そのノードへの手を指したプレイヤーから見た勝ち数を加える
+        mover = self.root_player ^ 1
+        for n in path:
+            self.visits[n] += 1
+            if winner == EMPTY:
+                self.wins[n] += 0.5
+            elif winner == mover:
+                self.wins[n] += 1
+            mover ^= 1
+
+    def _find_child(self, node: int, cell: int) -> int:
+        first = self.first_child[node]
+        if first == NO_CHILD:
+            return NO_CHILD
+        children = np.flatnonzero(self.move[first : first + self.num_children[node]] == cell)
+        return first + int(children[0]) if len(children) > 0 else NO_CHILD
+
+    def _reroot(self, node: int):
+        """
+        ノードを根とする部分木のみを残し、配列の先頭に詰め直す
+
+        Args:
+            node (int): 新しい根
+        """
+        old = [node]
+        new_first = [NO_CHILD]
+        num_nodes = 1
+        i = 0
+        # 幅優先で辿り、子ノードが連続した範囲に並ぶように詰める
+        while i < len(old):
+            first = self.first_child[old[i]]
+            if first != NO_CHILD:
+                n = int(self.num_children[old[i]])
+                new_first[i] = num_nodes
+                old.extend(range(first, first + n))
+                new_first.extend([NO_CHILD] * n)
+                num_nodes += n
+            i += 1
+        index = np.array(old)
+        for array in (self.visits, self.wins, self.num_children, self.move, self.result):
+            array[:num_nodes] = array[index]
+        self.first_child[:num_nodes] = new_first
+        self.num_nodes = num_nodes
+
+    def advance(self, cell: int):
+        """
+        根の局面で手を指し、その手の部分木を再利用する
+
+        Args:
+            cell (int): 指したセル
+        """
+        child = self._find_child(0, cell)
+        self.root_bits[self.root_player] |= 1 << cell
+        self.root_player ^= 1
+        if child == NO_CHILD:
+            self._clear()
+        else:
+            self._reroot(child)
+
+    def sync(self, board: Sequence[int], player: int):
+        """
+        エンジンの盤面に合わせて根を進める。根の局面から相手が1手指しただけのときは部分木を再利用する。
+
+        Args:
+            board (Sequence[int]): 盤面（EMPTYと各プレイヤーの番号）
+            player (int): 手番
+        """
+        bits = [0, 0]
+        for cell, state in enumerate(board):
+            if state != EMPTY:
+                bits[state] |= 1 << cell
+        if bits == self.root_bits and player == self.root_player:
+            return
+        added = [bits[p] & ~self.root_bits[p] for p in (0, 1)]
+        mover = self.root_player
+        is_subset = all(self.root_bits[p] & ~bits[p] == 0 for p in (0, 1))
+        if is_subset and added[1 - mover] == 0 and added[mover] & (added[mover] - 1) == 0 and mover != player:
+            self.advance(added[mover].bit_length() - 1)
+        else:
+            self.root_bits = bits
+            self.root_player = player
+            self._clear()
+
+    # *** 選択 ***
+    def _forced_move(self) -> Optional[int]:
+        # 勝てる手があれば指し、相手が勝てる手があれば塞ぐ
+        player = self.root_player
+        cells = self.empty_cells(self.root_bits)
+        for p in (player, player ^ 1):
+            for cell in cells:
+                if self.is_win(self.root_bits[p] | 1 << cell, cell):
+                    return cell
+        return None
+
+    def search(self) -> int:
+        """
+        予算の範囲で探索し、最も訪問回数の多い手を返す
+
+        Returns:
+            int: 選んだセル
+        """
+        reused = int(self.visits[0])
+        start = time.perf_counter()
+        deadline = start + self.time_limit if self.time_limit is not None else math.inf
+        num_playouts = 0
+        while time.perf_counter() < deadline and (self.max_playouts is None or num_playouts < self.max_playouts):
+            # 時間の確認を減らすため、数回ずつまとめて行う
+            for _ in range(16):
+                self._iterate()
+            num_playouts += 16
+        elapsed = time.perf_counter() - start
+        first = self.first_child[0]
+        children = self.visits[first : first + self.num_children[0]]
+        cell = int(self.move[first + int(np.argmax(children))])
+        self.stats = {
+            "playouts": num_playouts,
+            "elapsed": elapsed,
+            "playouts_per_sec": num_playouts / elapsed if elapsed > 0 else 0.0,
+            "reused_visits": reused,
+            "nodes": self.num_nodes,
+        }
+        if ENABLED:
+            observe("MCTSSelector", "playouts_per_sec", int(self.stats["playouts_per_sec"]), PLAYOUT_BUCKETS)
+        return cell
+
+    def select(self, board: Sequence[int], player: int) -> int:
+        """
+        手を選ぶ
+
+        Args:
+            board (Sequence[int]): 盤面（EMPTYと各プレイヤーの番号）
+            player (int): 手番のプレイヤー
+
+        Returns:
+            int: 選んだセル
+        """
+        self.sync(board, player)
+        self.stats = {}
+        cell = self._forced_move()
+        if cell is None:
+            cell = self.search()
+        self.advance(cell)
+        return cell
+
+
+if __name__ == "__main__":
+    for size in (4, 5):
+        selector = MCTSSelector.cube(size, time_limit=1.0, seed=0)
+        board = [EMPTY] * size**3
+        opponent = random.Random(1)
+        for turn in range(6):
+            player = turn % 2
+            if player == 0:
+                cell = selector.select(board, player)
+                stats = selector.stats
+                print(
+                    f"{size}x{size}x{size} turn {turn}: cell={cell}, {stats.get('playouts', 0)} playouts, "
+                    f"{stats.get('playouts_per_sec', 0):,.0f} playouts/s, "
+                    f"reused {stats.get('reused_visits', 0)} visits, "
+                    f"{stats.get('nodes', 0)} nodes"
+                )
+            else:
+                cell = opponent.choice([c for c, state in enumerate(board) if state == EMPTY])
+            board[cell] = player
@@ -1,9 +1,14 @@
 from .cube_tictactoe import cube_t3_page
+from .gomoku import gomoku_page
 from .index import t3_index
+from .rooms import rooms_page, serve_rooms
 from .square_tictactoe import square_t3_page
 
 __all__ = [
     "t3_index",
     "square_t3_page",
     "cube_t3_page",
+    "gomoku_page",
+    "rooms_page",
+    "serve_rooms",
 ]
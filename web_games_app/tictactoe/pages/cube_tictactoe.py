@@ -1,19 +1,37 @@
 import asyncio
-from typing import Dict, List
+from typing import Dict, List, Union
 
 import reflex as rx
 
+from ...metrics import idle, instrument, measure
+from ...sessions import EvictableMixin
 from ...style import RESULT_TOAST, THEME_BORDER
 from ...templates.tictactoe import t3_pages
-from ..style import CHANGE_TURN_TOAST, STATE_COLOR
+from ..lines import get_lines, winning_cells
+from ..mcts import MCTSSelector
+from ..style import CHANGE_TURN_TOAST, CODE_COLOR, STATE_CODE, STATE_COLOR, WIN_STATE_OFFSET
 from ..tictactoe import BitStrategicSelector, CubeTicTacToe, RandomSelector, Selector
 from .config import BOX_SIZE, DEFAULT_SIZE, SCALE, SIZES
 
 
-class CubeTicTacToeState(rx.State):
+class CubeT3LayerMixin(rx.State, mixin=True):
+    # STATE_CODEで表した層
+    cells: str = ""
+
+
+# 層ごとに状態を分けることで、選択したセルを含む層のみが送信・再描画される
+LAYER_STATES = [
+    type(f"CubeT3Layer{i}State", (CubeT3LayerMixin, rx.State), {"__module__": __name__})
+    for i in range(int(SIZES[-1]))
+]
+# 状態の永続化（pickle）でクラスを名前から参照できるように、モジュールに登録する
+globals().update((layer.__name__, layer) for layer in LAYER_STATES)
+
+
+class CubeTicTacToeState(EvictableMixin, rx.State):
+    ENGINE_VARS = ("_game", "_computer_selector")
     _game: CubeTicTacToe
-    _computer_selector: Selector
-    colored_board: List[List[str]]
+    _computer_selector: Union[Selector, MCTSSelector]
     HEIGHT: Dict[str, str]
     OFFSET: Dict[str, str]
     TRANS_Y: Dict[str, str]
@@ -23,9 +41,10 @@ class CubeTicTacToeState(rx.State):
     difficulty: int = 0
     _is_game_end: bool = False
     STATE_COLOR: Dict[int, str] = STATE_COLOR
+    CODE_COLOR: Dict[str, str] = CODE_COLOR
 
     # *** 初期化やリセットに関する関数 ***
-    def initialize(self):
+    async def initialize(self):
         margin = 5
         for key in SIZES:
             size = int(key)
@@ -34,16 +53,16 @@ class CubeTicTacToeState(rx.State):
             self.TRANS_Y[key] = str(-BOX_SIZE * size * (1 - SCALE) + margin) + "px"
         self.make_tictactoe()
         self.reset_selector()
-        self.coloring()
+        await self.coloring()
 
     def make_tictactoe(self):
         self._game = CubeTicTacToe(self.size)
 
-    def reset_board(self, sleep_time: float):
+    async def reset_board(self, sleep_time: float):
         self.turn = 0
         self._is_game_end = False
         self._game.reset()
-        self.coloring()
+        await self.coloring()
         if self.player_turn == 1:
             return CubeTicTacToeState.computer_select(sleep_time)
 
@@ -54,28 +73,41 @@ class CubeTicTacToeState(rx.State):
             self._computer_selector = BitStrategicSelector(
                 self.size, self._game.num_cells, self._game.get_candidates()
             )
+        elif self.difficulty == 2:
+            self._computer_selector = MCTSSelector.cube(self.size)
 
     # *** 便利関数 ***
-    def coloring(self):
+    @instrument
+    async def coloring(self):
         sq = self.size**2
-        colored_board = [[] for _ in range(self.size)]
-        for i in range(len(self._game.board)):
-            colored_board[i // sq].append(self.STATE_COLOR[self._game.board[i]])
-        self.colored_board = colored_board
+        board = self._game.board
+        for i, state in enumerate(LAYER_STATES):
+            layer = await self.get_state(state)
+            layer.cells = "".join(STATE_CODE[cell] for cell in board[i * sq : (i + 1) * sq])
 
-    def change_cell_color(self, index: int, color: str):
-        sq = self.size**2
-        div, mod = divmod(index, sq)
-        self.colored_board[div][mod] = color
+    async def change_cell_state(self, index: int, state: int):
+        div, mod = divmod(index, self.size**2)
+        layer = await self.get_state(LAYER_STATES[div])
+        layer.cells = layer.cells[:mod] + STATE_CODE[state] + layer.cells[mod + 1 :]
+
+    async def highlight_line(self, num: int):
+        # 最後に選択したセルを通る、揃った列を強調する
+        lines = get_lines((self.size,) * 3, self.size)
+        for cell in winning_cells(self._game.board, lines, num):
+            await self.change_cell_state(cell, self._game.board[cell] + WIN_STATE_OFFSET)
 
     # *** 選択に関する関数 ***
-    def apply_select(self, num: int):
-        self._is_game_end = self._game.apply_select(self.turn, num)
-        self.coloring()
+    @instrument
+    async def apply_select(self, num: int):
+        with measure("engine"):
+            self._is_game_end = self._game.apply_select(self.turn, num)
+        # 盤面全体を塗り直さず、選択したセルのみ更新する
+        await self.change_cell_state(num, self._game.board[num])
         if not self._is_game_end and len(self._game.rest) == 0:
             self._is_game_end = True
             return rx.toast.info("Draw", **RESULT_TOAST)
         elif self._is_game_end:
+            await self.highlight_line(num)
             if self.turn % 2 == self.player_turn:
                 return rx.toast.success("You win!!", **RESULT_TOAST)
             else:
@@ -83,43 +115,53 @@ class CubeTicTacToeState(rx.State):
         else:
             self.turn += 1
 
-    def select_cell(self, index: int):
+    async def select_cell(self, index: int):
         if not self._is_game_end and self.turn % 2 == self.player_turn:
             if index not in self._game.rest:
                 return rx.toast.warning("This cell is already selected", position="top-center", duration=1500)
-            component = self.apply_select(index)
+            component = await self.apply_select(index)
             if self._is_game_end:
                 return component
             else:
                 return CubeTicTacToeState.computer_select(1.0)
 
+    @instrument
     async def computer_select(self, sleep_time: float):
-        await asyncio.sleep(sleep_time)
-        if isinstance(self._computer_selector, BitStrategicSelector):
+        # 演出のための待ち時間は所要時間に含めない
+        with idle():
+            await asyncio.sleep(sleep_time)
+        with measure("engine"):
+            # 探索に時間がかかる場合も、他のクライアントのイベントを止めないようにする
+            num = await asyncio.to_thread(self._select_by_computer)
+        return await self.apply_select(num)
+
+    def _select_by_computer(self) -> int:
+        if isinstance(self._computer_selector, MCTSSelector):
+            return self._computer_selector.select(self._game.board, (self.player_turn + 1) % 2)
+        elif isinstance(self._computer_selector, BitStrategicSelector):
             computer_turn = (self.player_turn + 1) % 2
-            num = self._computer_selector.select(
+            return self._computer_selector.select(
                 self._game.rest,
                 self._game.players[computer_turn].candidates,
                 self._game.players[self.player_turn].candidates,
             )
         else:
-            num = self._computer_selector.select(self._game.rest)
-        return self.apply_select(num)
+            return self._computer_selector.select(self._game.rest)
 
     # *** インタラクションの関数 ***
-    def change_size(self, size: str):
+    async def change_size(self, size: str):
         self.size = int(size)
         self.make_tictactoe()
         self.reset_selector()
-        return self.reset_board(0.5)
+        return await self.reset_board(0.5)
 
-    def focus_cell(self, index: int):
+    async def focus_cell(self, index: int):
         if self._game.board[index] == -1:
-            self.change_cell_color(index, self.STATE_COLOR[self.turn % 2 + 2])
+            await self.change_cell_state(index, self.turn % 2 + 2)
 
-    def unfocus_cell(self, index: int):
+    async def unfocus_cell(self, index: int):
         if self._game.board[index] == -1:
-            self.change_cell_color(index, self.STATE_COLOR[-1])
+            await self.change_cell_state(index, -1)
 
     def change_turn(self):
         self.player_turn = (self.player_turn + 1) % 2
@@ -128,16 +170,16 @@ class CubeTicTacToeState(rx.State):
         components.append(CubeTicTacToeState.reset_board(1.7))
         return components
 
-    def change_difficulty(self):
-        self.difficulty = (self.difficulty + 1) % 2
+    async def change_difficulty(self):
+        self.difficulty = (self.difficulty + 1) % 3
         self.reset_selector()
-        return self.reset_board(0.5)
+        return await self.reset_board(0.5)
 
 
-def render_box(color: str, layer: int, index: int):
+def render_box(code: str, layer: int, index: int):
     num = CubeTicTacToeState.size**2 * layer + index
     return rx.box(
-        bg=color,
+        bg=CubeTicTacToeState.CODE_COLOR[code],
         width=f"{BOX_SIZE}px",
         height=f"{BOX_SIZE}px",
         border=THEME_BORDER,
@@ -190,9 +232,9 @@ def turn_text():
     )
 
 
-def display_square(square: List[str], layer: int):
+def display_square(layer: int):
     return rx.grid(
-        rx.foreach(square, lambda color, index: render_box(color, layer, index)),
+        rx.foreach(LAYER_STATES[layer].cells.split(""), lambda code, index: render_box(code, layer, index)),
         columns=CubeTicTacToeState.size.to_string(),
         border=THEME_BORDER,
         justify="center",
@@ -208,10 +250,7 @@ def display_square(square: List[str], layer: int):
 
 def display_board():
     return rx.vstack(
-        rx.foreach(
-            CubeTicTacToeState.colored_board,
-            lambda square, layer: display_square(square, layer),
-        ),
+        *[rx.cond(layer < CubeTicTacToeState.size, display_square(layer)) for layer in range(len(LAYER_STATES))],
         spacing="0",
         class_name="cube",
         style={"--height": CubeTicTacToeState.HEIGHT[CubeTicTacToeState.size.to_string()]},
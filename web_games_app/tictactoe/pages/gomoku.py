@@ -0,0 +1,207 @@
+import asyncio
+from typing import Dict, List, Union
+
+import reflex as rx
+
+from ...metrics import idle, instrument, measure
+from ...sessions import EvictableMixin
+from ...style import RESULT_TOAST, THEME_BORDER
+from ...templates.tictactoe import t3_pages
+from ..gomoku import Gomoku, GomokuSelector
+from ..lines import get_lines, winning_cells
+from ..style import CHANGE_TURN_TOAST, CODE_COLOR, STATE_CODE, STATE_COLOR, WIN_STATE_OFFSET
+from ..tictactoe import RandomSelector
+
+GOMOKU_SIZES = ["9", "13", "15", "19"]
+GOMOKU_DEFAULT_SIZE = "15"
+# 並べると勝ちになる石の数
+GOMOKU_LENGTH = 5
+GOMOKU_BOX_SIZE = 28
+
+
+class GomokuState(EvictableMixin, rx.State):
+    ENGINE_VARS = ("_game", "_computer_selector")
+    _game: Gomoku
+    _computer_selector: Union[RandomSelector, GomokuSelector]
+    # STATE_CODEで表した盤面
+    coded_board: str
+    size: int = int(GOMOKU_DEFAULT_SIZE)
+    turn: int = 0
+    player_turn: int = 0
+    difficulty: int = 1
+    _is_game_end: bool = False
+    STATE_COLOR: Dict[int, str] = STATE_COLOR
+    CODE_COLOR: Dict[str, str] = CODE_COLOR
+
+    # *** 初期化やリセットに関する関数 ***
+    def initialize(self):
+        self.make_gomoku()
+        self.reset_selector()
+        self.coloring()
+
+    def make_gomoku(self):
+        self._game = Gomoku(self.size, GOMOKU_LENGTH)
+
+    def reset_board(self, sleep_time: float):
+        self.turn = 0
+        self._is_game_end = False
+        self._game.reset()
+        self.coloring()
+        if self.player_turn == 1:
+            return GomokuState.computer_select(sleep_time)
+
+    def reset_selector(self):
+        if self.difficulty == 0:
+            self._computer_selector = RandomSelector()
+        elif self.difficulty == 1:
+            self._computer_selector = GomokuSelector(self.size, GOMOKU_LENGTH)
+
+    # *** 便利関数 ***
+    @instrument
+    def coloring(self):
+        self.coded_board = "".join(STATE_CODE[state] for state in self._game.board)
+
+    def change_cell_state(self, index: int, state: int):
+        self.coded_board = self.coded_board[:index] + STATE_CODE[state] + self.coded_board[index + 1 :]
+
+    def highlight_line(self, num: int):
+        # 最後に置いた石を通る、並んだ列を強調する
+        lines = get_lines((self.size, self.size), GOMOKU_LENGTH)
+        for cell in winning_cells(self._game.board, lines, num):
+            self.change_cell_state(cell, self._game.board[cell] + WIN_STATE_OFFSET)
+
+    # *** 選択に関する関数 ***
+    @instrument
+    def apply_select(self, num: int):
+        with measure("engine"):
+            self._is_game_end = self._game.apply_select(self.turn, num)
+        self.change_cell_state(num, self._game.board[num])
+        if not self._is_game_end and len(self._game.rest) == 0:
+            self._is_game_end = True
+            return rx.toast.info("Draw", **RESULT_TOAST)
+        elif self._is_game_end:
+            self.highlight_line(num)
+            if self.turn % 2 == self.player_turn:
+                return rx.toast.success("You win!!", **RESULT_TOAST)
+            else:
+                return rx.toast.error("You lose...", **RESULT_TOAST)
+        else:
+            self.turn += 1
+
+    def select_cell(self, index: int):
+        if not self._is_game_end and self.turn % 2 == self.player_turn:
+            if index not in self._game.rest:
+                return rx.toast.warning("This cell is already selected", position="top-center", duration=1500)
+            component = self.apply_select(index)
+            if self._is_game_end:
+                return component
+            else:
+                return GomokuState.computer_select(0.5)
+
+    @instrument
+    async def computer_select(self, sleep_time: float):
+        # 演出のための待ち時間は所要時間に含めない
+        with idle():
+            await asyncio.sleep(sleep_time)
+        with measure("engine"):
+            num = self._select_by_computer()
+        return self.apply_select(num)
+
+    def _select_by_computer(self) -> int:
+        if isinstance(self._computer_selector, GomokuSelector):
+            return self._computer_selector.select(self._game.board, (self.player_turn + 1) % 2)
+        else:
+            return self._computer_selector.select(self._game.rest)
+
+    # *** インタラクションの関数 ***
+    def change_size(self, size: str):
+        self.size = int(size)
+        self.make_gomoku()
+        self.reset_selector()
+        return self.reset_board(0.5)
+
+    def change_turn(self):
+        self.player_turn = (self.player_turn + 1) % 2
+        turn = "first" if self.player_turn == 0 else "second"
+        components = [rx.toast(f"Your turn is {turn}", **CHANGE_TURN_TOAST)]
+        components.append(GomokuState.reset_board(1.7))
+        return components
+
+    def change_difficulty(self):
+        self.difficulty = (self.difficulty + 1) % 2
+        self.reset_selector()
+        return self.reset_board(0.5)
+
+
+def setting():
+    return rx.vstack(
+        rx.hstack(
+            rx.vstack(
+                rx.text("Board Size"),
+                rx.select(
+                    GOMOKU_SIZES,
+                    default_value=GOMOKU_DEFAULT_SIZE,
+                    on_change=lambda value: GomokuState.change_size(value),
+                    width="100%",
+                    position="popper",
+                ),
+                align="center",
+                spacing="0",
+            ),
+            rx.vstack(
+                rx.text(f"Difficulty: Level {GomokuState.difficulty.to_string()}"),
+                rx.button("Change Difficulty", on_click=GomokuState.change_difficulty()),
+                align="center",
+                spacing="0",
+            ),
+            align="end",
+        ),
+        rx.hstack(
+            rx.button("Change Turn", on_click=GomokuState.change_turn()),
+            rx.button("Reset", on_click=GomokuState.reset_board(0.5)),
+        ),
+        align="center",
+    )
+
+
+def turn_text():
+    return rx.cond(
+        GomokuState.turn % 2 == GomokuState.player_turn,
+        rx.text("Your Turn", color=GomokuState.STATE_COLOR[GomokuState.player_turn], size="6"),
+        rx.text(
+            "Computer's Turn",
+            color=GomokuState.STATE_COLOR[(GomokuState.player_turn + 1) % 2],
+            size="6",
+        ),
+    )
+
+
+def get_hover_color(code: str):
+    # フォーカスはサーバーを介さずCSSで、手番のプレイヤーの色で表示する
+    return rx.cond(code == STATE_CODE[-1], GomokuState.STATE_COLOR[GomokuState.turn % 2 + 2], "")
+
+
+def render_box(code: str, index: int):
+    return rx.box(
+        bg=GomokuState.CODE_COLOR[code],
+        width=f"{GOMOKU_BOX_SIZE}px",
+        height=f"{GOMOKU_BOX_SIZE}px",
+        border=THEME_BORDER,
+        on_click=GomokuState.select_cell(index),
+        _hover={"bg": get_hover_color(code)},
+    )
+
+
+def display_board():
+    return rx.grid(
+        rx.foreach(GomokuState.coded_board.split(""), lambda code, index: render_box(code, index)),
+        columns=GomokuState.size.to_string(),
+        border=THEME_BORDER,
+        justify="center",
+    )
+
+
+@rx.page(route="/tictactoe/gomoku", title="Play Gomoku", on_load=[GomokuState.initialize()])
+@t3_pages(head_text=f"Gomoku ({GOMOKU_LENGTH} in a Row)")
+def gomoku_page() -> List[rx.Component]:
+    return [setting(), turn_text(), display_board()]
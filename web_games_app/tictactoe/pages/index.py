@@ -3,6 +3,7 @@ from typing import List
 import reflex as rx
 
 from ...templates.tictactoe import t3_pages
+from .gomoku import GOMOKU_LENGTH
 
 
 @rx.page(route="/tictactoe", title="Tic Tac Toe")
@@ -22,5 +23,17 @@ def t3_index() -> List[rx.Component]:
                 on_click=rx.redirect("/tictactoe/3d"),
                 align="center",
             ),
+            rx.vstack(
+                rx.button("Gomoku"),
+                rx.text(f"{GOMOKU_LENGTH} in a row on up to 19 x 19", height="200px"),
+                on_click=rx.redirect("/tictactoe/gomoku"),
+                align="center",
+            ),
+            rx.vstack(
+                rx.button("Online"),
+                rx.text("Play with a friend or watch a game", height="200px"),
+                on_click=rx.redirect("/tictactoe/rooms"),
+                align="center",
+            ),
         )
     ]
@@ -0,0 +1,201 @@
+from typing import Dict, List
+
+import reflex as rx
+from reflex.state import StateManagerRedis
+
+from ...metrics import instrument
+from ...style import RESULT_TOAST, THEME_BORDER
+from ...templates.tictactoe import t3_pages
+from ..rooms import DRAW, PLAYING, ROOM_SIZES, SPECTATOR, WAITING, RedisRoomStore, Room, get_store, use_store
+from ..style import CODE_COLOR, STATE_COLOR
+from .config import BOX_SIZE
+
+# 観戦者も含めた全員に送る変数。他の参加者の手はサーバーの状態を経由せずに直接届く
+ROOM_VARS = ("coded_board", "turn", "last_move", "status", "num_players")
+
+
+class RoomState(rx.State):
+    room_id: str = ""
+    room_input: str = ""
+    # 0：先攻、1：後攻、SPECTATOR：観戦
+    seat: int = SPECTATOR
+    size: int = ROOM_SIZES[0]
+    # STATE_CODEで表した盤面
+    coded_board: str = ""
+    turn: int = 0
+    last_move: int = -1
+    status: str = WAITING
+    num_players: int = 0
+    STATE_COLOR: Dict[int, str] = STATE_COLOR
+    CODE_COLOR: Dict[str, str] = CODE_COLOR
+
+    # *** 部屋への参加に関する関数 ***
+    def apply_room(self, room: Room):
+        # 送信を受け取っていない間にサーバー側の値が古くなっているため、全ての変数を部屋に合わせる
+        for name, value in room.to_delta().items():
+            setattr(self, name, value)
+        self.room_id = room.room_id
+        self.size = room.size
+        self.seat = room.seat_of(self.router.session.client_token)
+
+    async def enter(self, room: Room):
+        await get_store().subscribe(self.router.session.session_id, room.room_id)
+        self.apply_room(room)
+
+    async def leave(self):
+        if self.room_id:
+            await get_store().unsubscribe(self.router.session.session_id, self.room_id)
+
+    @instrument
+    async def create_room(self, size: str):
+        await self.leave()
+        store = get_store()
+        room = await store.create(int(size))
+        room = await store.sit(room.room_id, self.router.session.client_token)
+        await self.enter(room)
+
+    @instrument
+    async def join_room(self):
+        room_id = self.room_input.strip().lower()
+        store = get_store()
+        room = await store.sit(room_id, self.router.session.client_token)
+        if room is None:
+            return rx.toast.warning(f"Room {room_id} does not exist", position="top-center", duration=1500)
+        await self.leave()
+        await self.enter(room)
+        if self.seat != SPECTATOR:
+            # 二人目が座ったときは、待っている相手にも対局の開始を知らせる
+            await store.publish(room.room_id, room.to_delta())
+
+    async def on_load(self):
+        # 再接続するとセッションIDが変わるため、参加中の部屋に入り直す
+        if self.room_id:
+            room = await get_store().get(self.room_id)
+            if room is None:
+                self.room_id = ""
+            else:
+                await self.enter(room)
+
+    def set_room_input(self, room_input: str):
+        self.room_input = room_input
+
+    # *** 選択に関する関数 ***
+    @instrument
+    async def select_cell(self, index: int):
+        if not self.room_id:
+            return
+        store = get_store()
+        # 相手の手はサーバー側の変数を経由しないため、手番の判定は部屋に任せる
+        room = await store.play(self.room_id, self.router.session.client_token, index)
+        if room is None:
+            room = await store.get(self.room_id)
+            if room is None:
+                return
+            self.apply_room(room)
+            if room.status == PLAYING and self.seat == self.turn % 2:
+                return rx.toast.warning("This cell is already selected", position="top-center", duration=1500)
+            return
+        delta = room.to_delta()
+        # 自身の変数は通常の応答で、他の参加者には一度の送信でまとめて届ける
+        for name in ROOM_VARS:
+            setattr(self, name, delta[name])
+        await store.publish(room.room_id, delta)
+        if room.status not in (PLAYING, WAITING):
+            return self.result_toast()
+
+    def result_toast(self):
+        if self.status == DRAW:
+            return rx.toast.info("Draw", **RESULT_TOAST)
+        elif self.status == f"win{self.seat}":
+            return rx.toast.success("You win!!", **RESULT_TOAST)
+        elif self.seat == SPECTATOR:
+            return rx.toast.info(f"Player {self.status[-1]} wins", **RESULT_TOAST)
+        else:
+            return rx.toast.error("You lose...", **RESULT_TOAST)
+
+
+async def serve_rooms(reflex_app: rx.App):
+    """
+    部屋の送信先を設定し、他のワーカーからの送信を待ち受けるライフスパンタスク
+    """
+    if isinstance(reflex_app.state_manager, StateManagerRedis):
+        use_store(RedisRoomStore(reflex_app.state_manager.redis))
+    store = get_store()
+    store.attach(reflex_app.event_namespace, RoomState.get_full_name())
+    await store.serve()
+
+
+def setting():
+    return rx.vstack(
+        rx.hstack(
+            rx.select(
+                [str(size) for size in ROOM_SIZES],
+                placeholder="Board Size",
+                on_change=lambda value: RoomState.create_room(value),
+                position="popper",
+            ),
+            rx.text("Create Room"),
+            align="center",
+        ),
+        rx.hstack(
+            rx.input(placeholder="Room ID", value=RoomState.room_input, on_change=RoomState.set_room_input),
+            rx.button("Join", on_click=RoomState.join_room()),
+            align="center",
+        ),
+        align="center",
+    )
+
+
+def room_info():
+    return rx.cond(
+        RoomState.room_id != "",
+        rx.vstack(
+            rx.text(f"Room {RoomState.room_id} ({RoomState.num_players} / 2 players)"),
+            rx.match(
+                RoomState.seat,
+                (0, rx.text("You play first", color=RoomState.STATE_COLOR[0])),
+                (1, rx.text("You play second", color=RoomState.STATE_COLOR[1])),
+                rx.text("Spectating"),
+            ),
+            rx.match(
+                RoomState.status,
+                (WAITING, rx.text("Waiting for an opponent...", size="6")),
+                (DRAW, rx.text("Draw", size="6")),
+                (
+                    PLAYING,
+                    rx.text(
+                        rx.cond(RoomState.turn % 2 == RoomState.seat, "Your Turn", "Opponent's Turn"),
+                        color=RoomState.STATE_COLOR[RoomState.turn % 2],
+                        size="6",
+                    ),
+                ),
+                rx.text("Game Over", size="6"),
+            ),
+            align="center",
+        ),
+    )
+
+
+def render_box(code: str, index: int):
+    return rx.box(
+        bg=RoomState.CODE_COLOR[code],
+        width=f"{BOX_SIZE}px",
+        height=f"{BOX_SIZE}px",
+        border=rx.cond(index == RoomState.last_move, "3px solid black", THEME_BORDER),
+        on_click=RoomState.select_cell(index),
+    )
+
+
+def display_board():
+    return rx.grid(
+        rx.foreach(RoomState.coded_board.split(""), lambda code, index: render_box(code, index)),
+        columns=RoomState.size.to_string(),
+        border=THEME_BORDER,
+        justify="center",
+    )
+
+
+@rx.page(route="/tictactoe/rooms", title="Play Tic Tac Toe Online", on_load=RoomState.on_load())
+@t3_pages(head_text="Tic Tac Toe Rooms")
+def rooms_page() -> List[rx.Component]:
+    return [setting(), room_info(), display_board()]
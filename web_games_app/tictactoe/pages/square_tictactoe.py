@@ -3,23 +3,29 @@ from typing import Dict, List
 
 import reflex as rx
 
+from ...metrics import idle, instrument, measure
+from ...sessions import EvictableMixin
 from ...style import RESULT_TOAST, THEME_BORDER
 from ...templates.tictactoe import t3_pages
-from ..style import CHANGE_TURN_TOAST, STATE_COLOR
+from ..lines import get_lines, winning_cells
+from ..style import CHANGE_TURN_TOAST, CODE_COLOR, STATE_CODE, STATE_COLOR, WIN_STATE_OFFSET
 from ..tictactoe import BitStrategicSelector, RandomSelector, Selector, SquareTicTacToe
 from .config import BOX_SIZE, DEFAULT_SIZE, SIZES
 
 
-class SquareTicTacToeState(rx.State):
+class SquareTicTacToeState(EvictableMixin, rx.State):
+    ENGINE_VARS = ("_game", "_computer_selector")
     _game: SquareTicTacToe
     _computer_selector: Selector
-    colored_board: List[str]
+    # STATE_CODEで表した盤面
+    coded_board: str
     size: int = int(DEFAULT_SIZE)
     turn: int = 0
     player_turn: int = 0
     difficulty: int = 0
     _is_game_end: bool = False
     STATE_COLOR: Dict[int, str] = STATE_COLOR
+    CODE_COLOR: Dict[str, str] = CODE_COLOR
 
     # *** 初期化やリセットに関する関数 ***
     def initialize(self):
@@ -47,23 +53,31 @@ class SquareTicTacToeState(rx.State):
             )
 
     # *** 便利関数 ***
+    @instrument
     def coloring(self):
-        colored_board = []
-        for state in self._game.board:
-            colored_board.append(self.STATE_COLOR[state])
-        self.colored_board = colored_board
+        self.coded_board = "".join(STATE_CODE[state] for state in self._game.board)
 
-    def change_cell_color(self, index: int, color: str):
-        self.colored_board[index] = color
+    def change_cell_state(self, index: int, state: int):
+        self.coded_board = self.coded_board[:index] + STATE_CODE[state] + self.coded_board[index + 1 :]
+
+    def highlight_line(self, num: int):
+        # 最後に選択したセルを通る、揃った列を強調する
+        lines = get_lines((self.size, self.size), self.size)
+        for cell in winning_cells(self._game.board, lines, num):
+            self.change_cell_state(cell, self._game.board[cell] + WIN_STATE_OFFSET)
 
     # *** 選択に関する関数 ***
+    @instrument
     def apply_select(self, num: int):
-        self._is_game_end = self._game.apply_select(self.turn, num)
-        self.coloring()
+        with measure("engine"):
+            self._is_game_end = self._game.apply_select(self.turn, num)
+        # 盤面全体を塗り直さず、選択したセルのみ更新する
+        self.change_cell_state(num, self._game.board[num])
         if not self._is_game_end and len(self._game.rest) == 0:
             self._is_game_end = True
             return rx.toast.info("Draw", **RESULT_TOAST)
         elif self._is_game_end:
+            self.highlight_line(num)
             if self.turn % 2 == self.player_turn:
                 return rx.toast.success("You win!!", **RESULT_TOAST)
             else:
@@ -81,18 +95,25 @@ class SquareTicTacToeState(rx.State):
             else:
                 return SquareTicTacToeState.computer_select(1.0)
 
+    @instrument
     async def computer_select(self, sleep_time: float):
-        await asyncio.sleep(sleep_time)
+        # 演出のための待ち時間は所要時間に含めない
+        with idle():
+            await asyncio.sleep(sleep_time)
+        with measure("engine"):
+            num = self._select_by_computer()
+        return self.apply_select(num)
+
+    def _select_by_computer(self) -> int:
         if isinstance(self._computer_selector, BitStrategicSelector):
             computer_turn = (self.player_turn + 1) % 2
-            num = self._computer_selector.select(
+            return self._computer_selector.select(
                 self._game.rest,
                 self._game.players[computer_turn].candidates,
                 self._game.players[self.player_turn].candidates,
             )
         else:
-            num = self._computer_selector.select(self._game.rest)
-        return self.apply_select(num)
+            return self._computer_selector.select(self._game.rest)
 
     # *** インタラクションの関数 ***
     def change_size(self, size: str):
@@ -103,11 +124,11 @@ class SquareTicTacToeState(rx.State):
 
     def focus_cell(self, index: int):
         if self._game.board[index] == -1:
-            self.change_cell_color(index, self.STATE_COLOR[self.turn % 2 + 2])
+            self.change_cell_state(index, self.turn % 2 + 2)
 
     def unfocus_cell(self, index: int):
         if self._game.board[index] == -1:
-            self.change_cell_color(index, self.STATE_COLOR[-1])
+            self.change_cell_state(index, -1)
 
     def change_turn(self):
         self.player_turn = (self.player_turn + 1) % 2
@@ -165,9 +186,9 @@ def turn_text():
     )
 
 
-def render_box(color: str, index: int):
+def render_box(code: str, index: int):
     return rx.box(
-        bg=color,
+        bg=SquareTicTacToeState.CODE_COLOR[code],
         width=f"{BOX_SIZE}px",
         height=f"{BOX_SIZE}px",
         border=THEME_BORDER,
@@ -179,7 +200,7 @@ def render_box(color: str, index: int):
 
 def display_board():
     return rx.grid(
-        rx.foreach(SquareTicTacToeState.colored_board, lambda color, index: render_box(color, index)),
+        rx.foreach(SquareTicTacToeState.coded_board.split(""), lambda code, index: render_box(code, index)),
         columns=SquareTicTacToeState.size.to_string(),
         border=THEME_BORDER,
         justify="center",
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import secrets
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from ..broadcast import Broadcaster
+from .lines import EMPTY, LineBoard
+from .style import STATE_CODE
+
+# 席...0：先攻、1：後攻、SPECTATOR：観戦
+SPECTATOR = 2
+# 部屋の状態
+WAITING = "waiting"
+PLAYING = "playing"
+DRAW = "draw"
+ROOM_SIZES = [3, 4, 5]
+REDIS_PREFIX = "web_games:t3room"
+# 最後に席に着くか手を指してから部屋を削除するまでの時間（秒）
+ROOM_TTL = 3600
+# 古い部屋を削除する間隔（秒）
+EXPIRE_INTERVAL = 60
+
+
+def win_status(player: int) -> str:
+    return f"win{player}"
+
+
+class Room:
+    """
+    二人対戦の部屋。盤面は全ての参加者で共有する。
+    """
+
+    room_id: str
+    size: int
+    board: LineBoard
+    # 席ごとのクライアントのトークン
+    seats: List[Optional[str]]
+    # STATE_CODEで表した盤面。手が指されるたびに1文字だけ更新する
+    coded_board: str
+    last_move: int
+    status: str
+    # 最後に席に着くか手を指した時刻（time.monotonic）
+    active_at: float
+
+    def __init__(self, room_id: str, size: int) -> None:
+        self.room_id = room_id
+        self.size = size
+        self.board = LineBoard.square(size)
+        self.seats = [None, None]
+        self.coded_board = STATE_CODE[EMPTY] * size**2
+        self.last_move = -1
+        self.status = WAITING
+        self.active_at = time.monotonic()
+
+    @property
+    def turn(self) -> int:
+        return len(self.board.history)
+
+    @property
+    def num_players(self) -> int:
+        return sum(seat is not None for seat in self.seats)
+
+    def seat_of(self, token: str) -> int:
+        return self.seats.index(token) if token in self.seats else SPECTATOR
+
+    def sit(self, token: str) -> int:
+        """
+        空いている席に座る。既に座っているときはその席、満席のときは観戦となる。
+
+        Args:
+            token (str): クライアントのトークン
+
+        Returns:
+            int: 席
+        """
+        seat = self.seat_of(token)
+        if seat == SPECTATOR and None in self.seats:
+            seat = self.seats.index(None)
+            self.seats[seat] = token
+            self.active_at = time.monotonic()
+            if self.num_players == 2 and self.status == WAITING:
+                self.status = PLAYING
+        return seat
+
+    def can_play(self, seat: int, cell: int) -> bool:
+        return self.status == PLAYING and seat == self.turn % 2 and cell in self.board.rest
+
+    def play(self, cell: int):
+        """
+        手番のプレイヤーとして手を指す。盤面の文字列は指したセルのみ更新する。
+
+        Args:
+            cell (int): 指すセル
+        """
+        player = self.turn % 2
+        is_win = self.board.make(cell, player)
+        self.coded_board = self.coded_board[:cell] + STATE_CODE[player] + self.coded_board[cell + 1 :]
+        self.last_move = cell
+        self.active_at = time.monotonic()
+        if is_win:
+            self.status = win_status(player)
+        elif len(self.board.rest) == 0:
+            self.status = DRAW
+
+    def to_delta(self) -> dict:
+        """
+        参加者に送る変数（部屋の状態の変数名と同じ）
+
+        Returns:
+            dict: 変数名 -> 値
+        """
+        return {
+            "coded_board": self.coded_board,
+            "turn": self.turn,
+            "last_move": self.last_move,
+            "status": self.status,
+            "num_players": self.num_players,
+        }
+
+
+class LocalRoomStore(Broadcaster):
+    """
+    プロセス内で部屋を管理する。手が指されると、部屋の参加者全員へ一度の送信でまとめて届ける。
+    """
+
+    PREFIX = "t3room"
+    rooms: Dict[str, Room]
+
+    def __init__(self) -> None:
+        self.rooms = {}
+
+    async def create(self, size: int) -> Room:
+        room_id = secrets.token_hex(3)
+        while room_id in self.rooms:
+            room_id = secrets.token_hex(3)
+        room = self.rooms[room_id] = Room(room_id, size)
+        return room
+
+    async def get(self, room_id: str) -> Optional[Room]:
+        return self.rooms.get(room_id)
+
+    async def sit(self, room_id: str, token: str) -> Optional[Room]:
+        room = await self.get(room_id)
+        if room is not None:
+            room.sit(token)
+        return room
+
+    async def play(self, room_id: str, token: str, cell: int) -> Optional[Room]:
+        """
+        手を指す
+
+        Args:
+            room_id (str): 部屋のID
+            token (str): 指すクライアントのトークン
+            cell (int): 指すセル
+
+        Returns:
+            Optional[Room]: 指せたときは部屋、指せないときはNone
+        """
+        room = await self.get(room_id)
+        if room is None or not room.can_play(room.seat_of(token), cell):
+            return None
+        room.play(cell)
+        return room
+
+    async def publish(self, room_id: str, delta: dict):
+        await self.fanout(room_id, delta)
+
+    def expire(self):
+        now = time.monotonic()
+        for room_id in [room_id for room_id, room in self.rooms.items() if now - room.active_at > ROOM_TTL]:
+            del self.rooms[room_id]
+
+    async def serve(self):
+        """
+        一定間隔で古い部屋を削除する
+        """
+        while True:
+            await asyncio.sleep(EXPIRE_INTERVAL)
+            self.expire()
+
+
+class RedisRoomStore(LocalRoomStore):
+    """
+    Redisで部屋を共有し、複数のワーカーから参加できるようにする。
+    席と手の履歴をRedisに保存し、各ワーカーは手の履歴の差分のみを読み込んで盤面を復元する。
+    送信はRedisのPub/Subで全てのワーカーに配り、各ワーカーが自身に接続している参加者へまとめて送る。
+    Redisのキーは最後に席に着くか手を指してからROOM_TTLで消え、各ワーカーの部屋も同じ時間で削除する。
+    """
+
+    # 部屋のID -> 手の履歴を読み込む間のロック
+    locks: Dict[str, asyncio.Lock]
+
+    def __init__(self, redis) -> None:
+        super().__init__()
+        self.redis = redis
+        self.locks = defaultdict(asyncio.Lock)
+
+    def _key(self, room_id: str) -> str:
+        return f"{REDIS_PREFIX}:{room_id}"
+
+    async def create(self, size: int) -> Room:
+        while True:
+            room_id = secrets.token_hex(3)
+            if await self.redis.hsetnx(self._key(room_id), "size", size):
+                break
+        await self.redis.expire(self._key(room_id), ROOM_TTL)
+        room = self.rooms[room_id] = Room(room_id, size)
+        return room
+
+    async def get(self, room_id: str) -> Optional[Room]:
+        key = self._key(room_id)
+        info = await self.redis.hgetall(key)
+        if not info:
+            # 期限切れで消えた部屋は、同じIDで作り直されたときに古い盤面を使わないよう削除する
+            self.rooms.pop(room_id, None)
+            return None
+        # 同時に読み込むと同じ手を二重に反映するため、部屋ごとに順に読み込む
+        async with self.locks[room_id]:
+            room = self.rooms.get(room_id)
+            if room is None:
+                room = self.rooms[room_id] = Room(room_id, int(info[b"size"]))
+            for seat in (0, 1):
+                token = info.get(f"seat{seat}".encode())
+                room.seats[seat] = token.decode() if token is not None else None
+            if room.num_players == 2 and room.status == WAITING:
+                room.status = PLAYING
+            # まだ読み込んでいない手のみ反映する
+            for move in await self.redis.lrange(f"{key}:moves", room.turn, -1):
+                room.play(int(move))
+        return room
+
+    async def sit(self, room_id: str, token: str) -> Optional[Room]:
+        room = await self.get(room_id)
+        if room is None or room.seat_of(token) != SPECTATOR:
+            return room
+        for seat in (0, 1):
+            if await self.redis.hsetnx(self._key(room_id), f"seat{seat}", token):
+                break
+        await self.redis.expire(self._key(room_id), ROOM_TTL)
+        return await self.get(room_id)
+
+    async def play(self, room_id: str, token: str, cell: int) -> Optional[Room]:
+        from redis.exceptions import WatchError
+
+        key = self._key(room_id)
+        while True:
+            async with self.redis.pipeline() as pipe:
+                try:
+                    # 他のワーカーが同時に指した場合はやり直す
+                    await pipe.watch(f"{key}:moves")
+                    room = await self.get(room_id)
+                    if room is None or not room.can_play(room.seat_of(token), cell):
+                        return None
+                    pipe.multi()
+                    pipe.rpush(f"{key}:moves", cell)
+                    pipe.expire(key, ROOM_TTL)
+                    pipe.expire(f"{key}:moves", ROOM_TTL)
+                    await pipe.execute()
+                except WatchError:
+                    continue
+            # 指した手は他の読み込みと同じく、手の履歴から反映する
+            return await self.get(room_id)
+
+    async def publish(self, room_id: str, delta: dict):
+        await self.redis.publish(self._key(room_id), json.dumps(delta))
+
+    def expire(self):
+        super().expire()
+        for room_id in [room_id for room_id in self.locks if room_id not in self.rooms]:
+            if not self.locks[room_id].locked():
+                del self.locks[room_id]
+
+    async def serve(self):
+        """
+        全ての部屋の送信を購読し、このワーカーに接続している参加者へ送る。あわせて古い部屋を削除する
+        """
+        expiring = asyncio.create_task(super().serve())
+        pubsub = self.redis.pubsub()
+        await pubsub.psubscribe(f"{REDIS_PREFIX}:*")
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                room_id = message["channel"].decode().rsplit(":", 1)[1]
+                await self.fanout(room_id, json.loads(message["data"]))
+        finally:
+            expiring.cancel()
+            await pubsub.close()
+
+
+_store: LocalRoomStore = LocalRoomStore()
+
+
+def get_store() -> LocalRoomStore:
+    return _store
+
+
+def use_store(store: LocalRoomStore) -> LocalRoomStore:
+    """
+    部屋の管理方法を切り替える
+
+    Args:
+        store (LocalRoomStore): 部屋の管理
+
+    Returns:
+        LocalRoomStore: 切り替えた管理
+    """
+    global _store
+    _store = store
+    return store
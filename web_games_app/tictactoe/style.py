@@ -4,7 +4,14 @@ STATE_COLOR = {
     1: "blue",  # 後攻
     2: "rgba(255,102,204)",
     3: "rgba(102,204,255)",
+    4: "darkred",  # 揃った列（先攻）
+    5: "darkblue",  # 揃った列（後攻）
 }
+# 揃った列のセルの状態（石を置いたプレイヤーの番号に足す）
+WIN_STATE_OFFSET = 4
+# 盤面を1セル1文字の文字列で送るための符号
+STATE_CODE = {state: code for state, code in zip(STATE_COLOR, "-012345")}
+CODE_COLOR = {STATE_CODE[state]: color for state, color in STATE_COLOR.items()}
 
 CHANGE_TURN_TOAST = {
     "position": "top-center",
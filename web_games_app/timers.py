@@ -0,0 +1,413 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import reflex as rx
+from reflex import constants
+from reflex.state import StateUpdate
+
+# 同じ時刻付近の送信をまとめる幅（秒）。期限がこの幅に収まるタイマーは一度の起床で送る
+TIMER_RESOLUTION = 0.05
+
+
+def to_delta(seconds: int) -> dict:
+    """
+    タイマーが送る変数（TimerMixinの変数名と同じ）
+
+    Args:
+        seconds (int): 経過時間（秒）
+
+    Returns:
+        dict: 変数名 -> 値
+    """
+    return {"elapsed_time": seconds, "display_elapsed_time": str(seconds).zfill(3)}
+
+
+class GameClock:
+    """
+    ゲームの経過時間。開始（再開）した時刻と、それまでに経過した時間のみを持ち、毎秒の更新を必要としない。
+    """
+
+    # 停止するまでに経過した時間（秒）
+    base: float
+    # 動いているときに、開始（再開）した時刻
+    resumed_at: Optional[float]
+    is_started: bool
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self):
+        self.base = 0.0
+        self.resumed_at = None
+        self.is_started = False
+
+    @property
+    def is_running(self) -> bool:
+        return self.resumed_at is not None
+
+    def start(self, now: Optional[float] = None) -> bool:
+        """
+        時間を進め始める。既に動いているときは何もしない
+
+        Args:
+            now (Optional[float], optional): 現在の時刻
+
+        Returns:
+            bool: 新たに動かしたときにTrue
+        """
+        if self.is_running:
+            return False
+        self.is_started = True
+        self.resumed_at = time.time() if now is None else now
+        return True
+
+    def resume(self, now: Optional[float] = None) -> bool:
+        # 開始前のゲームは再開しない
+        return self.is_started and self.start(now)
+
+    def pause(self, now: Optional[float] = None) -> bool:
+        """
+        時間を止める
+
+        Returns:
+            bool: 動いていたときにTrue
+        """
+        if not self.is_running:
+            return False
+        self.base += (time.time() if now is None else now) - self.resumed_at
+        self.resumed_at = None
+        return True
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        if not self.is_running:
+            return self.base
+        return self.base + (time.time() if now is None else now) - self.resumed_at
+
+    def seconds(self, now: Optional[float] = None) -> int:
+        return int(self.elapsed(now))
+
+
+class Timer:
+    __slots__ = ("key", "sid", "state_name", "origin", "seconds")
+
+    def __init__(self, key: str, sid: str, state_name: str, origin: float, seconds: int) -> None:
+        self.key = key
+        self.sid = sid
+        self.state_name = state_name
+        # 経過時間が0となる時刻（TimerScheduler.clock）
+        self.origin = origin
+        # 次に送る経過時間（秒）
+        self.seconds = seconds
+
+    @property
+    def deadline(self) -> float:
+        return self.origin + self.seconds
+
+
+class TimerScheduler:
+    """
+    プロセス内の全てのゲームのタイマーを、1つのタスクと期限のヒープで動かす。
+    ゲームごとのループを持たないため、タスクの数はゲームの数によらず一定で、止めたタイマーは一度も起床しない。
+    """
+
+    # Reflexの名前空間（app.event_namespace）
+    namespace = None
+    # ゲームのキー -> 動いているタイマー
+    timers: Dict[str, Timer]
+    # (期限, 登録順, タイマー)。止めたタイマーは取り出したときに読み飛ばす
+    heap: List[Tuple[float, int, Timer]]
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Args:
+            clock (Callable[[], float], optional): 現在の時刻を返す関数。確認のために時計を差し替えられる
+        """
+        self.clock = clock
+        self.timers = {}
+        self.heap = []
+        self._counter = itertools.count()
+        self._waiter: Optional[asyncio.Future] = None
+        self._wake_at = float("inf")
+        self.num_sent = 0
+
+    def attach(self, namespace):
+        self.namespace = namespace
+
+    def start(self, key: str, sid: str, state_name: str, elapsed: float):
+        """
+        タイマーを動かす。同じキーのタイマーは置き換えるため、何度呼んでもゲームごとに1つのみとなる
+
+        Args:
+            key (str): ゲームのキー
+            sid (str): 送り先のSocket.IOのセッションID
+            state_name (str): 変数を持つ状態の完全な名前
+            elapsed (float): 現在の経過時間（秒）
+        """
+        self.stop(key)
+        timer = Timer(key, sid, state_name, self.clock() - elapsed, int(elapsed) + 1)
+        self.timers[key] = timer
+        self._push(timer)
+
+    def stop(self, key: str):
+        self.timers.pop(key, None)
+
+    def _push(self, timer: Timer):
+        heapq.heappush(self.heap, (timer.deadline, next(self._counter), timer))
+        if timer.deadline < self._wake_at:
+            # 眠っているより早い期限が加わったときは起こす
+            self._wake()
+
+    def pop_due(self, now: float) -> List[Tuple[Timer, int]]:
+        """
+        期限を過ぎたタイマーを取り出し、次の期限で入れ直す
+
+        Args:
+            now (float): 現在の時刻（clock）
+
+        Returns:
+            List[Tuple[Timer, int]]: 送るタイマーと経過時間（秒）
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= now + TIMER_RESOLUTION:
+            _, _, timer = heapq.heappop(self.heap)
+            if self.timers.get(timer.key) is timer:
+                # 起床が遅れたときは、遅れた分を飛ばして現在の経過時間を送る
+                due.append((timer, max(int(now - timer.origin), timer.seconds)))
+        for timer, seconds in due:
+            timer.seconds = seconds + 1
+            heapq.heappush(self.heap, (timer.deadline, next(self._counter), timer))
+        return due
+
+    async def fire(self, now: float):
+        for timer, seconds in self.pop_due(now):
+            if self.namespace is None or self.timers.get(timer.key) is not timer:
+                # 前のタイマーの送信を待つ間に止めたり置き換えたりしたタイマーは送らない
+                continue
+            if not self.namespace.server.manager.is_connected(timer.sid, self.namespace.namespace):
+                # 切断したクライアントのタイマーは止める（再接続するとon_loadで動かし直す）
+                self.stop(timer.key)
+                continue
+            update = StateUpdate(delta={timer.state_name: to_delta(seconds)})
+            await self.namespace.emit(str(constants.SocketEvent.EVENT), update, to=timer.sid)
+            self.num_sent += 1
+
+    async def _sleep(self, delay: Optional[float]):
+        loop = asyncio.get_running_loop()
+        self._waiter = loop.create_future()
+        self._wake_at = float("inf") if delay is None else self.clock() + delay
+        handle = None if delay is None else loop.call_later(delay, self._wake)
+        try:
+            await self._waiter
+        finally:
+            if handle is not None:
+                handle.cancel()
+            self._waiter = None
+            self._wake_at = float("inf")
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def serve(self):
+        """
+        最も早い期限まで眠り、期限を過ぎたタイマーの経過時間を送る
+        """
+        while True:
+            while self.heap and self.timers.get(self.heap[0][2].key) is not self.heap[0][2]:
+                # 止めたタイマーは期限を待たずに取り除く
+                heapq.heappop(self.heap)
+            await self._sleep(max(0.0, self.heap[0][0] - self.clock()) if self.heap else None)
+            await self.fire(self.clock())
+
+
+_scheduler = TimerScheduler()
+
+
+class TimerMixin(rx.State, mixin=True):
+    """
+    経過時間をGameClockで持つ状態。表示する経過時間は、動いている間はTimerSchedulerが毎秒クライアントに送る。
+    状態のelapsed_timeは止めたときや読み込んだときにのみ更新するため、毎秒の状態の変更は発生しない。
+    """
+
+    elapsed_time: int = 0
+    _clock: GameClock = GameClock()
+
+    def _timer_key(self) -> str:
+        return f"{self.router.session.client_token}:{self.get_full_name()}"
+
+    def _schedule_timer(self):
+        _scheduler.start(
+            self._timer_key(), self.router.session.session_id, self.get_full_name(), self._clock.elapsed()
+        )
+
+    def _start_clock(self):
+        # 連続でクリックしても、タイマーは最初の1回のみ動かす
+        if self._clock.start():
+            self._schedule_timer()
+
+    def _resume_clock(self):
+        if self._clock.resume():
+            self._schedule_timer()
+
+    def _stop_clock(self):
+        self._clock.pause()
+        _scheduler.stop(self._timer_key())
+        # 表示を止めた時点の経過時間にそろえる
+        self.elapsed_time = self._clock.seconds()
+
+    def _unschedule_timer(self):
+        # 経過時間は進めたまま、送信のみを止める（_sync_clockで送り直す）
+        _scheduler.stop(self._timer_key())
+
+    def _reset_clock(self):
+        self._clock.reset()
+        _scheduler.stop(self._timer_key())
+        self.elapsed_time = 0
+
+    def _sync_clock(self):
+        # 再読み込みや再接続のときは、現在の経過時間を表示し、新しい接続に送り直す
+        self.elapsed_time = self._clock.seconds()
+        if self._clock.is_running:
+            self._schedule_timer()
+
+    @rx.var(cache=True)
+    def display_elapsed_time(self) -> str:
+        return str(self.elapsed_time).zfill(3)
+
+
+def get_scheduler() -> TimerScheduler:
+    return _scheduler
+
+
+async def serve_timers(reflex_app: rx.App):
+    """
+    全てのゲームのタイマーを動かすライフスパンタスク
+    """
+    _scheduler.attach(reflex_app.event_namespace)
+    await _scheduler.serve()
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    from collections import defaultdict
+    from types import SimpleNamespace
+
+    parser = argparse.ArgumentParser(description="Check the timer scheduler with many simulated games")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--duration", type=int, default=5)
+    parser.add_argument(
+        "--benchmark", action="store_true", help="also compare tasks and CPU time with one loop per game in real time"
+    )
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    class FakeNamespace:
+        namespace = "/_event"
+
+        def __init__(self) -> None:
+            # 送り先 -> 送った経過時間の列
+            self.sent: Dict[str, List[int]] = defaultdict(list)
+            self.server = SimpleNamespace(manager=SimpleNamespace(is_connected=lambda sid, namespace: True))
+            # 送信するたびに送り先を渡して呼ぶ関数
+            self.on_emit = None
+
+        async def emit(self, event, data, to=None):
+            self.sent[to].append(data.delta["state"]["elapsed_time"])
+            if self.on_emit is not None:
+                self.on_emit(to)
+
+    class FakeClock:
+        def __init__(self) -> None:
+            self.now = 1000.0
+
+        def __call__(self) -> float:
+            return self.now
+
+    async def simulate():
+        # 時計を差し替えて眠らずに時刻を進め、送信を確かめる
+        clock = FakeClock()
+        namespace = FakeNamespace()
+        timers = TimerScheduler(clock)
+        timers.attach(namespace)
+        num_tasks = len(asyncio.all_tasks())
+        for i in range(args.games):
+            # 開始時刻をずらし、連続クリックのように何度も動かす
+            elapsed = rng.uniform(0, 60)
+            for _ in range(rng.randint(1, 3)):
+                timers.start(f"game{i}", f"sid{i}", "state", elapsed)
+        assert len(timers.timers) == args.games, "1つのゲームに複数のタイマーがある"
+        paused = set(rng.sample(range(args.games), args.games * 3 // 10))
+        for i in paused:
+            timers.stop(f"game{i}")
+        # 最後の1秒の最初の送信の間に止めるゲーム（同じ起床で送る予定だったタイマーを含む）
+        late = set(rng.sample(sorted(set(range(args.games)) - paused), args.games // 10))
+        first = []
+
+        def stop_late(to: str):
+            namespace.on_emit = None
+            first.append(to)
+            for i in late:
+                timers.stop(f"game{i}")
+
+        for step in range(args.duration):
+            if step == args.duration - 1:
+                namespace.on_emit = stop_late
+            clock.now += 1
+            await timers.fire(clock.now)
+        assert len(asyncio.all_tasks()) == num_tasks, "タスクの数が変化した"
+        assert not any(namespace.sent[f"sid{i}"] for i in paused), "止めたタイマーが送信した"
+        for i in set(range(args.games)) - paused:
+            ticks = namespace.sent[f"sid{i}"]
+            # 最後の1秒に止めたゲームは、止めたときの送信先でなければ最後の1回を送らない
+            expected = args.duration - 1 if i in late and first != [f"sid{i}"] else args.duration
+            assert len(ticks) == expected, f"送信の回数が違う: {ticks}"
+            assert all(b - a == 1 for a, b in zip(ticks, ticks[1:])), f"経過時間が1秒ずつ進まない: {ticks}"
+        running = args.games - len(paused)
+        print(f"simulated {args.duration} s of {args.games} games: {sum(map(len, namespace.sent.values()))} ticks")
+        print(f"paused {len(paused)} and stopped during a tick {len(late)} games sent nothing after stopping")
+        print(f"tasks {num_tasks}, timers {len(timers.timers)} for {running - len(late)} running games")
+
+    async def sample(label: str, seconds: int):
+        tasks, cpu = [], []
+        for _ in range(seconds):
+            start = time.process_time()
+            await asyncio.sleep(1)
+            cpu.append(time.process_time() - start)
+            tasks.append(len(asyncio.all_tasks()))
+        print(f"{label}: tasks {tasks}, cpu per second {', '.join(f'{c * 1000:.0f} ms' for c in cpu)}")
+
+    async def per_game_loops():
+        # 以前の実装と同様に、ゲームごとに毎秒起床するループ
+        paused = [rng.random() < 0.3 for _ in range(args.games)]
+
+        async def loop(i: int):
+            while True:
+                await asyncio.sleep(1)
+                if paused[i]:
+                    continue
+
+        loops = [asyncio.create_task(loop(i)) for i in range(args.games)]
+        await sample("per-game loops", args.duration)
+        for task in loops:
+            task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+
+    async def scheduler():
+        timers = TimerScheduler()
+        timers.attach(FakeNamespace())
+        server = asyncio.create_task(timers.serve())
+        for i in range(args.games):
+            if rng.random() >= 0.3:
+                timers.start(f"game{i}", f"sid{i}", "state", rng.uniform(0, 60))
+        await sample("scheduler", args.duration)
+        server.cancel()
+
+    asyncio.run(simulate())
+    if args.benchmark:
+        # 実時間で動かすため、結果は環境によって変わる
+        asyncio.run(per_game_loops())
+        asyncio.run(scheduler())
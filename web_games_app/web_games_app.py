@@ -2,8 +2,13 @@ from typing import List
 
 import reflex as rx
 
+from .metrics import json_endpoint, prometheus_endpoint
+from .minesweaper.pages import serve_races
+from .sessions import SessionMiddleware, reap_sessions
 from .style import APP_THEME, STYLESHEETS
 from .templates.template import template
+from .tictactoe.pages import serve_rooms
+from .timers import serve_timers
 
 
 @rx.page(route="/", title="Web Games")
@@ -32,3 +37,10 @@ def index() -> List[rx.Component]:
 
 
 app = rx.App(stylesheets=STYLESHEETS, theme=rx.theme(**APP_THEME))
+app.api.add_api_route("/metrics", prometheus_endpoint)
+app.api.add_api_route("/metrics/json", json_endpoint)
+app.add_middleware(SessionMiddleware())
+app.register_lifespan_task(reap_sessions, reflex_app=app)
+app.register_lifespan_task(serve_rooms, reflex_app=app)
+app.register_lifespan_task(serve_races, reflex_app=app)
+app.register_lifespan_task(serve_timers, reflex_app=app)